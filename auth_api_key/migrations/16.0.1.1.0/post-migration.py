@@ -0,0 +1,15 @@
+# Copyright 2018 ACSONE SA/NV
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+from psycopg2.sql import SQL, Identifier
+
+from odoo.tools import sql
+
+
+def migrate(cr, version):
+    """Erase the clear text keys, hashed by the pre-migration."""
+    for column in ("key_env_default", "key"):
+        if sql.column_exists(cr, "auth_api_key", column):
+            cr.execute(
+                SQL("UPDATE auth_api_key SET {} = NULL").format(Identifier(column))
+            )
@@ -0,0 +1,53 @@
+# Copyright 2018 ACSONE SA/NV
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import logging
+
+from psycopg2.sql import SQL, Identifier
+
+from odoo.tools import sql
+
+from odoo.addons.auth_api_key.models.auth_api_key import (
+    get_api_key_prefix,
+    hash_api_key,
+)
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    """Hash the api keys stored in clear text.
+
+    With auth_api_key_server_env, the keys of the database are stored in
+    the key_env_default column.
+    """
+    key_columns = [
+        column
+        for column in ("key_env_default", "key")
+        if sql.column_exists(cr, "auth_api_key", column)
+    ]
+    if not key_columns:
+        return
+    for column in ("key_hash", "key_prefix"):
+        if not sql.column_exists(cr, "auth_api_key", column):
+            sql.create_column(cr, "auth_api_key", column, "varchar")
+    cr.execute(
+        SQL("SELECT id, COALESCE({}) FROM auth_api_key ORDER BY id").format(
+            SQL(", ").join(Identifier(column) for column in key_columns)
+        )
+    )
+    hashed = set()
+    for api_key_id, key in cr.fetchall():
+        if not key:
+            continue
+        key_hash = hash_api_key(key)
+        if key_hash in hashed:
+            # the key of a previous record, this one could never be used
+            _logger.warning("Api key %s is a duplicate, it is disabled", api_key_id)
+            continue
+        hashed.add(key_hash)
+        cr.execute(
+            "UPDATE auth_api_key SET key_hash = %s, key_prefix = %s WHERE id = %s",
+            (key_hash, get_api_key_prefix(key) or None, api_key_id),
+        )
+    _logger.info("%s api keys hashed", len(hashed))
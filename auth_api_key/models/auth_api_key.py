@@ -1,9 +1,60 @@
 # Copyright 2018 ACSONE SA/NV
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
 
-from odoo import _, api, fields, models, tools
+import atexit
+import hashlib
+import hmac
+import logging
+
+import psycopg2
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+
+import odoo
+from odoo import SUPERUSER_ID, _, api, fields, models, tools
 from odoo.exceptions import AccessError, ValidationError
-from odoo.tools import consteq
+from odoo.tools import config
+
+from ..rate_limit import get_rate_limiter
+from ..rejection import RejectedKeys
+from ..usage import get_usage_accumulator
+
+_logger = logging.getLogger(__name__)
+
+# databases whose usages are flushed when the worker exits
+_flushed_at_exit = set()
+
+KEY_PREFIX_LENGTH = 4
+# keys shorter than this are not long enough to disclose their prefix
+KEY_PREFIX_MIN_KEY_LENGTH = 16
+
+
+def hash_api_key(key):
+    """Return the hexadecimal digest under which key is stored.
+
+    The digest is an HMAC-SHA256 keyed with the ``auth_api_key_pepper``
+    option of the configuration file, or a plain SHA-256 without pepper.
+    Changing the pepper invalidates all the keys stored in the database.
+    """
+    pepper = config.get("auth_api_key_pepper")
+    if pepper:
+        return hmac.new(pepper.encode(), key.encode(), hashlib.sha256).hexdigest()
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def _flush_usage_at_exit(dbname):
+    try:
+        with odoo.registry(dbname).cursor() as cr:
+            api.Environment(cr, SUPERUSER_ID, {})["auth.api.key"]._flush_usage()
+    except Exception:
+        _logger.exception("Could not flush the api key usages of %s", dbname)
+
+
+def get_api_key_prefix(key):
+    """Return the non-secret prefix displayed to identify key, if any."""
+    if len(key) < KEY_PREFIX_MIN_KEY_LENGTH:
+        return False
+    return key[:KEY_PREFIX_LENGTH]
 
 
 class AuthApiKey(models.Model):
@@ -12,9 +63,17 @@ class AuthApiKey(models.Model):
 
     name = fields.Char(required=True)
     key = fields.Char(
-        required=True,
-        help="""The API key. Enter a dummy value in this field if it is
-        obtained from the server environment configuration.""",
+        compute="_compute_key",
+        readonly=False,
+        help="""The API key. It is only stored as a hash and can not be
+        displayed once saved. Leave this field empty if the key is obtained
+        from the server environment configuration.""",
+    )
+    key_hash = fields.Char(readonly=True, copy=False)
+    key_prefix = fields.Char(
+        readonly=True,
+        copy=False,
+        help="The first characters of the API key, to identify it.",
     )
     user_id = fields.Many2one(
         comodel_name="res.users",
@@ -23,8 +82,57 @@ class AuthApiKey(models.Model):
         help="""The user used to process the requests authenticated by
         the api key""",
     )
+    rate_limit = fields.Float(
+        help="""The maximum number of requests per second, in each worker
+        process. 0 means no limit.""",
+    )
+    daily_quota = fields.Integer(
+        help="The maximum number of requests per day (UTC). 0 means no limit.",
+    )
+    quota_date = fields.Date(readonly=True, copy=False)
+    quota_usage = fields.Integer(
+        readonly=True,
+        copy=False,
+        help="""The number of requests of the quota date counted against the
+        daily quota. It is updated every few seconds.""",
+    )
+    last_used = fields.Datetime(
+        readonly=True,
+        copy=False,
+        help="The time of the last request. It is updated every minute.",
+    )
+    usage_count = fields.Integer(
+        readonly=True,
+        copy=False,
+        help="The number of requests. It is updated every minute.",
+    )
+    last_ip = fields.Char(
+        string="Last IP Address",
+        readonly=True,
+        copy=False,
+        help="The source address of the last request.",
+    )
+
+    _sql_constraints = [
+        ("name_uniq", "unique(name)", "Api Key name must be unique."),
+        ("key_hash_uniq", "unique(key_hash)", "Api Key must be unique."),
+    ]
 
-    _sql_constraints = [("name_uniq", "unique(name)", "Api Key name must be unique.")]
+    def _compute_key(self):
+        # the key is not stored, only its hash
+        for api_key in self:
+            api_key.key = False
+
+    @api.model
+    def _prepare_key_values(self, vals):
+        """Replace the clear key of vals by its hash and prefix."""
+        vals = dict(vals)
+        key = vals.pop("key", None)
+        if key:
+            vals.update(key_hash=hash_api_key(key), key_prefix=get_api_key_prefix(key))
+        elif key is not None:
+            vals.update(key_hash=False, key_prefix=False)
+        return vals
 
     @api.model
     def _retrieve_api_key(self, key):
@@ -35,29 +143,244 @@ class AuthApiKey(models.Model):
     def _retrieve_api_key_id(self, key):
         if not self.env.user.has_group("base.group_system"):
             raise AccessError(_("User is not allowed"))
-        for api_key in self.search([]):
-            if api_key.key and consteq(key, api_key.key):
-                return api_key.id
-        raise ValidationError(_("The key %s is not allowed") % key)
+        rejected_keys = self._get_rejected_keys()
+        key_hash = hash_api_key(key)
+        api_key_id = None
+        if key_hash not in rejected_keys:
+            api_key_id = self._lookup_api_key_id(key)
+            if not api_key_id:
+                rejected_keys.add(key_hash)
+        if not api_key_id:
+            raise ValidationError(_("The key %s is not allowed") % key)
+        return api_key_id
+
+    @api.model
+    @tools.ormcache()
+    def _get_rejected_keys(self):
+        """Return the digests of the keys rejected recently.
+
+        The set lives in the ormcache, so that it is dropped in all the
+        workers when api keys are created or modified.
+        """
+        return RejectedKeys()
+
+    @api.model
+    def _lookup_api_key_id(self, key):
+        """Return the id of the api key record of key, or None.
+
+        The lookup is a single query on the unique index of the hashes.
+        """
+        self.flush_model(["key_hash"])
+        self.env.cr.execute(
+            "SELECT id FROM auth_api_key WHERE key_hash = %s", (hash_api_key(key),)
+        )
+        row = self.env.cr.fetchone()
+        return row[0] if row else None
 
     @api.model
-    @tools.ormcache("key")
     def _retrieve_uid_from_api_key(self, key):
-        return self._retrieve_api_key(key).user_id.id
+        return self._retrieve_api_key_id_and_uid(key)[1]
+
+    @api.model
+    def _retrieve_api_key_id_and_uid(self, key):
+        """Return the (id, user id) of the api key record of key, without
+        reading the record."""
+        if not self.env.user.has_group("base.group_system"):
+            raise AccessError(_("User is not allowed"))
+        return self._get_api_key_id_and_uid(key)
+
+    @api.model
+    @tools.ormcache("key")
+    def _get_api_key_id_and_uid(self, key):
+        api_key_id = self._retrieve_api_key_id(key)
+        self._get_accepted_keys().add(hash_api_key(key))
+        return api_key_id, self.browse(api_key_id).user_id.id
+
+    @api.model
+    @tools.ormcache()
+    def _get_accepted_keys(self):
+        """Return the digests of the keys accepted since the key caches were
+        cleared.
+
+        The set lives in the ormcache, so that it is dropped in all the
+        workers when api keys are created or modified.
+        """
+        return set()
+
+    @api.model
+    def _is_accepted_api_key(self, key):
+        """Return whether key was accepted recently, without querying the
+        database."""
+        return hash_api_key(key) in self._get_accepted_keys()
+
+    @api.model
+    @tools.ormcache("api_key_id")
+    def _get_rate_limits(self, api_key_id):
+        """Return the limits of the requests of api key api_key_id, as a tuple
+        of (model, id, requests per second, daily quota)."""
+        return tuple(self.browse(api_key_id)._prepare_rate_limits())
+
+    def _prepare_rate_limits(self):
+        self.ensure_one()
+        limits = []
+        if self.rate_limit or self.daily_quota:
+            limits.append((self._name, self.id, self.rate_limit, self.daily_quota))
+        return limits
+
+    @api.model
+    def _check_rate_limits(self, api_key_id):
+        """Count a request of api key api_key_id against its limits.
+
+        Return 0 if the request is allowed, otherwise the seconds to wait
+        before retrying.
+        """
+        limits = self._get_rate_limits(api_key_id)
+        if not limits:
+            return 0
+        limiter = get_rate_limiter(self.env.cr.dbname)
+        wait_time = limiter.hit(limits)
+        if limiter.is_flush_due():
+            self._flush_quota_usage()
+        return wait_time
+
+    @api.model
+    def _flush_with_separate_cursor(self, flush, description):
+        """Call flush(cr) with a separate cursor, so that the usages it writes
+        are committed even if the request fails, and no lock is held on the
+        api keys until the end of the request.
+
+        Return False when the database errored, after logging it.
+        """
+        try:
+            with self.env.registry.cursor() as cr:
+                flush(cr)
+        except psycopg2.Error as e:
+            _logger.warning("Could not write back the %s: %s", description, e)
+            return False
+        return True
+
+    @api.model
+    def _flush_quota_usage(self):
+        """Write back the daily usages counted by the worker, and read the
+        usages counted by all the workers."""
+        limiter = get_rate_limiter(self.env.cr.dbname)
+        pending = limiter.pop_pending()
+        usages = []
+
+        def flush(cr):
+            for (model, res_id), (day, requests) in pending.items():
+                cr.execute(
+                    sql.SQL(
+                        """
+                        UPDATE {}
+                        SET quota_usage = CASE
+                            WHEN quota_date = %(day)s
+                            THEN quota_usage + %(requests)s
+                            ELSE %(requests)s END,
+                        quota_date = %(day)s
+                        WHERE id = %(id)s
+                        AND (quota_date IS NULL OR quota_date <= %(day)s)
+                        """
+                    ).format(sql.Identifier(self.env[model]._table)),
+                    {"day": day, "requests": requests, "id": res_id},
+                )
+            for model, ids in limiter.get_quota_ids().items():
+                cr.execute(
+                    sql.SQL(
+                        "SELECT id, quota_date, quota_usage FROM {} "
+                        "WHERE id IN %s AND quota_date IS NOT NULL"
+                    ).format(sql.Identifier(self.env[model]._table)),
+                    (tuple(ids),),
+                )
+                usages.extend((model, row) for row in cr.fetchall())
+
+        if not self._flush_with_separate_cursor(flush, "api key quota usages"):
+            limiter.restore_pending(pending)
+            return
+        for model, (res_id, day, used) in usages:
+            limiter.set_used((model, res_id), day, used or 0)
+
+    @api.model
+    def _track_usage(self, api_key_id, address):
+        """Count a request of api key api_key_id from address.
+
+        Usages are accumulated in the memory of the worker, and written to
+        the database in bulk every minute and when the worker exits.
+        """
+        dbname = self.env.cr.dbname
+        accumulator = get_usage_accumulator(dbname)
+        if dbname not in _flushed_at_exit:
+            _flushed_at_exit.add(dbname)
+            atexit.register(_flush_usage_at_exit, dbname)
+        accumulator.record(api_key_id, fields.Datetime.now(), address)
+        if accumulator.is_flush_due():
+            self._flush_usage()
+
+    @api.model
+    def _flush_usage(self):
+        """Write the accumulated usages with a single query."""
+        accumulator = get_usage_accumulator(self.env.cr.dbname)
+        usages = accumulator.pop()
+        if not usages:
+            return
+
+        def flush(cr):
+            execute_values(
+                cr._obj,
+                """
+                UPDATE auth_api_key AS api_key
+                SET usage_count = COALESCE(api_key.usage_count, 0) + usage.requests,
+                    last_used = GREATEST(api_key.last_used, usage.last_used),
+                    last_ip = usage.last_ip
+                FROM (VALUES %s) AS usage(id, requests, last_used, last_ip)
+                WHERE api_key.id = usage.id
+                """,
+                [
+                    (api_key_id, requests, when, address)
+                    for api_key_id, (requests, when, address) in usages.items()
+                ],
+            )
+
+        if not self._flush_with_separate_cursor(flush, "api key usages"):
+            accumulator.restore(usages)
+
+    def _has_key(self):
+        """Return whether the api key can authenticate requests."""
+        self.ensure_one()
+        return bool(self.key_hash)
+
+    @api.constrains("key_hash")
+    def _check_key(self):
+        for api_key in self:
+            if not api_key._has_key():
+                raise ValidationError(_("The api key %s has no key.") % api_key.name)
+
+    @api.model
+    def _get_key_cache_fields(self):
+        """Return the fields whose modification must clear the key caches."""
+        return {"key_hash", "user_id", "rate_limit", "daily_quota"}
 
     def _clear_key_cache(self):
         self._retrieve_api_key_id.clear_cache(self.env[self._name])
-        self._retrieve_uid_from_api_key.clear_cache(self.env[self._name])
+        self._get_api_key_id_and_uid.clear_cache(self.env[self._name])
+        self._get_rejected_keys.clear_cache(self.env[self._name])
+        self._get_accepted_keys.clear_cache(self.env[self._name])
+        self._get_rate_limits.clear_cache(self.env[self._name])
 
     @api.model_create_multi
     def create(self, vals_list):
+        vals_list = [self._prepare_key_values(vals) for vals in vals_list]
         records = super(AuthApiKey, self).create(vals_list)
-        if any(["key" in vals or "user_id" in vals for vals in vals_list]):
+        cache_fields = self._get_key_cache_fields()
+        if any(cache_fields.intersection(vals) for vals in vals_list):
             self._clear_key_cache()
+        # the key is not a required field, as it is not stored
+        records._check_key()
         return records
 
     def write(self, vals):
+        vals = self._prepare_key_values(vals)
         super(AuthApiKey, self).write(vals)
-        if "key" in vals or "user_id" in vals:
+        if self._get_key_cache_fields().intersection(vals):
             self._clear_key_cache()
         return True
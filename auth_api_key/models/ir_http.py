@@ -4,33 +4,65 @@
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
 
 import logging
+import math
 
-from odoo import models
-from odoo.exceptions import AccessDenied
+from werkzeug.exceptions import TooManyRequests
+
+from odoo import SUPERUSER_ID, models
+from odoo.exceptions import AccessDenied, ValidationError
 from odoo.http import request
 
+from ..rejection import get_failure_counter
+
 _logger = logging.getLogger(__name__)
 
 
 class IrHttp(models.AbstractModel):
     _inherit = "ir.http"
 
+    @classmethod
+    def _reject_blocked_address(cls, remote_addr, wait_time):
+        _logger.warning("Too many wrong HTTP_API_KEY from %s", remote_addr)
+        raise TooManyRequests(retry_after=math.ceil(wait_time))
+
+    @classmethod
+    def _record_api_key_failure(cls, remote_addr):
+        """Count a failed authentication from remote_addr, and answer 429
+        once the address failed too many times."""
+        failure_counter = get_failure_counter(request.db)
+        failure_counter.record_failure(remote_addr)
+        wait_time = failure_counter.get_wait_time(remote_addr)
+        if wait_time:
+            cls._reject_blocked_address(remote_addr, wait_time)
+
     @classmethod
     def _auth_method_api_key(cls):
         headers = request.httprequest.environ
         api_key = headers.get("HTTP_API_KEY")
+        remote_addr = request.httprequest.remote_addr
+        wait_time = get_failure_counter(request.db).get_wait_time(remote_addr)
         if api_key:
-            request.update_env(user=1)
-            auth_api_key = request.env["auth.api.key"]._retrieve_api_key(api_key)
-            if auth_api_key:
-                # reset _env on the request since we change the uid...
-                # the next call to env will instantiate an new
-                # odoo.api.Environment with the user defined on the
-                # auth.api_key
-                request._env = None
-                request.update_env(user=auth_api_key.user_id.id)
-                request.auth_api_key = api_key
-                request.auth_api_key_id = auth_api_key.id
-                return True
+            AuthApiKey = request.env(user=SUPERUSER_ID)["auth.api.key"]
+            # A blocked address, which may be shared (NAT), is only allowed
+            # the keys accepted recently, without querying the database.
+            if wait_time and not AuthApiKey._is_accepted_api_key(api_key):
+                cls._reject_blocked_address(remote_addr, wait_time)
+            try:
+                api_key_id, uid = AuthApiKey._retrieve_api_key_id_and_uid(api_key)
+            except ValidationError:
+                cls._record_api_key_failure(remote_addr)
+                raise
+            wait_time = AuthApiKey._check_rate_limits(api_key_id)
+            if wait_time:
+                _logger.info("Api key %s exceeded its limits", api_key_id)
+                raise TooManyRequests(retry_after=math.ceil(wait_time))
+            AuthApiKey._track_usage(api_key_id, remote_addr)
+            request.update_env(user=uid)
+            request.auth_api_key = api_key
+            request.auth_api_key_id = api_key_id
+            return True
+        if wait_time:
+            cls._reject_blocked_address(remote_addr, wait_time)
+        cls._record_api_key_failure(remote_addr)
         _logger.error("Wrong HTTP_API_KEY, access denied")
         raise AccessDenied()
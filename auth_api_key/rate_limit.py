@@ -0,0 +1,182 @@
+# Copyright 2018 ACSONE SA/NV
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+"""Rate limits and daily quotas of the api keys.
+
+Limits apply to records (api keys, or their groups), identified by a
+(model, id) tuple. The token buckets of the rates live in the memory of
+each worker, so rates are enforced per worker process. Daily usages are
+counted in memory too, and written back to the database every
+``FLUSH_INTERVAL`` seconds, so that quotas are shared by all the workers
+without any SQL write per request.
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta
+
+FLUSH_INTERVAL = 10
+ONE_DAY = timedelta(days=1)
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+class TokenBucket:
+    """A bucket of capacity tokens, refilled with rate tokens per second."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated_at")
+
+    def __init__(self, rate, now, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self.tokens = self.capacity
+        self.updated_at = now
+
+    def refill(self, now):
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+
+    def get_wait_time(self):
+        """Return the seconds to wait until a token is available."""
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class DailyQuota:
+    """Requests counted for a day: used is the usage known from the database,
+    pending the requests not written back yet."""
+
+    __slots__ = ("limit", "day", "used", "pending")
+
+    def __init__(self, limit, day):
+        self.limit = limit
+        self.day = day
+        self.used = 0
+        self.pending = 0
+
+    def roll(self, day):
+        if day != self.day:
+            self.day = day
+            self.used = self.pending = 0
+
+    def is_exhausted(self):
+        return self.used + self.pending >= self.limit
+
+
+class RateLimiter:
+    """Token buckets and daily quotas of the records of a database."""
+
+    def __init__(self):
+        self._buckets = {}
+        self._quotas = {}
+        self._lock = threading.Lock()
+        self.flush_at = 0
+
+    def hit(self, limits, now=None, utcnow=None):
+        """Count a request against limits, an iterable of
+        (model, id, requests per second, daily quota) where 0 means no limit.
+
+        Return 0 when the request is allowed, otherwise the seconds to wait
+        before retrying, and do not count the request.
+        """
+        now = now or time.monotonic()
+        utcnow = utcnow or datetime.utcnow()
+        day = utcnow.date()
+        buckets = []
+        quotas = []
+        wait_time = 0
+        with self._lock:
+            for model, res_id, rate, daily_quota in limits:
+                key = (model, res_id)
+                if rate:
+                    bucket = self._buckets.get(key)
+                    if bucket is None or bucket.rate != rate:
+                        bucket = self._buckets[key] = TokenBucket(rate, now)
+                    bucket.refill(now)
+                    wait_time = max(wait_time, bucket.get_wait_time())
+                    buckets.append(bucket)
+                if daily_quota:
+                    quota = self._quotas.get(key)
+                    if quota is None:
+                        quota = self._quotas[key] = DailyQuota(daily_quota, day)
+                        # load the usage of the other workers
+                        self.flush_at = 0
+                    quota.limit = daily_quota
+                    quota.roll(day)
+                    if quota.is_exhausted():
+                        tomorrow = datetime(day.year, day.month, day.day) + ONE_DAY
+                        wait_time = max(wait_time, (tomorrow - utcnow).total_seconds())
+                    quotas.append(quota)
+            if wait_time:
+                return wait_time
+            for bucket in buckets:
+                bucket.tokens -= 1
+            for quota in quotas:
+                quota.pending += 1
+        return 0
+
+    def is_flush_due(self, now=None):
+        return bool(self._quotas) and (now or time.monotonic()) >= self.flush_at
+
+    def pop_pending(self, now=None):
+        """Return the pending usages to write back, as a dict
+        {(model, id): (day, requests)}, and schedule the next flush."""
+        with self._lock:
+            self.flush_at = (now or time.monotonic()) + FLUSH_INTERVAL
+            pending = {}
+            for key, quota in self._quotas.items():
+                if quota.pending:
+                    pending[key] = (quota.day, quota.pending)
+                    quota.used += quota.pending
+                    quota.pending = 0
+            return pending
+
+    def restore_pending(self, pending):
+        """Count again the usages that could not be written back."""
+        with self._lock:
+            for key, (day, requests) in pending.items():
+                quota = self._quotas.get(key)
+                if quota is not None and quota.day == day:
+                    quota.used -= requests
+                    quota.pending += requests
+
+    def get_quota_ids(self):
+        """Return {model: ids} of the records with a daily quota."""
+        quota_ids = {}
+        with self._lock:
+            for model, res_id in self._quotas:
+                quota_ids.setdefault(model, []).append(res_id)
+        return quota_ids
+
+    def set_used(self, key, day, used):
+        """Set the usage written in the database for the record key."""
+        with self._lock:
+            quota = self._quotas.get(key)
+            if quota is None:
+                return
+            if quota.day == day:
+                quota.used = used
+            elif quota.day < day:
+                # the database is ahead, another worker saw the new day
+                quota.day = day
+                quota.used = used
+                quota.pending = 0
+
+    def reset(self):
+        with self._lock:
+            self._buckets = {}
+            self._quotas = {}
+            self.flush_at = 0
+
+
+def get_rate_limiter(dbname):
+    """Return the worker wide rate limiter of database dbname."""
+    with _limiters_lock:
+        limiter = _limiters.get(dbname)
+        if limiter is None:
+            limiter = _limiters[dbname] = RateLimiter()
+        return limiter
@@ -0,0 +1,111 @@
+# Copyright 2018 ACSONE SA/NV
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import threading
+import time
+from collections import OrderedDict
+
+# rejected key digests
+REJECTED_KEYS_SIZE = 10000
+REJECTED_KEYS_TTL = 60
+# failed authentications per source address
+MAX_FAILURES = 20
+FAILURE_WINDOW = 60
+
+_counters = {}
+_counters_lock = threading.Lock()
+
+
+class RejectedKeys:
+    """Bounded set of the digests of rejected api keys, with a time to live.
+
+    When full, the oldest digests are evicted first.
+    """
+
+    def __init__(self, size=REJECTED_KEYS_SIZE, ttl=REJECTED_KEYS_TTL):
+        self.size = size
+        self.ttl = ttl
+        self._expirations = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._expirations)
+
+    def __contains__(self, digest):
+        expiration = self._expirations.get(digest)
+        if expiration is None:
+            return False
+        if expiration < time.monotonic():
+            self.discard(digest)
+            return False
+        return True
+
+    def add(self, digest):
+        with self._lock:
+            self._expirations.pop(digest, None)
+            self._expirations[digest] = time.monotonic() + self.ttl
+            while len(self._expirations) > self.size:
+                self._expirations.popitem(last=False)
+
+    def discard(self, digest):
+        with self._lock:
+            self._expirations.pop(digest, None)
+
+
+class FailureCounter:
+    """Count the failed authentications of each source address over fixed
+    windows of time, to reject the addresses with too many failures without
+    querying the database.
+    """
+
+    def __init__(self, max_failures=MAX_FAILURES, window=FAILURE_WINDOW):
+        self.max_failures = max_failures
+        self.window = window
+        # address: (window end, failures)
+        self._failures = {}
+        self._prune_at = 0
+        self._lock = threading.Lock()
+
+    def is_blocked(self, address):
+        failures = self._failures.get(address)
+        return (
+            failures is not None
+            and failures[1] >= self.max_failures
+            and failures[0] > time.monotonic()
+        )
+
+    def get_wait_time(self, address):
+        """Return the number of seconds address remains blocked, or 0."""
+        if not self.is_blocked(address):
+            return 0
+        return max(self._failures[address][0] - time.monotonic(), 0)
+
+    def record_failure(self, address):
+        now = time.monotonic()
+        with self._lock:
+            if self._prune_at <= now:
+                # drop the addresses of the elapsed windows
+                self._failures = {
+                    address: failures
+                    for address, failures in self._failures.items()
+                    if failures[0] > now
+                }
+                self._prune_at = now + self.window
+            window_end, count = self._failures.get(address, (0, 0))
+            if window_end <= now:
+                window_end, count = now + self.window, 0
+            self._failures[address] = (window_end, count + 1)
+
+    def reset(self):
+        with self._lock:
+            self._failures = {}
+            self._prune_at = 0
+
+
+def get_failure_counter(dbname):
+    """Return the worker wide failure counter of database dbname."""
+    with _counters_lock:
+        counter = _counters.get(dbname)
+        if counter is None:
+            counter = _counters[dbname] = FailureCounter()
+        return counter
@@ -1 +1,2 @@
 from . import test_auth_api_key
+from . import test_benchmark
@@ -1,7 +1,21 @@
 # Copyright 2018 ACSONE SA/NV
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+import contextlib
+from datetime import datetime
+from unittest.mock import Mock
+
+from psycopg2 import IntegrityError
+from werkzeug.exceptions import TooManyRequests
+
+import odoo.http
 from odoo.exceptions import AccessError, ValidationError
 from odoo.tests.common import TransactionCase
+from odoo.tools import mute_logger
+
+from ..models.auth_api_key import hash_api_key
+from ..rate_limit import RateLimiter, get_rate_limiter
+from ..rejection import FailureCounter, RejectedKeys, get_failure_counter
+from ..usage import get_usage_accumulator
 
 
 class TestAuthApiKey(TransactionCase):
@@ -43,3 +57,181 @@ class TestAuthApiKey(TransactionCase):
         )
         with self.assertRaises(ValidationError):
             self.env["auth.api.key"]._retrieve_uid_from_api_key("api_key")
+
+    def test_key_hashed(self):
+        self.assertFalse(self.api_key_good.key)
+        self.assertEqual(self.api_key_good.key_hash, hash_api_key("api_key"))
+        self.assertNotEqual(self.api_key_good.key_hash, "api_key")
+        # short keys have no prefix
+        self.assertFalse(self.api_key_good.key_prefix)
+        api_key = self.AuthApiKey.create(
+            {
+                "name": "long",
+                "user_id": self.demo_user.id,
+                "key": "abcd0123456789abcdef",
+            }
+        )
+        self.assertEqual(api_key.key_prefix, "abcd")
+        self.assertEqual(
+            self.AuthApiKey._retrieve_api_key("abcd0123456789abcdef"), api_key
+        )
+
+    def test_key_required(self):
+        with self.assertRaises(ValidationError):
+            self.AuthApiKey.create({"name": "no key", "user_id": self.demo_user.id})
+        with self.assertRaises(ValidationError):
+            self.api_key_good.write({"key": False})
+
+    def test_key_unique(self):
+        with self.assertRaises(IntegrityError), mute_logger(
+            "odoo.sql_db"
+        ), self.env.cr.savepoint():
+            self.AuthApiKey.create(
+                {"name": "duplicate", "user_id": self.demo_user.id, "key": "api_key"}
+            )
+
+    def test_rejected_key_cached(self):
+        with self.assertRaises(ValidationError):
+            self.AuthApiKey._retrieve_uid_from_api_key("api_wrong_key")
+        self.assertIn(
+            hash_api_key("api_wrong_key"), self.AuthApiKey._get_rejected_keys()
+        )
+        # rejected again without querying the database
+        with self.assertRaises(ValidationError), self.assertQueryCount(0):
+            self.AuthApiKey._retrieve_uid_from_api_key("api_wrong_key")
+        # creating the key invalidates the rejection
+        self.AuthApiKey.create(
+            {"name": "new", "user_id": self.demo_user.id, "key": "api_wrong_key"}
+        )
+        self.assertEqual(
+            self.AuthApiKey._retrieve_uid_from_api_key("api_wrong_key"),
+            self.demo_user.id,
+        )
+
+    def test_rejected_keys_bounded(self):
+        rejected_keys = RejectedKeys(size=2, ttl=60)
+        for digest in ("a", "b", "c"):
+            rejected_keys.add(digest)
+        self.assertEqual(len(rejected_keys), 2)
+        self.assertNotIn("a", rejected_keys)
+        self.assertIn("c", rejected_keys)
+        rejected_keys = RejectedKeys(size=2, ttl=-1)
+        rejected_keys.add("a")
+        self.assertNotIn("a", rejected_keys)
+        self.assertEqual(len(rejected_keys), 0)
+
+    def test_failure_counter(self):
+        failure_counter = FailureCounter(max_failures=2, window=60)
+        failure_counter.record_failure("10.0.0.1")
+        self.assertFalse(failure_counter.is_blocked("10.0.0.1"))
+        failure_counter.record_failure("10.0.0.1")
+        self.assertTrue(failure_counter.is_blocked("10.0.0.1"))
+        self.assertFalse(failure_counter.is_blocked("10.0.0.2"))
+        failure_counter.reset()
+        self.assertFalse(failure_counter.is_blocked("10.0.0.1"))
+
+    @contextlib.contextmanager
+    def _mock_request(self, api_key, remote_addr="10.0.0.1"):
+        request = Mock(
+            db=self.env.cr.dbname,
+            httprequest=Mock(
+                environ={"HTTP_API_KEY": api_key}, remote_addr=remote_addr
+            ),
+            env=self.env,
+        )
+        odoo.http._request_stack.push(request)
+        try:
+            yield request
+        finally:
+            odoo.http._request_stack.pop()
+
+    def test_auth_method_blocked_address(self):
+        failure_counter = get_failure_counter(self.env.cr.dbname)
+        failure_counter.reset()
+        self.addCleanup(failure_counter.reset)
+        self.addCleanup(get_usage_accumulator(self.env.cr.dbname).pop)
+        IrHttp = self.env["ir.http"]
+        with self._mock_request("api_key"):
+            self.assertTrue(IrHttp._auth_method_api_key())
+        for _i in range(failure_counter.max_failures - 1):
+            with self._mock_request("api_wrong_key"):
+                with self.assertRaises(ValidationError):
+                    IrHttp._auth_method_api_key()
+        with self._mock_request("api_wrong_key"):
+            with self.assertRaises(TooManyRequests) as error:
+                IrHttp._auth_method_api_key()
+        self.assertTrue(error.exception.retry_after)
+        # new keys from the blocked address are rejected without a lookup
+        with self._mock_request("api_other_key"), self.assertQueryCount(0):
+            with self.assertRaises(TooManyRequests):
+                IrHttp._auth_method_api_key()
+        # keys accepted recently are still accepted from the blocked address
+        with self._mock_request("api_key") as request:
+            self.assertTrue(IrHttp._auth_method_api_key())
+        request.update_env.assert_called_once_with(user=self.demo_user.id)
+        self.assertEqual(request.auth_api_key_id, self.api_key_good.id)
+
+    def test_rate_limiter(self):
+        limiter = RateLimiter()
+        utcnow = datetime(2024, 1, 1, 23, 59, 0)
+        limits = [("auth.api.key", 1, 2, 0)]
+        # a burst of 2 requests then 2 requests per second
+        self.assertEqual(limiter.hit(limits, now=100, utcnow=utcnow), 0)
+        self.assertEqual(limiter.hit(limits, now=100, utcnow=utcnow), 0)
+        self.assertAlmostEqual(limiter.hit(limits, now=100, utcnow=utcnow), 0.5)
+        self.assertEqual(limiter.hit(limits, now=100.5, utcnow=utcnow), 0)
+        # daily quota, exhausted until midnight
+        limits = [("auth.api.key", 2, 0, 2)]
+        self.assertEqual(limiter.hit(limits, now=100, utcnow=utcnow), 0)
+        self.assertEqual(limiter.hit(limits, now=100, utcnow=utcnow), 0)
+        self.assertEqual(limiter.hit(limits, now=100, utcnow=utcnow), 60)
+        utcnow = datetime(2024, 1, 2, 0, 0, 1)
+        self.assertEqual(limiter.hit(limits, now=100, utcnow=utcnow), 0)
+        self.assertEqual(
+            limiter.pop_pending(), {("auth.api.key", 2): (utcnow.date(), 1)}
+        )
+        # a rejected request is not counted by the other limits
+        limits = [("auth.api.key", 3, 1, 0), ("auth.api.key", 4, 0, 2)]
+        self.assertEqual(limiter.hit(limits, now=100, utcnow=utcnow), 0)
+        self.assertEqual(limiter.hit(limits, now=100, utcnow=utcnow), 1)
+        self.assertEqual(
+            limiter.pop_pending(), {("auth.api.key", 4): (utcnow.date(), 1)}
+        )
+
+    def _enter_registry_test_mode(self):
+        # the usages are written with a separate cursor, which must see the
+        # records of the test transaction
+        self.registry.enter_test_mode(self.env.cr)
+        self.addCleanup(self.registry.leave_test_mode)
+
+    def test_daily_quota(self):
+        self._enter_registry_test_mode()
+        limiter = get_rate_limiter(self.env.cr.dbname)
+        limiter.reset()
+        self.addCleanup(limiter.reset)
+        self.api_key_good.daily_quota = 2
+        api_key_id = self.api_key_good.id
+        self.assertEqual(self.AuthApiKey._check_rate_limits(api_key_id), 0)
+        self.assertEqual(self.AuthApiKey._check_rate_limits(api_key_id), 0)
+        self.assertTrue(self.AuthApiKey._check_rate_limits(api_key_id))
+        self.AuthApiKey._flush_quota_usage()
+        self.api_key_good.invalidate_recordset()
+        self.assertEqual(self.api_key_good.quota_usage, 2)
+        self.assertEqual(self.api_key_good.quota_date, datetime.utcnow().date())
+
+    def test_usage_tracking(self):
+        self._enter_registry_test_mode()
+        accumulator = get_usage_accumulator(self.env.cr.dbname)
+        accumulator.pop()
+        self.addCleanup(accumulator.pop)
+        api_key_id = self.api_key_good.id
+        self.AuthApiKey._track_usage(api_key_id, "10.0.0.1")
+        self.AuthApiKey._track_usage(api_key_id, "10.0.0.2")
+        self.assertEqual(len(accumulator), 1)
+        self.assertFalse(self.api_key_good.usage_count)
+        self.AuthApiKey._flush_usage()
+        self.assertEqual(len(accumulator), 0)
+        self.api_key_good.invalidate_recordset()
+        self.assertEqual(self.api_key_good.usage_count, 2)
+        self.assertEqual(self.api_key_good.last_ip, "10.0.0.2")
+        self.assertTrue(self.api_key_good.last_used)
@@ -0,0 +1,66 @@
+# Copyright 2018 ACSONE SA/NV
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import logging
+import time
+
+from odoo import SUPERUSER_ID
+from odoo.tests.common import TransactionCase, tagged
+
+_logger = logging.getLogger(__name__)
+
+
+@tagged("-standard", "auth_api_key_benchmark")
+class TestAuthApiKeyBenchmark(TransactionCase):
+    """Compare the resolution of an api key and its user, as done for each
+    request, with the lookup of the record followed by the rebuild of the
+    environment with its user.
+
+    Run with ``--test-tags auth_api_key_benchmark``.
+    """
+
+    ROUNDS = 1000
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.demo_user = cls.env.ref("base.user_demo")
+        cls.env["auth.api.key"].create(
+            {"name": "bench", "user_id": cls.demo_user.id, "key": "bench_key"}
+        )
+
+    def _resolve_with_record(self):
+        # each request starts with an empty record cache
+        self.env.invalidate_all()
+        env = self.env(user=SUPERUSER_ID)
+        api_key = env["auth.api.key"]._retrieve_api_key("bench_key")
+        env = env(user=api_key.user_id.id)
+        return api_key.id, env.uid
+
+    def _resolve_with_ids(self):
+        self.env.invalidate_all()
+        env = self.env(user=SUPERUSER_ID)
+        api_key_id, uid = env["auth.api.key"]._retrieve_api_key_id_and_uid("bench_key")
+        env = env(user=uid)
+        return api_key_id, env.uid
+
+    def _measure(self, resolve):
+        start = time.perf_counter()
+        for _i in range(self.ROUNDS):
+            resolve()
+        return (time.perf_counter() - start) / self.ROUNDS
+
+    def test_benchmark(self):
+        self.assertEqual(self._resolve_with_record(), self._resolve_with_ids())
+        # once cached, resolving the ids does not query the database
+        with self.assertQueryCount(0):
+            self._resolve_with_ids()
+        with_record = self._measure(self._resolve_with_record)
+        with_ids = self._measure(self._resolve_with_ids)
+        _logger.info(
+            "api key resolution: %.1fµs with record, %.1fµs with ids (x%.1f)",
+            with_record * 1e6,
+            with_ids * 1e6,
+            with_record / with_ids,
+        )
+        self.assertLess(with_ids, with_record)
@@ -0,0 +1,64 @@
+# Copyright 2018 ACSONE SA/NV
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import threading
+import time
+
+FLUSH_INTERVAL = 60
+
+_accumulators = {}
+_accumulators_lock = threading.Lock()
+
+
+class UsageAccumulator:
+    """Usage of the api keys of a database since the last flush: for each
+    api key id, the number of requests, the time of the last request and
+    its source address."""
+
+    def __init__(self):
+        self._usages = {}
+        self._lock = threading.Lock()
+        self.flush_at = time.monotonic() + FLUSH_INTERVAL
+
+    def __len__(self):
+        return len(self._usages)
+
+    def record(self, api_key_id, when, address):
+        with self._lock:
+            usage = self._usages.get(api_key_id)
+            if usage is None:
+                self._usages[api_key_id] = [1, when, address]
+            else:
+                usage[0] += 1
+                usage[1] = when
+                usage[2] = address
+
+    def is_flush_due(self, now=None):
+        return bool(self._usages) and (now or time.monotonic()) >= self.flush_at
+
+    def pop(self, now=None):
+        """Return the usages as a dict {api key id: [requests, last request,
+        last address]}, and schedule the next flush."""
+        with self._lock:
+            usages, self._usages = self._usages, {}
+            self.flush_at = (now or time.monotonic()) + FLUSH_INTERVAL
+            return usages
+
+    def restore(self, usages):
+        """Merge back usages that could not be flushed."""
+        with self._lock:
+            for api_key_id, (requests, when, address) in usages.items():
+                usage = self._usages.get(api_key_id)
+                if usage is None:
+                    self._usages[api_key_id] = [requests, when, address]
+                else:
+                    usage[0] += requests
+
+
+def get_usage_accumulator(dbname):
+    """Return the worker wide usage accumulator of database dbname."""
+    with _accumulators_lock:
+        accumulator = _accumulators.get(dbname)
+        if accumulator is None:
+            accumulator = _accumulators[dbname] = UsageAccumulator()
+        return accumulator
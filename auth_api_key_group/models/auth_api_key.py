@@ -3,7 +3,9 @@
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
 
 
-from odoo import fields, models
+from types import MappingProxyType
+
+from odoo import api, fields, models, tools
 
 
 class AuthApiKey(models.Model):
@@ -17,3 +19,47 @@ class AuthApiKey(models.Model):
         column2="group_id",
         string="Auth Groups",
     )
+
+    def _prepare_rate_limits(self):
+        limits = super()._prepare_rate_limits()
+        for group in self.auth_api_key_group_ids:
+            if group.rate_limit or group.daily_quota:
+                limits.append(
+                    (group._name, group.id, group.rate_limit, group.daily_quota)
+                )
+        return limits
+
+    @api.model
+    def _get_key_cache_fields(self):
+        return super()._get_key_cache_fields() | {"auth_api_key_group_ids"}
+
+    @api.model
+    @tools.ormcache()
+    def _get_group_codes_by_key(self):
+        """Return a read-only {api key id: frozenset of group codes} map of
+        all the api keys belonging to a group."""
+        self.env["auth.api.key.group"].flush_model(["code", "auth_api_key_ids"])
+        self.env.cr.execute(
+            """
+            SELECT rel.key_id, array_agg(api_key_group.code)
+            FROM auth_api_key_group_rel AS rel
+            JOIN auth_api_key_group AS api_key_group
+                ON api_key_group.id = rel.group_id
+            GROUP BY rel.key_id
+            """
+        )
+        return MappingProxyType(
+            {
+                api_key_id: frozenset(codes)
+                for api_key_id, codes in self.env.cr.fetchall()
+            }
+        )
+
+    @api.model
+    def _get_group_codes(self, api_key_id):
+        """Return the codes of the groups of api key api_key_id."""
+        return self._get_group_codes_by_key().get(api_key_id, frozenset())
+
+    def _clear_key_cache(self):
+        super()._clear_key_cache()
+        self._get_group_codes_by_key.clear_cache(self.env[self._name])
@@ -3,7 +3,7 @@
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
 
 
-from odoo import fields, models
+from odoo import api, fields, models
 
 
 class AuthApiKeyGroup(models.Model):
@@ -21,3 +21,56 @@ class AuthApiKeyGroup(models.Model):
         column2="key_id",
         string="API Keys",
     )
+    rate_limit = fields.Float(
+        help="""The maximum number of requests per second of all the keys of
+        the group, in each worker process. 0 means no limit.""",
+    )
+    daily_quota = fields.Integer(
+        help="""The maximum number of requests per day (UTC) of all the keys
+        of the group. 0 means no limit.""",
+    )
+    quota_date = fields.Date(readonly=True, copy=False)
+    quota_usage = fields.Integer(
+        readonly=True,
+        copy=False,
+        help="""The number of requests of the quota date counted against the
+        daily quota. It is updated every few seconds.""",
+    )
+
+    last_used = fields.Datetime(
+        compute="_compute_usage",
+        help="The time of the last request of the keys of the group.",
+    )
+    usage_count = fields.Integer(
+        compute="_compute_usage",
+        help="The number of requests of the keys of the group.",
+    )
+
+    @api.depends("auth_api_key_ids.last_used", "auth_api_key_ids.usage_count")
+    def _compute_usage(self):
+        for group in self:
+            api_keys = group.auth_api_key_ids
+            group.last_used = max(
+                api_keys.filtered("last_used").mapped("last_used"), default=False
+            )
+            group.usage_count = sum(api_keys.mapped("usage_count"))
+
+    def _clear_key_cache(self):
+        self.env["auth.api.key"]._clear_key_cache()
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        self._clear_key_cache()
+        return records
+
+    def write(self, vals):
+        res = super().write(vals)
+        if {"code", "rate_limit", "daily_quota", "auth_api_key_ids"}.intersection(vals):
+            self._clear_key_cache()
+        return res
+
+    def unlink(self):
+        res = super().unlink()
+        self._clear_key_cache()
+        return res
@@ -0,0 +1,37 @@
+# Copyright 2021 Camptcamp SA
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import logging
+
+from odoo import models
+from odoo.exceptions import AccessDenied
+from odoo.http import request
+
+_logger = logging.getLogger(__name__)
+
+API_KEY_GROUP_AUTH_PREFIX = "api_key_group_"
+
+
+class IrHttp(models.AbstractModel):
+    _inherit = "ir.http"
+
+    @classmethod
+    def _authenticate_explicit(cls, auth):
+        """Dispatch ``api_key_group_<code>`` to _auth_method_api_key_group."""
+        if auth.startswith(API_KEY_GROUP_AUTH_PREFIX):
+            return cls._auth_method_api_key_group(
+                auth[len(API_KEY_GROUP_AUTH_PREFIX) :]
+            )
+        return super()._authenticate_explicit(auth)
+
+    @classmethod
+    def _auth_method_api_key_group(cls, group_code):
+        """Authenticate the request with its api key, which must belong to
+        the group of code group_code."""
+        cls._auth_method_api_key()
+        api_key_id = request.auth_api_key_id
+        AuthApiKey = request.env(su=True)["auth.api.key"]
+        if group_code not in AuthApiKey._get_group_codes(api_key_id):
+            _logger.error("Api key %s is not in group %s", api_key_id, group_code)
+            raise AccessDenied()
+        return True
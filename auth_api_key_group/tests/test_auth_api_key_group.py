@@ -3,6 +3,7 @@
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
 
 
+from odoo import fields
 from odoo.tests.common import TransactionCase
 
 
@@ -44,3 +45,48 @@ class TestAuthApiKey(TransactionCase):
         self.assertIn(self.api_key_group2, self.api_key3.auth_api_key_group_ids)
         self.assertNotIn(self.api_key_group2, self.api_key1.auth_api_key_group_ids)
         self.assertNotIn(self.api_key_group2, self.api_key1.auth_api_key_group_ids)
+
+    def test_rate_limits(self):
+        self.assertEqual(self.AuthApiKey._get_rate_limits(self.api_key1.id), ())
+        self.api_key_group1.write({"rate_limit": 5, "daily_quota": 1000})
+        self.assertEqual(
+            self.AuthApiKey._get_rate_limits(self.api_key1.id),
+            (("auth.api.key.group", self.api_key_group1.id, 5, 1000),),
+        )
+        self.api_key1.daily_quota = 10
+        self.api_key_group2.auth_api_key_ids |= self.api_key1
+        self.assertEqual(
+            self.AuthApiKey._get_rate_limits(self.api_key1.id),
+            (
+                ("auth.api.key", self.api_key1.id, 0, 10),
+                ("auth.api.key.group", self.api_key_group1.id, 5, 1000),
+            ),
+        )
+
+    def test_usage(self):
+        self.api_key1.write({"usage_count": 3, "last_used": "2024-01-01 10:00:00"})
+        self.api_key2.write({"usage_count": 2, "last_used": "2024-01-02 10:00:00"})
+        self.assertEqual(self.api_key_group1.usage_count, 5)
+        self.assertEqual(
+            fields.Datetime.to_string(self.api_key_group1.last_used),
+            "2024-01-02 10:00:00",
+        )
+        self.assertFalse(self.api_key_group2.last_used)
+
+    def test_group_codes(self):
+        self.assertEqual(self.AuthApiKey._get_group_codes(self.api_key1.id), {"g-one"})
+        # the codes are cached
+        with self.assertQueryCount(0):
+            self.assertEqual(
+                self.AuthApiKey._get_group_codes(self.api_key3.id), {"g-two"}
+            )
+        self.api_key_group2.auth_api_key_ids |= self.api_key1
+        self.assertEqual(
+            self.AuthApiKey._get_group_codes(self.api_key1.id), {"g-one", "g-two"}
+        )
+        self.api_key_group2.code = "g-2"
+        self.assertEqual(
+            self.AuthApiKey._get_group_codes(self.api_key1.id), {"g-one", "g-2"}
+        )
+        self.api_key1.auth_api_key_group_ids = False
+        self.assertFalse(self.AuthApiKey._get_group_codes(self.api_key1.id))
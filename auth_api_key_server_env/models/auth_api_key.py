@@ -4,7 +4,13 @@
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
 
 
-from odoo import models
+from types import MappingProxyType
+
+from odoo import _, api, models, tools
+from odoo.exceptions import AccessError
+
+from odoo.addons.auth_api_key.models.auth_api_key import hash_api_key
+from odoo.addons.server_environment import serv_config
 
 
 class AuthApiKey(models.Model):
@@ -28,3 +34,76 @@ class AuthApiKey(models.Model):
         api_key_fields = {"key": {}}
         api_key_fields.update(base_fields)
         return api_key_fields
+
+    def _register_hook(self):
+        res = super()._register_hook()
+        # load the keys of the configuration when the registry is loaded
+        self._get_env_key_map()
+        return res
+
+    @api.model
+    @tools.ormcache()
+    def _get_env_key_map(self):
+        """Return the api keys defined in the server environment
+        configuration, as an immutable (digest: (api key id, user id) map,
+        frozenset of api key ids) tuple.
+
+        The keys are read from the configuration, without computing the key
+        field of the records. The map is built once per worker and replaced
+        as a whole when the key caches are cleared: call _clear_key_cache()
+        after reloading the configuration.
+        """
+        prefix = "api_key_"
+        tech_names = [
+            section[len(prefix) :]
+            for section in serv_config.sections()
+            if section.startswith(prefix)
+        ]
+        key_map = {}
+        if tech_names:
+            api_keys = self.with_context(active_test=False).search(
+                [("tech_name", "in", tech_names)]
+            )
+            for api_key in api_keys:
+                section = api_key._server_env_section_name()
+                if not serv_config.has_option(section, "key"):
+                    continue
+                key = serv_config.get(section, "key")
+                if key:
+                    key_map[hash_api_key(key)] = (api_key.id, api_key.user_id.id)
+        return (
+            MappingProxyType(key_map),
+            frozenset(api_key_id for api_key_id, _uid in key_map.values()),
+        )
+
+    @api.model
+    def _lookup_api_key_id(self, key):
+        key_map, env_api_key_ids = self._get_env_key_map()
+        env_api_key = key_map.get(hash_api_key(key))
+        if env_api_key:
+            return env_api_key[0]
+        api_key_id = super()._lookup_api_key_id(key)
+        if api_key_id in env_api_key_ids:
+            # the key stored in the database is replaced by the one from env
+            return None
+        return api_key_id
+
+    @api.model
+    def _retrieve_api_key_id_and_uid(self, key):
+        env_api_key = self._get_env_key_map()[0].get(hash_api_key(key))
+        if env_api_key is None:
+            return super()._retrieve_api_key_id_and_uid(key)
+        if not self.env.user.has_group("base.group_system"):
+            raise AccessError(_("User is not allowed"))
+        return env_api_key
+
+    def _has_key(self):
+        return super()._has_key() or self.id in self._get_env_key_map()[1]
+
+    def _clear_key_cache(self):
+        super()._clear_key_cache()
+        self._get_env_key_map.clear_cache(self.env[self._name])
+
+    @api.model
+    def _get_key_cache_fields(self):
+        return super()._get_key_cache_fields() | {"tech_name"}
@@ -35,3 +35,24 @@ class TestAuthApiKey(TransactionCase):
             # dummy key must be replace with the one from env and
             # therefore should be unusable
             self.env["auth.api.key"]._retrieve_uid_from_api_key("dummy")
+
+    def test_env_key_map(self):
+        AuthApiKey = self.env["auth.api.key"]
+        expected = (self.api_key_from_env.id, self.demo_user.id)
+        self.assertEqual(
+            AuthApiKey._retrieve_api_key_id_and_uid("api_key_from_env"), expected
+        )
+        with self.assertQueryCount(0):
+            self.assertEqual(
+                AuthApiKey._retrieve_api_key_id_and_uid("api_key_from_env"),
+                expected,
+            )
+        # the map is rebuilt when the configuration is reloaded
+        serv_config.set("api_key_test_env", "key", "api_key_reloaded")
+        self.addCleanup(serv_config.set, "api_key_test_env", "key", "api_key_from_env")
+        AuthApiKey._clear_key_cache()
+        self.assertEqual(
+            AuthApiKey._retrieve_api_key_id_and_uid("api_key_reloaded"), expected
+        )
+        with self.assertRaises(ValidationError):
+            AuthApiKey._retrieve_uid_from_api_key("api_key_from_env")
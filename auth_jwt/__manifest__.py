@@ -12,6 +12,12 @@
     "website": "https://github.com/OCA/server-auth",
     "depends": [],
     "external_dependencies": {"python": ["pyjwt", "cryptography"]},
-    "data": ["security/ir.model.access.csv", "views/auth_jwt_validator_views.xml"],
+    "data": [
+        "data/ir_cron.xml",
+        "security/ir.model.access.csv",
+        "views/auth_jwt_revoked_token_views.xml",
+        "views/auth_jwt_user_mapping_views.xml",
+        "views/auth_jwt_validator_views.xml",
+    ],
     "demo": [],
 }
@@ -0,0 +1,64 @@
+# Copyright 2021 ACSONE SA/NV
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import threading
+import time
+from collections import OrderedDict
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+class TTLCache:
+    """Thread safe, size bounded LRU mapping whose entries expire."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at <= time.time():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, expires_at):
+        """Store value until the expires_at timestamp."""
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+def get_cache(cache_key, version, maxsize):
+    """Return the worker wide cache for cache_key.
+
+    A new, empty cache replaces the current one when version or maxsize
+    change, so that entries computed with an outdated configuration are
+    never returned.
+    """
+    with _caches_lock:
+        entry = _caches.get(cache_key)
+        if entry is None or entry[0] != version or entry[1].maxsize != maxsize:
+            entry = _caches[cache_key] = (version, TTLCache(maxsize))
+        return entry[1]
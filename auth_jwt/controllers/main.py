@@ -0,0 +1,73 @@
+# Copyright 2021 ACSONE SA/NV
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import hmac
+
+from werkzeug.exceptions import BadRequest, NotFound, Unauthorized
+
+from odoo.http import Controller, Response, request, route
+from odoo.tools import config
+
+from .. import metrics
+
+# Maximum number of tokens accepted by /auth_jwt/decode_many.
+DECODE_MANY_MAX_TOKENS = 1000
+
+
+class AuthJwtMetricsController(Controller):
+    @route(
+        "/auth_jwt/metrics",
+        type="http",
+        auth="none",
+        csrf=False,
+        save_session=False,
+        methods=["GET"],
+    )
+    def metrics(self):
+        """Export the metrics of this worker in the Prometheus text format.
+
+        The route only exists when the prometheus sink is enabled and a
+        scraping token is set with the ``auth_jwt_metrics_token`` option of
+        the Odoo configuration file. Scrapers must send that token in a
+        ``Authorization: Bearer`` header.
+        """
+        sink = metrics.get_sink(metrics.PrometheusSink)
+        token = config.get("auth_jwt_metrics_token")
+        if sink is None or not token:
+            raise NotFound()
+        self._check_metrics_token(token)
+        return Response(
+            sink.render(), content_type="text/plain; version=0.0.4", status=200
+        )
+
+    def _check_metrics_token(self, token):
+        authorization = request.httprequest.environ.get("HTTP_AUTHORIZATION", "")
+        scheme, _, credentials = authorization.partition(" ")
+        if scheme.lower() != "bearer" or not hmac.compare_digest(
+            credentials.strip().encode(), token.encode()
+        ):
+            raise Unauthorized()
+
+    @route("/auth_jwt/decode_many", type="json", auth="user", methods=["POST"])
+    def decode_many(self, validator, tokens):
+        """Validate and decode a batch of tokens with the validator named
+        validator (and its fallback validators).
+
+        Return, in the order of tokens, a dict per token with either the
+        ``validator`` name and the ``payload`` of a valid token, or the
+        ``error`` code of an invalid one. Only users allowed to read the
+        validators can call this route.
+        """
+        Validator = request.env["auth.jwt.validator"]
+        Validator.check_access_rights("read")
+        if (
+            not isinstance(tokens, list)
+            or len(tokens) > DECODE_MANY_MAX_TOKENS
+            or not all(isinstance(token, str) for token in tokens)
+        ):
+            raise BadRequest(
+                f"tokens must be a list of at most {DECODE_MANY_MAX_TOKENS} strings"
+            )
+        Validator = Validator.sudo()
+        validator = Validator.browse(Validator._get_validator_id_by_name(validator))
+        return validator._decode_many(tokens)
@@ -32,10 +32,22 @@ class UnauthorizedInvalidToken(Unauthorized):
     pass
 
 
+class UnauthorizedUnknownKid(UnauthorizedInvalidToken):
+    pass
+
+
+class UnauthorizedRevokedToken(UnauthorizedInvalidToken):
+    pass
+
+
 class UnauthorizedPartnerNotFound(Unauthorized):
     pass
 
 
+class UnauthorizedUserNotFound(Unauthorized):
+    pass
+
+
 class UnauthorizedCompositeJwtError(Unauthorized):
     """Indicate that multiple errors occurred during JWT chain validation."""
 
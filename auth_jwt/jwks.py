@@ -0,0 +1,168 @@
+# Copyright 2021 ACSONE SA/NV
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import logging
+import re
+import threading
+import time
+
+import requests
+from jwt import PyJWKSet  # pylint: disable=missing-manifest-dependency
+
+from . import metrics
+from .exceptions import UnauthorizedUnknownKid
+
+_logger = logging.getLogger(__name__)
+
+CACHE_CONTROL_MAX_AGE_RE = re.compile(r"(?:^|[,\s])max-age\s*=\s*(\d+)", re.I)
+CACHE_CONTROL_NO_CACHE_RE = re.compile(r"(?:^|[,\s])(no-cache|no-store)\b", re.I)
+
+# Start refreshing the key set in the background when this fraction of its
+# lifetime has elapsed, so that requests never wait for the JWKS URI.
+REFRESH_AHEAD_RATIO = 0.8
+# While the first fetch of the key set is in flight (worker start), lookups
+# wait for it up to this number of seconds.
+COLD_WAIT_TIMEOUT = 5
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+class JwksCache:
+    """Keys published at a JWKS URI, refreshed in the background.
+
+    Once the key set is loaded, looking up a key never waits for network
+    I/O: when a key is missing or the key set is about to expire, a refresh
+    is scheduled in a background thread. Only the lookups made during the
+    first fetch wait for it, up to ``COLD_WAIT_TIMEOUT`` seconds: once a
+    fetch failed, lookups fail right away until a refresh succeeds.
+    Refreshes triggered by unknown key ids are rate limited to one per
+    ``min_refresh_interval`` seconds, so that a flood of tokens with random
+    ``kid`` headers does not turn into a flood of outbound requests.
+    """
+
+    def __init__(self, uri, max_age=3600, min_refresh_interval=60, timeout=10):
+        self.uri = uri
+        self.max_age = max_age
+        self.min_refresh_interval = min_refresh_interval
+        self.timeout = timeout
+        self._keys = {}
+        self._lock = threading.Lock()
+        self._refresh_thread = None
+        self._fetched_at = None
+        self._refresh_at = 0
+        self._last_attempt_at = None
+        self._failed_at = None
+
+    def get_signing_key(self, kid):
+        """Return the key for kid, or raise UnauthorizedUnknownKid."""
+        key = self._keys.get(kid)
+        if key is not None:
+            if time.time() >= self._refresh_at:
+                self._schedule_refresh()
+            return key
+        # Unknown kid: it may have been rotated in since the last fetch.
+        self._schedule_refresh()
+        if self._fetched_at is None and self._failed_at is None:
+            # First fetch in flight: wait for the key set rather than
+            # rejecting valid tokens until it lands.
+            self.join(min(self.timeout, COLD_WAIT_TIMEOUT))
+            key = self._keys.get(kid)
+            if key is not None:
+                return key
+        _logger.info("Unknown key id %r for JWKS URI %s", kid, self.uri)
+        raise UnauthorizedUnknownKid()
+
+    def refresh(self):
+        """Fetch the key set synchronously. Return True on success."""
+        self._last_attempt_at = time.time()
+        start = time.perf_counter()
+        try:
+            response = requests.get(self.uri, timeout=self.timeout)
+            response.raise_for_status()
+            jwk_set = PyJWKSet.from_dict(response.json())
+        except Exception as e:
+            _logger.warning("Could not fetch JWKS URI %s: %s", self.uri, e)
+            self._failed_at = time.time()
+            self._record_refresh("failed", start)
+            return False
+        self._record_refresh("fetched", start)
+        fetched_at = time.time()
+        ttl = self._get_ttl(response.headers.get("Cache-Control"))
+        # Replace the whole key set so that rotated keys are dropped.
+        self._keys = {jwk.key_id: jwk.key for jwk in jwk_set.keys}
+        self._fetched_at = fetched_at
+        self._failed_at = None
+        self._refresh_at = fetched_at + ttl * REFRESH_AHEAD_RATIO
+        return True
+
+    def warm(self):
+        """Schedule a refresh unless the key set is already loaded."""
+        if self._fetched_at is None:
+            self._schedule_refresh()
+
+    def join(self, timeout=None):
+        """Wait for the background refresh in progress, if any."""
+        thread = self._refresh_thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _record_refresh(self, outcome, start):
+        if metrics.enabled:
+            labels = {"uri": self.uri}
+            metrics.observe(
+                "auth_jwt_jwks_refresh_seconds", labels, time.perf_counter() - start
+            )
+            metrics.increment(
+                "auth_jwt_jwks_refresh_total", dict(labels, outcome=outcome)
+            )
+
+    def _get_ttl(self, cache_control):
+        ttl = self.max_age
+        if cache_control:
+            if CACHE_CONTROL_NO_CACHE_RE.search(cache_control):
+                ttl = self.min_refresh_interval
+            else:
+                mo = CACHE_CONTROL_MAX_AGE_RE.search(cache_control)
+                if mo:
+                    ttl = min(ttl, int(mo.group(1)))
+        # Never refresh more often than the unknown kid rate limit.
+        return max(ttl, self.min_refresh_interval)
+
+    def _schedule_refresh(self):
+        """Start a background refresh, unless one is running or the key set
+        was fetched less than min_refresh_interval seconds ago."""
+        with self._lock:
+            if self._refresh_thread is not None and self._refresh_thread.is_alive():
+                return
+            now = time.time()
+            if (
+                self._last_attempt_at is not None
+                and now - self._last_attempt_at < self.min_refresh_interval
+            ):
+                return
+            self._last_attempt_at = now
+            self._refresh_thread = threading.Thread(
+                target=self.refresh, name="auth_jwt-jwks-refresh", daemon=True
+            )
+            self._refresh_thread.start()
+
+
+def get_jwks_cache(cache_key, uri, max_age, min_refresh_interval):
+    """Return the worker wide JWKS cache for cache_key.
+
+    The cache is replaced when the URI or its refresh settings change, so the
+    keys survive the invalidation of validator snapshots.
+    """
+    with _caches_lock:
+        cache = _caches.get(cache_key)
+        if (
+            cache is None
+            or cache.uri != uri
+            or cache.max_age != max_age
+            or cache.min_refresh_interval != min_refresh_interval
+        ):
+            cache = _caches[cache_key] = JwksCache(
+                uri, max_age=max_age, min_refresh_interval=min_refresh_interval
+            )
+        return cache
@@ -0,0 +1,179 @@
+# Copyright 2021 ACSONE SA/NV
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+"""Timing and outcome metrics of the JWT authentication.
+
+Metrics are sent to the registered sinks. When no sink is registered,
+``enabled`` is False and the authentication code does not even read the
+clock, so instrumentation has no measurable overhead.
+
+Sinks can be enabled in the Odoo configuration file with a comma separated
+list of sink names, for instance ``auth_jwt_metrics = prometheus,log``, or
+registered programmatically with ``add_sink()``.
+"""
+
+import json
+import logging
+import threading
+from bisect import bisect_left
+
+from odoo.tools import config
+
+_logger = logging.getLogger(__name__)
+
+enabled = False
+_sinks = []
+_configured = False
+
+TIMING_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+)
+
+
+class MetricsSink:
+    """Base class of metrics sinks."""
+
+    def increment(self, name, labels, value=1):
+        """Increment the counter name for labels (a dict)."""
+
+    def observe(self, name, labels, seconds):
+        """Record a duration, in seconds, for the timing name and labels."""
+
+
+class LogSink(MetricsSink):
+    """Log each metric as a JSON object."""
+
+    def increment(self, name, labels, value=1):
+        _logger.info(json.dumps({"metric": name, "labels": labels, "value": value}))
+
+    def observe(self, name, labels, seconds):
+        _logger.info(json.dumps({"metric": name, "labels": labels, "seconds": seconds}))
+
+
+class PrometheusSink(MetricsSink):
+    """Aggregate metrics in memory and render them in the Prometheus text
+    exposition format.
+
+    Metrics are aggregated per worker process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._timings = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def increment(self, name, labels, value=1):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, labels, seconds):
+        key = self._key(name, labels)
+        with self._lock:
+            timing = self._timings.get(key)
+            if timing is None:
+                # one count per bucket, the last one being +Inf, then the sum
+                timing = self._timings[key] = [0] * (len(TIMING_BUCKETS) + 1) + [0.0]
+            timing[bisect_left(TIMING_BUCKETS, seconds)] += 1
+            timing[-1] += seconds
+
+    @staticmethod
+    def _format_labels(labels, **extra):
+        labels = list(labels) + list(extra.items())
+        if not labels:
+            return ""
+        return "{%s}" % ",".join(
+            '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+            for k, v in labels
+        )
+
+    def render(self):
+        with self._lock:
+            counters = dict(self._counters)
+            timings = {key: list(timing) for key, timing in self._timings.items()}
+        lines = []
+        for name in sorted({name for name, _labels in counters}):
+            lines.append(f"# TYPE {name} counter")
+            for (key_name, labels), value in sorted(counters.items()):
+                if key_name == name:
+                    lines.append(f"{name}{self._format_labels(labels)} {value}")
+        for name in sorted({name for name, _labels in timings}):
+            lines.append(f"# TYPE {name} histogram")
+            for (key_name, labels), timing in sorted(timings.items()):
+                if key_name != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(TIMING_BUCKETS + ("+Inf",), timing[:-1]):
+                    cumulative += count
+                    le = self._format_labels(labels, le=bound)
+                    lines.append(f"{name}_bucket{le} {cumulative}")
+                lines.append(f"{name}_sum{self._format_labels(labels)} {timing[-1]}")
+                lines.append(f"{name}_count{self._format_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+SINKS = {
+    "log": LogSink,
+    "prometheus": PrometheusSink,
+}
+
+
+def add_sink(sink):
+    global enabled
+    _sinks.append(sink)
+    enabled = True
+
+
+def remove_sink(sink):
+    global enabled
+    _sinks.remove(sink)
+    enabled = bool(_sinks)
+
+
+def get_sink(sink_class):
+    """Return the first registered sink of class sink_class, or None."""
+    for sink in _sinks:
+        if isinstance(sink, sink_class):
+            return sink
+    return None
+
+
+def configure():
+    """Register the sinks listed in the auth_jwt_metrics configuration
+    option, once per process."""
+    global _configured
+    if _configured:
+        return
+    _configured = True
+    for sink_name in (config.get("auth_jwt_metrics") or "").split(","):
+        sink_name = sink_name.strip()
+        if not sink_name:
+            continue
+        if sink_name not in SINKS:
+            _logger.error("Unknown auth_jwt_metrics sink %r", sink_name)
+            continue
+        add_sink(SINKS[sink_name]())
+
+
+def increment(name, labels, value=1):
+    for sink in _sinks:
+        sink.increment(name, labels, value)
+
+
+def observe(name, labels, seconds):
+    for sink in _sinks:
+        sink.observe(name, labels, seconds)
@@ -1,2 +1,6 @@
+from . import auth_jwt_revoked_token
+from . import auth_jwt_user_mapping
 from . import auth_jwt_validator
 from . import ir_http
+from . import res_partner
+from . import res_users
@@ -0,0 +1,128 @@
+# Copyright 2021 ACSONE SA/NV
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import datetime
+import time
+
+from odoo import api, fields, models
+
+from ..revocation import get_revocation_list
+
+# Revocations made by other workers are loaded after at most this number of
+# seconds.
+REFRESH_INTERVAL = 5
+# The revocation list is fully reloaded at this interval, to drop the
+# revocations that were purged or deleted by other workers.
+RELOAD_INTERVAL = 3600
+# Incremental refreshes load the revocations created up to this number of
+# seconds before the previous refresh: a transaction started before it may
+# commit a revocation after it. It must be longer than the transactions of
+# the workers (limit_time_real).
+RESCAN_WINDOW = 600
+
+
+class AuthJwtRevokedToken(models.Model):
+    _name = "auth.jwt.revoked.token"
+    _description = "Revoked JWT"
+    _order = "id desc"
+
+    validator_id = fields.Many2one(
+        "auth.jwt.validator", required=True, ondelete="cascade"
+    )
+    jti = fields.Char(string="JWT ID", required=True)
+    # incremental refreshes of the revocation lists search on it
+    create_date = fields.Datetime(index=True)
+    expiration = fields.Datetime(
+        required=True,
+        index=True,
+        help="Expiration of the token, after which the revocation is purged.",
+    )
+
+    _sql_constraints = [
+        (
+            "jti_unique",
+            "unique(validator_id, jti)",
+            "This token is already revoked.",
+        )
+    ]
+
+    @api.model
+    def _get_revocation_list(self):
+        """Return the revocation list of the worker, refreshed with the
+        revocations created since the last refresh (minus RESCAN_WINDOW) if
+        it is older than REFRESH_INTERVAL seconds."""
+        revocation_list = get_revocation_list(self.env.cr.dbname)
+        now = time.time()
+        if now < revocation_list.refresh_at:
+            return revocation_list
+        self.flush_model()
+        if now >= revocation_list.reload_at:
+            self.env.cr.execute(
+                """
+                SELECT validator_id, jti
+                FROM auth_jwt_revoked_token
+                WHERE expiration > now() at time zone 'UTC'
+                """
+            )
+            revocation_list.replace(self.env.cr.fetchall())
+            revocation_list.reload_at = now + RELOAD_INTERVAL
+        else:
+            self.env.cr.execute(
+                """
+                SELECT validator_id, jti
+                FROM auth_jwt_revoked_token
+                WHERE create_date > %s
+                """,
+                (
+                    datetime.datetime.utcfromtimestamp(
+                        revocation_list.scanned_at - RESCAN_WINDOW
+                    ),
+                ),
+            )
+            revocation_list.add(self.env.cr.fetchall())
+        revocation_list.scanned_at = now
+        revocation_list.refresh_at = now + REFRESH_INTERVAL
+        return revocation_list
+
+    @api.model
+    def _revoke(self, validator, payload):
+        """Revoke the token of payload, accepted by validator, until it
+        expires."""
+        if not payload.get("jti"):
+            raise ValueError("Tokens without jti claim can not be revoked.")
+        revocation = self.search(
+            [("validator_id", "=", validator.id), ("jti", "=", payload["jti"])]
+        )
+        if not revocation:
+            revocation = self.create(
+                {
+                    "validator_id": validator.id,
+                    "jti": payload["jti"],
+                    "expiration": datetime.datetime.utcfromtimestamp(
+                        int(payload["exp"])
+                    ),
+                }
+            )
+        return revocation
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        revocations = super().create(vals_list)
+        # make the revocations effective on this worker as soon as they are
+        # committed, rolled back revocations must not reject tokens
+        entries = [
+            (revocation.validator_id.id, revocation.jti) for revocation in revocations
+        ]
+        revocation_list = get_revocation_list(self.env.cr.dbname)
+        self.env.cr.postcommit.add(lambda: revocation_list.add(entries))
+        return revocations
+
+    def unlink(self):
+        res = super().unlink()
+        self.env.cr.postcommit.add(get_revocation_list(self.env.cr.dbname).reset)
+        return res
+
+    @api.model
+    def _cron_purge(self):
+        """Delete the revocations of expired tokens."""
+        self.search([("expiration", "<", fields.Datetime.now())]).unlink()
@@ -0,0 +1,103 @@
+# Copyright 2021 ACSONE SA/NV
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import itertools
+import time
+
+from odoo import api, fields, models, tools
+
+from ..cache import TTLCache
+
+# User ids resolved from token claims are cached per worker. The cache is
+# dropped in all the workers when mappings are modified or users deactivated.
+USER_CACHE_SIZE = 10000
+USER_CACHE_TTL = 300
+
+_generations = itertools.count(1)
+
+
+class AuthJwtUserMapping(models.Model):
+    _name = "auth.jwt.user.mapping"
+    _description = "JWT Claim to User Mapping"
+    _order = "validator_id, claim_value"
+
+    validator_id = fields.Many2one(
+        "auth.jwt.validator", required=True, ondelete="cascade"
+    )
+    claim_value = fields.Char(
+        required=True,
+        help="Value of the claim identifying the user in the tokens accepted "
+        "by the validator (sub, email or custom claim, according to the user "
+        "strategy of the validator).",
+    )
+    user_id = fields.Many2one("res.users", required=True, ondelete="cascade")
+
+    _sql_constraints = [
+        (
+            "claim_value_unique",
+            "unique(validator_id, claim_value)",
+            "A claim value can be mapped to only one user per validator.",
+        )
+    ]
+
+    @api.model
+    @tools.ormcache()
+    def _get_user_cache(self):
+        """Return the cache of the resolved user ids.
+
+        The cache lives in the ormcache, so that it is dropped in all the
+        workers through the registry cache signaling.
+        """
+        return TTLCache(USER_CACHE_SIZE)
+
+    @api.model
+    @tools.ormcache()
+    def _get_user_cache_generation(self):
+        """Return a number that changes whenever the user cache is dropped,
+        to version the caches holding resolved user ids, like the verified
+        token caches of the validators."""
+        return next(_generations)
+
+    @api.model
+    def _get_uid(self, validator_id, claim_value):
+        """Return the id of the active user mapped to claim_value for the
+        validator, or None.
+
+        The result is cached per worker, so that resolving a known claim value
+        does not access the database.
+        """
+        cache = self._get_user_cache()
+        key = (validator_id, claim_value)
+        uid = cache.get(key)
+        if uid is not None:
+            return uid
+        self.flush_model()
+        self.env.cr.execute(
+            """
+            SELECT m.user_id
+            FROM auth_jwt_user_mapping m
+            JOIN res_users u ON u.id = m.user_id
+            WHERE m.validator_id = %s AND m.claim_value = %s AND u.active
+            """,
+            (validator_id, claim_value),
+        )
+        row = self.env.cr.fetchone()
+        if not row:
+            return None
+        cache.set(key, row[0], time.time() + USER_CACHE_TTL)
+        return row[0]
+
+    @api.model
+    def _invalidate_user_cache(self):
+        """Drop the cache of the resolved user ids in all the workers."""
+        self._get_user_cache.clear_cache(self.env[self._name])
+
+    def write(self, vals):
+        res = super().write(vals)
+        self._invalidate_user_cache()
+        return res
+
+    def unlink(self):
+        res = super().unlink()
+        self._invalidate_user_cache()
+        return res
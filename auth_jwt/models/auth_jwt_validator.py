@@ -2,18 +2,24 @@
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
 
 import datetime
+import hashlib
 import logging
 import re
+import threading
+import time
 from calendar import timegm
-from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
 
 import jwt  # pylint: disable=missing-manifest-dependency
-from jwt import PyJWKClient
-from werkzeug.exceptions import InternalServerError
+import psycopg2
+from werkzeug.exceptions import InternalServerError, Unauthorized
 
 from odoo import _, api, fields, models, tools
 from odoo.exceptions import ValidationError
 
+from .. import metrics
+from ..cache import get_cache
 from ..exceptions import (
     AmbiguousJwtValidator,
     ConfigurationError,
@@ -22,12 +28,82 @@ from ..exceptions import (
     UnauthorizedMalformedAuthorizationHeader,
     UnauthorizedMissingAuthorizationHeader,
     UnauthorizedPartnerNotFound,
+    UnauthorizedRevokedToken,
+    UnauthorizedUnknownKid,
+    UnauthorizedUserNotFound,
 )
+from ..jwks import get_jwks_cache
+from ..verifier import JwtVerifier
+from .res_partner import normalize_email
 
 _logger = logging.getLogger(__name__)
 
 AUTHORIZATION_RE = re.compile(r"^Bearer ([^ ]+)$")
 
+EXECUTOR_MAX_WORKERS = 4
+# Number of tokens verified by each task of _decode_many().
+DECODE_MANY_CHUNK_SIZE = 100
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    """Return the worker wide thread pool used to verify tokens concurrently."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=EXECUTOR_MAX_WORKERS, thread_name_prefix="auth_jwt"
+            )
+        return _executor
+
+
+def _decode_catching(validator, token, secret):
+    # Validator snapshots are cached by the caller, so that _decode()
+    # does not access the database from the thread pool.
+    try:
+        return validator._decode(token, secret=secret)
+    except Unauthorized as e:
+        return e
+
+
+def _decode_chunk(validator, key, algorithm, tokens):
+    results = []
+    for token in tokens:
+        try:
+            results.append(validator._decode_with_key(token, key, algorithm))
+        except Unauthorized as e:
+            results.append(e)
+    return results
+
+
+class ValidatorSnapshot:
+    """Immutable, compiled view of an auth.jwt.validator record.
+
+    Snapshots are built once per worker and shared by all the requests it
+    serves, so that authenticating a request does not need to read the
+    validator configuration from the database.
+    """
+
+    __slots__ = ("_values",)
+
+    def __init__(self, **values):
+        object.__setattr__(self, "_values", values)
+
+    def __getattr__(self, name):
+        try:
+            return self._values[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __setattr__(self, name, value):
+        raise AttributeError("JWT validator snapshots are immutable.")
+
+    def __repr__(self):
+        return "<ValidatorSnapshot {!r}>".format(self._values.get("name"))
+
 
 class AuthJwtValidator(models.Model):
     _name = "auth.jwt.validator"
@@ -38,6 +114,14 @@ class AuthJwtValidator(models.Model):
         [("secret", "Secret"), ("public_key", "Public key")], required=True
     )
     secret_key = fields.Char()
+    secret_key_ring = fields.Text(
+        help="Secrets selected by the kid header of the tokens, one per line, "
+        "as kid=secret. The secret of the first line is the active one, the "
+        "other ones are only used to verify tokens, so that secrets can be "
+        "rotated without rejecting the tokens signed with the previous one. "
+        "Tokens without kid header are verified with the key, or with the "
+        "active secret if there is no key.",
+    )
     secret_algorithm = fields.Selection(
         [
             # https://pyjwt.readthedocs.io/en/stable/algorithms.html
@@ -48,6 +132,17 @@ class AuthJwtValidator(models.Model):
         default="HS256",
     )
     public_key_jwk_uri = fields.Char()
+    public_key_jwk_max_age = fields.Integer(
+        default=3600,
+        help="Maximum number of seconds the keys fetched from the JWK URI are "
+        "cached before being refreshed in the background. A lower max-age "
+        "sent by the JWK URI in its Cache-Control header takes precedence.",
+    )
+    public_key_jwk_min_refresh_interval = fields.Integer(
+        default=60,
+        help="Minimum number of seconds between two fetches of the JWK URI. "
+        "Tokens signed with an unknown key id do not trigger more fetches.",
+    )
     public_key_algorithm = fields.Selection(
         [
             # https://pyjwt.readthedocs.io/en/stable/algorithms.html
@@ -69,9 +164,35 @@ class AuthJwtValidator(models.Model):
     )
     issuer = fields.Char(required=True, help="To validate iss.")
     user_id_strategy = fields.Selection(
-        [("static", "Static")], required=True, default="static"
+        [
+            ("static", "Static"),
+            ("sub", "From sub claim"),
+            ("email", "From email claim"),
+            ("claim", "From custom claim"),
+        ],
+        required=True,
+        default="static",
     )
     static_user_id = fields.Many2one("res.users", default=1)
+    user_id_claim = fields.Char(
+        string="User claim", help="Name of the claim identifying the user."
+    )
+    user_email_matching = fields.Boolean(
+        help="With the email strategy, map the unknown email claims to the "
+        "only active user whose login or email matches, including internal "
+        "users. Only enable it if the identity provider verifies the emails "
+        "of its users, otherwise a token could impersonate any user."
+    )
+    user_provisioning = fields.Boolean(
+        help="Create a user, copied from the template user, when a token "
+        "identifies a user that is not known yet."
+    )
+    user_template_id = fields.Many2one(
+        "res.users",
+        string="Template user",
+        context={"active_test": False},
+        help="User copied to create the users of new token subjects.",
+    )
     partner_id_strategy = fields.Selection([("email", "From email claim")])
     partner_id_required = fields.Boolean()
 
@@ -97,6 +218,24 @@ class AuthJwtValidator(models.Model):
     cookie_secure = fields.Boolean(
         default=True, help="Set to false only for development without https."
     )
+    cookie_renew_threshold = fields.Integer(
+        default=0,
+        help="When a request is authenticated by the cookie, only issue a new "
+        "cookie if the current one expires in less than this number of "
+        "seconds. 0 to issue a new cookie on every request.",
+    )
+
+    token_cache_size = fields.Integer(
+        default=0,
+        help="Maximum number of verified tokens kept in memory by each worker, "
+        "so that repeated requests with the same token skip the signature "
+        "verification and the user and partner resolution. 0 to disable.",
+    )
+    token_cache_ttl = fields.Integer(
+        default=300,
+        help="Number of seconds a verified token is kept in memory. Tokens are "
+        "never kept beyond their expiration time.",
+    )
 
     _sql_constraints = [
         ("name_uniq", "unique(name)", "JWT validator names must be unique !"),
@@ -126,6 +265,50 @@ class AuthJwtValidator(models.Model):
                         )
                     )
 
+    @api.constrains("signature_type", "secret_key", "secret_key_ring")
+    def _check_secret_key(self):
+        for rec in self:
+            if rec.signature_type != "secret":
+                continue
+            try:
+                key_ring = rec._parse_secret_key_ring()
+            except ValueError as e:
+                raise ValidationError(
+                    _("Invalid secret key ring on JWT validator %(name)s: %(error)s")
+                    % {"name": rec.name, "error": e}
+                ) from e
+            if not rec.secret_key and not key_ring:
+                raise ValidationError(
+                    _(
+                        "A key or a secret key ring must be provided on JWT "
+                        "validator %s."
+                    )
+                    % (rec.name,)
+                )
+
+    @api.constrains(
+        "user_id_strategy", "user_id_claim", "user_provisioning", "user_template_id"
+    )
+    def _check_user_id_strategy(self):
+        for rec in self:
+            if rec.user_id_strategy == "claim" and not rec.user_id_claim:
+                raise ValidationError(
+                    _("A user claim must be provided on JWT validator %s.")
+                    % (rec.name,)
+                )
+            if (
+                rec.user_id_strategy != "static"
+                and rec.user_provisioning
+                and not rec.user_template_id
+            ):
+                raise ValidationError(
+                    _(
+                        "A template user must be provided on JWT validator %s "
+                        "because it creates users."
+                    )
+                    % (rec.name,)
+                )
+
     @api.constrains("cookie_enabled", "cookie_name")
     def _check_cookie_name(self):
         for rec in self:
@@ -158,10 +341,160 @@ class AuthJwtValidator(models.Model):
             raise AmbiguousJwtValidator()
         return validator
 
-    @tools.ormcache("self.public_key_jwk_uri", "kid")
+    @api.model
+    @tools.ormcache("validator_name")
+    def _get_validator_id_by_name(self, validator_name):
+        return self._get_validator_by_name(validator_name).id
+
+    def _get_chain(self):
+        """Return the ids of this validator and of its fallback validators."""
+        self.ensure_one()
+        chain = []
+        validator = self
+        while validator:
+            chain.append(validator.id)
+            validator = validator.next_validator_id
+        return tuple(chain)
+
+    def _get_chain_issuer_index(self):
+        """Return a read-only mapping of issuers to the ids of the validators
+        of the chain that accept them."""
+        index = {}
+        for validator in self.browse(self._get_chain()):
+            index.setdefault(validator.issuer, []).append(validator.id)
+        return MappingProxyType({iss: tuple(ids) for iss, ids in index.items()})
+
+    def _prepare_snapshot_values(self):
+        """Return the configuration values compiled into the snapshot.
+
+        Override to make additional fields available to the request
+        authentication path.
+        """
+        self.ensure_one()
+        return dict(
+            id=self.id,
+            name=self.name,
+            signature_type=self.signature_type,
+            secret_key=self.secret_key,
+            secret_key_ring=MappingProxyType(self._parse_secret_key_ring()),
+            secret_algorithm=self.secret_algorithm,
+            public_key_jwk_uri=self.public_key_jwk_uri,
+            public_key_algorithm=self.public_key_algorithm,
+            audiences=tuple(self.audience.split(",")),
+            issuer=self.issuer,
+            user_id_strategy=self.user_id_strategy,
+            static_user_id=self.static_user_id.id,
+            user_id_claim=self._get_user_id_claim(),
+            user_email_matching=self.user_email_matching,
+            user_provisioning=self.user_provisioning,
+            user_template_id=self.user_template_id.id,
+            partner_id_strategy=self.partner_id_strategy,
+            partner_id_required=self.partner_id_required,
+            chain_ids=self._get_chain(),
+            issuer_index=self._get_chain_issuer_index(),
+            cookie_enabled=self.cookie_enabled,
+            cookie_name=self.cookie_name,
+            cookie_path=self.cookie_path,
+            cookie_max_age=self.cookie_max_age,
+            cookie_secure=self.cookie_secure,
+            cookie_renew_threshold=self.cookie_renew_threshold,
+            # ir.config_parameter clears the snapshots when it is modified
+            cookie_secret=self._get_database_secret(),
+            token_cache_size=self.token_cache_size,
+            token_cache_ttl=self.token_cache_ttl,
+            jwks_cache=(
+                self._get_jwks_cache() if self.signature_type == "public_key" else None
+            ),
+        )
+
+    @api.model
+    @tools.ormcache("validator_id")
+    def _get_validator_snapshot(self, validator_id):
+        validator = self.sudo().browse(validator_id)
+        values = validator._prepare_snapshot_values()
+        values["token_cache"] = validator._get_token_cache(values)
+        values["verifier"] = JwtVerifier(
+            ValidatorSnapshot(**values), self.env.cr.dbname
+        )
+        return ValidatorSnapshot(**values)
+
+    def _get_snapshot(self):
+        """Return the compiled snapshot of this validator.
+
+        Snapshots are cached per worker and invalidated through the registry
+        cache signaling whenever a validator is created, modified or deleted.
+        """
+        self.ensure_one()
+        return self._get_validator_snapshot(self.id)
+
+    def _get_jwks_cache(self):
+        """Return the JWKS cache of this validator, shared by the worker."""
+        self.ensure_one()
+        return get_jwks_cache(
+            (self.env.cr.dbname, self.id),
+            self.public_key_jwk_uri,
+            max_age=self.public_key_jwk_max_age,
+            min_refresh_interval=self.public_key_jwk_min_refresh_interval,
+        )
+
+    def _get_token_cache(self, snapshot_values):
+        """Return the verified token cache of this validator, or None.
+
+        The cache is shared by the worker and emptied when the validator
+        configuration changes, or when the cached user ids may be outdated
+        (see auth.jwt.user.mapping _invalidate_user_cache()).
+        """
+        self.ensure_one()
+        if snapshot_values["token_cache_size"] <= 0:
+            return None
+        generation = self.env["auth.jwt.user.mapping"]._get_user_cache_generation()
+        return get_cache(
+            ("auth_jwt.token", self.env.cr.dbname, self.id),
+            version=(hash(repr(sorted(snapshot_values.items()))), generation),
+            maxsize=snapshot_values["token_cache_size"],
+        )
+
+    @api.model
+    def _get_token_cache_key(self, token, secret=None):
+        # A token received in a cookie must not be accepted as a bearer token.
+        return (bool(secret), hashlib.sha256(token.encode()).digest())
+
+    def _get_cached_token(self, token, secret=None):
+        """Return (payload, uid, partner_id) for a token that was already
+        verified by this validator, or None."""
+        cache = self._get_snapshot().token_cache
+        if cache is None:
+            return None
+        cached = cache.get(self._get_token_cache_key(token, secret))
+        if metrics.enabled:
+            metrics.increment(
+                "auth_jwt_token_cache_total",
+                self._get_metrics_labels(result="miss" if cached is None else "hit"),
+            )
+        if cached is None:
+            return None
+        payload, uid, partner_id = cached
+        if self._is_revoked(payload):
+            return None
+        return dict(payload), uid, partner_id
+
+    def _cache_token(self, token, secret, payload, uid, partner_id):
+        """Remember a verified token until min(exp, now + token_cache_ttl)."""
+        snapshot = self._get_snapshot()
+        if snapshot.token_cache is None:
+            return
+        snapshot.token_cache.set(
+            self._get_token_cache_key(token, secret),
+            (dict(payload), uid, partner_id),
+            min(payload["exp"], time.time() + snapshot.token_cache_ttl),
+        )
+
     def _get_key(self, kid):
-        jwks_client = PyJWKClient(self.public_key_jwk_uri, cache_keys=False)
-        return jwks_client.get_signing_key(kid).key
+        """Return the public key for kid, without network I/O.
+
+        Raise UnauthorizedUnknownKid if the key is not (yet) known.
+        """
+        return self._get_snapshot().jwks_cache.get_signing_key(kid)
 
     def _encode(self, payload, secret, expire):
         """Encode and sign a JWT payload so it can be decoded and validated with
@@ -170,129 +503,493 @@ class AuthJwtValidator(models.Model):
         The aud and iss claims are set to this validator's values.
         The exp claim is set according to the expire parameter.
         """
+        snapshot = self._get_snapshot()
         payload = dict(
             payload,
             exp=timegm(datetime.datetime.utcnow().utctimetuple()) + expire,
-            aud=self.audience,
-            iss=self.issuer,
+            aud=",".join(snapshot.audiences),
+            iss=snapshot.issuer,
         )
         return jwt.encode(payload, key=secret, algorithm="HS256")
 
+    def _get_metrics_labels(self, **labels):
+        return dict(labels, db=self.env.cr.dbname, validator=self._get_snapshot().name)
+
+    @api.model
+    def _get_error_code(self, error):
+        """Return the code of the reason why a token was rejected with error:
+        expired, bad_signature, unknown_kid, revoked or invalid."""
+        if isinstance(error, UnauthorizedRevokedToken):
+            return "revoked"
+        if isinstance(error, UnauthorizedUnknownKid):
+            return "unknown_kid"
+        if isinstance(error.__cause__, jwt.ExpiredSignatureError):
+            return "expired"
+        if isinstance(error.__cause__, jwt.InvalidSignatureError):
+            return "bad_signature"
+        return "invalid"
+
     def _decode(self, token, secret=None):
-        """Validate and decode a JWT token, return the payload."""
-        if secret:
-            key = secret
-            algorithm = "HS256"
-        elif self.signature_type == "secret":
-            key = self.secret_key
-            algorithm = self.secret_algorithm
-        else:
-            try:
-                header = jwt.get_unverified_header(token)
-            except Exception as e:
-                _logger.info("Invalid token: %s", e)
-                raise UnauthorizedInvalidToken() from e
-            key = self._get_key(header.get("kid"))
-            algorithm = self.public_key_algorithm
+        """Validate and decode a JWT token, return the payload.
+
+        The outcome and duration of the validation are recorded in the
+        metrics sinks, if any.
+        """
+        if not metrics.enabled:
+            return self._decode_token(token, secret=secret)
+        outcome = "error"
+        start = time.perf_counter()
         try:
-            payload = jwt.decode(
-                token,
-                key=key,
-                algorithms=[algorithm],
-                options=dict(
-                    require=["exp", "aud", "iss"],
-                    verify_exp=True,
-                    verify_aud=True,
-                    verify_iss=True,
-                ),
-                audience=self.audience.split(","),
-                issuer=self.issuer,
+            payload = self._decode_token(token, secret=secret)
+        except Unauthorized as e:
+            outcome = self._get_error_code(e)
+            raise
+        else:
+            outcome = "verified"
+        finally:
+            labels = self._get_metrics_labels()
+            metrics.observe(
+                "auth_jwt_decode_seconds", labels, time.perf_counter() - start
             )
-        except Exception as e:
-            _logger.info("Invalid token: %s", e)
-            raise UnauthorizedInvalidToken() from e
+            metrics.increment("auth_jwt_decode_total", dict(labels, outcome=outcome))
         return payload
 
+    def _decode_token(self, token, secret=None):
+        """Validate and decode a JWT token, return the payload."""
+        return self._get_snapshot().verifier.verify(token, secret=secret)
+
+    def _get_decode_key(self, kid, secret=None):
+        """Return the (key, algorithm) to verify tokens signed with kid, or
+        with secret when it is set (cookies)."""
+        return self._get_snapshot().verifier.get_key(kid, secret=secret)
+
+    def _parse_secret_key_ring(self):
+        """Return the secret key ring as a dict mapping kids to secrets, in
+        order, the first one being the active secret."""
+        key_ring = {}
+        for line in (self.secret_key_ring or "").splitlines():
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            kid, sep, secret = (part.strip() for part in line.partition("="))
+            if not sep or not kid or not secret:
+                raise ValueError(_("expected kid=secret lines"))
+            if kid in key_ring:
+                raise ValueError(_("duplicate kid %s") % (kid,))
+            key_ring[kid] = secret
+        return key_ring
+
+    def _get_secret_key(self, kid):
+        return self._get_snapshot().verifier.get_secret_key(kid)
+
+    def _get_active_secret_key(self):
+        """Return the (kid, secret) to sign tokens with: the first secret of
+        the key ring, or (None, key) without key ring."""
+        return self._get_snapshot().verifier.get_active_secret_key()
+
+    def _decode_with_key(self, token, key, algorithm):
+        return self._get_snapshot().verifier.verify_with_key(token, key, algorithm)
+
+    def _is_revoked(self, payload):
+        """Return whether the token of payload was revoked, according to the
+        revocation list of the worker (see
+        auth.jwt.revoked.token._get_revocation_list())."""
+        return self._get_snapshot().verifier.is_revoked(payload)
+
+    @api.model
+    def _get_verifier(self, validator_name):
+        """Return the JwtVerifier of the validator named validator_name.
+
+        The verifier does not need a database cursor, so it can be used
+        outside of the request cycle, in any thread. The revocation list of
+        the worker is refreshed, so call this method again from time to time
+        to take new revocations and configuration changes into account.
+        """
+        self.env["auth.jwt.revoked.token"]._get_revocation_list()
+        return (
+            self.browse(self._get_validator_id_by_name(validator_name))
+            ._get_snapshot()
+            .verifier
+        )
+
+    def _decode_many(self, tokens):
+        """Validate and decode a batch of bearer tokens with this validator
+        and its fallback validators.
+
+        The tokens are routed to the validators of the chain by issuer, then
+        grouped by validator and key id, so that each key is looked up once,
+        and the groups are verified in the worker thread pool. A token
+        rejected by a validator is tried with the next validator of the
+        chain accepting its issuer.
+
+        Return, in the order of tokens, a dict per token with either the
+        ``validator`` name and the ``payload`` of a valid token, or the
+        ``error`` code (see _get_error_code()) of an invalid one.
+        """
+        self.ensure_one()
+        self.env["auth.jwt.revoked.token"]._get_revocation_list()
+        snapshot = self._get_snapshot()
+        chain = self.browse(snapshot.chain_ids)
+        results = {}
+        errors = {}
+        # token: (kid, ids of the validators that may still accept it)
+        pending = {}
+        for token in set(tokens):
+            for validator in chain:
+                cached = validator._get_cached_token(token)
+                if cached:
+                    results[token] = {
+                        "validator": validator._get_snapshot().name,
+                        "payload": cached[0],
+                    }
+                    break
+            else:
+                issuer, kid = self._get_unverified_routing_claims(token)
+                candidates = snapshot.issuer_index.get(issuer)
+                if candidates:
+                    pending[token] = (kid, candidates)
+                else:
+                    _logger.info("Invalid token: issuer %r not accepted", issuer)
+                    results[token] = {"error": "invalid"}
+
+        executor = _get_executor()
+        while pending:
+            groups = {}
+            for token, (kid, candidates) in pending.items():
+                groups.setdefault((candidates[0], kid), []).append(token)
+            batches = []
+            for (validator_id, kid), group in groups.items():
+                validator = self.browse(validator_id)
+                try:
+                    key, algorithm = validator._get_decode_key(kid)
+                except Unauthorized as e:
+                    batches.append((validator, group, None, e))
+                    continue
+                for i in range(0, len(group), DECODE_MANY_CHUNK_SIZE):
+                    chunk = group[i : i + DECODE_MANY_CHUNK_SIZE]
+                    future = executor.submit(
+                        _decode_chunk, validator, key, algorithm, chunk
+                    )
+                    batches.append((validator, chunk, future, None))
+
+            next_pending = {}
+            for validator, group, future, error in batches:
+                outcomes = future.result() if future else [error] * len(group)
+                for token, outcome in zip(group, outcomes):
+                    if not isinstance(outcome, Unauthorized):
+                        code = "verified"
+                        results[token] = {
+                            "validator": validator._get_snapshot().name,
+                            "payload": outcome,
+                        }
+                    else:
+                        code = self._get_error_code(outcome)
+                        # report the error of the first validator tried
+                        errors.setdefault(token, code)
+                        kid, candidates = pending[token]
+                        if len(candidates) > 1:
+                            next_pending[token] = (kid, candidates[1:])
+                        else:
+                            results[token] = {"error": errors[token]}
+                    if metrics.enabled:
+                        metrics.increment(
+                            "auth_jwt_decode_total",
+                            validator._get_metrics_labels(outcome=code),
+                        )
+            pending = next_pending
+        return [results[token] for token in tokens]
+
+    @api.model
+    def _get_unverified_routing_claims(self, token):
+        """Return the iss claim and kid header of a token, without validating
+        the token. Values that are not strings are returned as None, so that
+        the token is rejected as invalid."""
+        try:
+            header = jwt.get_unverified_header(token)
+            claims = jwt.decode(token, options=dict(verify_signature=False))
+        except Exception:
+            return None, None
+        issuer, kid = claims.get("iss"), header.get("kid")
+        return (
+            issuer if isinstance(issuer, str) else None,
+            kid if isinstance(kid, str) else None,
+        )
+
+    def _route_candidates(self, candidates, errors):
+        """Select the validators of this validator's chain that may accept a
+        token, according to the issuer index of the chain and the key ids
+        known by the validators using a public key.
+
+        candidates is a list of (validator, token, secret) tuples. Candidates
+        that cannot accept their token are rejected without verifying the
+        token signature, and their error is stored in the errors dict.
+        """
+        index = self._get_snapshot().issuer_index
+        routing_claims = {}
+        routed = []
+        for validator, token, secret in candidates:
+            if token not in routing_claims:
+                routing_claims[token] = self._get_unverified_routing_claims(token)
+            issuer, kid = routing_claims[token]
+            snapshot = validator._get_snapshot()
+            if validator.id not in index.get(issuer, ()):
+                _logger.info(
+                    "Invalid token: issuer %r not accepted by validator %s",
+                    issuer,
+                    snapshot.name,
+                )
+                errors[validator] = UnauthorizedInvalidToken()
+                continue
+            if snapshot.jwks_cache is not None and not secret:
+                try:
+                    snapshot.jwks_cache.get_signing_key(kid)
+                except UnauthorizedUnknownKid as e:
+                    errors[validator] = e
+                    continue
+            routed.append((validator, token, secret))
+        return routed
+
+    @api.model
+    def _decode_candidates(self, candidates):
+        """Decode (validator, token, secret) candidates, in order.
+
+        Yield (validator, token, secret, result) tuples where result is the
+        payload or the Unauthorized error raised by _decode(). When several
+        candidates remain and one of them verifies signatures with a public
+        key, the candidates are decoded concurrently, but still yielded in
+        order so that the first candidate accepting its token wins.
+        """
+        if len(candidates) > 1 and any(
+            validator._get_snapshot().signature_type == "public_key"
+            for validator, _token, _secret in candidates
+        ):
+            executor = _get_executor()
+            futures = [
+                executor.submit(_decode_catching, validator, token, secret)
+                for validator, token, secret in candidates
+            ]
+            try:
+                for candidate, future in zip(candidates, futures):
+                    yield candidate + (future.result(),)
+            finally:
+                for future in futures:
+                    future.cancel()
+        else:
+            for validator, token, secret in candidates:
+                yield (validator, token, secret) + (
+                    _decode_catching(validator, token, secret),
+                )
+
+    def _get_user_id_claim(self):
+        """Return the name of the claim identifying users, if any."""
+        if self.user_id_strategy == "claim":
+            return self.user_id_claim
+        if self.user_id_strategy in ("sub", "email"):
+            return self.user_id_strategy
+        return None
+
     def _get_uid(self, payload):
         # override for additional strategies
-        if self.user_id_strategy == "static":
-            return self.static_user_id.id
+        snapshot = self._get_snapshot()
+        if snapshot.user_id_strategy == "static":
+            return snapshot.static_user_id
+        if snapshot.user_id_claim:
+            claim_value = payload.get(snapshot.user_id_claim)
+            if not claim_value or not isinstance(claim_value, (str, int)):
+                _logger.info(
+                    "JWT payload does not have a %s claim", snapshot.user_id_claim
+                )
+                return None
+            claim_value = str(claim_value)
+            if snapshot.user_id_strategy == "email":
+                claim_value = normalize_email(claim_value)
+            Mapping = self.env["auth.jwt.user.mapping"]
+            uid = Mapping._get_uid(snapshot.id, claim_value)
+            if uid is None:
+                uid = self._map_user(claim_value, payload)
+            return uid
+
+    def _map_user(self, claim_value, payload):
+        """Map claim_value to a user, found by email for the email strategy
+        if email matching is enabled, or created from the template user if
+        user provisioning is enabled.
+
+        The user and its mapping are created in a savepoint of the request
+        cursor. A separate cursor is not used: request transactions run with
+        the repeatable read isolation level, so they may not see a user
+        committed by another cursor after they started.
+        """
+        snapshot = self._get_snapshot()
+        user = self.env["res.users"]
+        if snapshot.user_id_strategy == "email" and snapshot.user_email_matching:
+            user = self._find_user_by_email(claim_value)
+        if not user and not snapshot.user_provisioning:
+            _logger.info(
+                "No user for %s %r on validator %s",
+                snapshot.user_id_claim,
+                claim_value,
+                snapshot.name,
+            )
+            return None
+        try:
+            with self.env.cr.savepoint():
+                if not user:
+                    user = self._provision_user(claim_value, payload)
+                self.env["auth.jwt.user.mapping"].create(
+                    {
+                        "validator_id": snapshot.id,
+                        "claim_value": claim_value,
+                        "user_id": user.id,
+                    }
+                )
+        except (psycopg2.IntegrityError, ValidationError):
+            # mapped or created concurrently by another request, or the login
+            # is already used
+            _logger.info(
+                "Could not map %s %r on validator %s",
+                snapshot.user_id_claim,
+                claim_value,
+                snapshot.name,
+                exc_info=True,
+            )
+            return None
+        return user.id
+
+    @api.model
+    def _find_user_by_email(self, email):
+        """Return the only active user whose login or email is email, case
+        insensitively."""
+        self.env["res.users"].flush_model(["login", "active"])
+        self.env["res.partner"].flush_model(["email"])
+        self.env.cr.execute(
+            """
+            SELECT u.id
+            FROM res_users u
+            JOIN res_partner p ON p.id = u.partner_id
+            WHERE u.active AND (lower(u.login) = %s OR lower(p.email) = %s)
+            """,
+            (email, email),
+        )
+        user_ids = [row[0] for row in self.env.cr.fetchall()]
+        if len(user_ids) != 1:
+            _logger.debug("%d users found for email %s", len(user_ids), email)
+            return self.env["res.users"]
+        return self.env["res.users"].browse(user_ids)
+
+    def _prepare_provisioned_user_values(self, claim_value, payload):
+        email = payload.get("email")
+        login = email or claim_value
+        return {
+            "name": payload.get("name") or login,
+            "login": login,
+            "email": email,
+            "active": True,
+        }
+
+    def _provision_user(self, claim_value, payload):
+        """Create the user identified by claim_value, as a copy of the
+        template user."""
+        template = (
+            self.env["res.users"]
+            .with_context(active_test=False)
+            .browse(self._get_snapshot().user_template_id)
+        )
+        user = template.with_context(no_reset_password=True).copy(
+            self._prepare_provisioned_user_values(claim_value, payload)
+        )
+        _logger.info("Created user %s for JWT subject %r", user.login, claim_value)
+        return user
 
     def _get_and_check_uid(self, payload):
         uid = self._get_uid(payload)
         if not uid:
+            if self._get_snapshot().user_id_strategy != "static":
+                raise UnauthorizedUserNotFound()
             _logger.error("_get_uid did not return a user id")
             raise InternalServerError()
         return uid
 
     def _get_partner_id(self, payload):
         # override for additional strategies
-        if self.partner_id_strategy == "email":
+        if self._get_snapshot().partner_id_strategy == "email":
             email = payload.get("email")
             if not email:
                 _logger.debug("JWT payload does not have an email claim")
                 return
-            partner = self.env["res.partner"].search([("email", "=", email)])
-            if len(partner) != 1:
-                _logger.debug("%d partners found for email %s", len(partner), email)
-                return
-            return partner.id
+            return self._get_partner_ids_by_email([email])[normalize_email(email)]
+
+    @api.model
+    def _get_partner_ids_by_email(self, emails):
+        """Resolve emails to partner ids, in batch.
+
+        Return a dict mapping each normalized email to the id of the only
+        partner having this email, or None.
+        """
+        result = {}
+        matches = self.env["res.partner"]._auth_jwt_get_partner_ids_by_email(emails)
+        for email, partner_ids in matches.items():
+            if len(partner_ids) != 1:
+                _logger.debug("%d partners found for email %s", len(partner_ids), email)
+                result[email] = None
+            else:
+                result[email] = partner_ids[0]
+        return result
 
     def _get_and_check_partner_id(self, payload):
         partner_id = self._get_partner_id(payload)
-        if not partner_id and self.partner_id_required:
+        if not partner_id and self._get_snapshot().partner_id_required:
             raise UnauthorizedPartnerNotFound()
         return partner_id
 
     def _register_hook(self):
         res = super()._register_hook()
-        self.search([])._register_auth_method()
+        metrics.configure()
+        self.env["auth.jwt.revoked.token"]._get_revocation_list()
+        self.search([("signature_type", "=", "public_key")])._warm_jwks_caches()
         return res
 
-    def _register_auth_method(self):
-        IrHttp = self.env["ir.http"]
-        for rec in self:
-            setattr(
-                IrHttp.__class__,
-                f"_auth_method_jwt_{rec.name}",
-                partial(IrHttp.__class__._auth_method_jwt, validator_name=rec.name),
-            )
-            setattr(
-                IrHttp.__class__,
-                f"_auth_method_public_or_jwt_{rec.name}",
-                partial(
-                    IrHttp.__class__._auth_method_public_or_jwt, validator_name=rec.name
-                ),
-            )
-
-    def _unregister_auth_method(self):
-        IrHttp = self.env["ir.http"]
-        for rec in self:
-            try:
-                delattr(IrHttp.__class__, f"_auth_method_jwt_{rec.name}")
-                delattr(IrHttp.__class__, f"_auth_method_public_or_jwt_{rec.name}")
-            except AttributeError:  # pylint: disable=except-pass
-                pass
+    def _warm_jwks_caches(self):
+        """Load the public keys in the background, before the first request."""
+        for rec in self.filtered(lambda r: r.signature_type == "public_key"):
+            rec._get_snapshot().jwks_cache.warm()
 
     @api.model_create_multi
     def create(self, vals):
         rec = super().create(vals)
-        rec._register_auth_method()
+        self.clear_caches()
+        rec._warm_jwks_caches()
         return rec
 
     def write(self, vals):
-        if "name" in vals:
-            self._unregister_auth_method()
         res = super().write(vals)
-        self._register_auth_method()
+        self.clear_caches()
+        self._warm_jwks_caches()
         return res
 
     def unlink(self):
-        self._unregister_auth_method()
-        return super().unlink()
+        res = super().unlink()
+        self.clear_caches()
+        return res
+
+    def _must_renew_cookie(self, payload, from_cookie):
+        """Tell if the cookie must be (re)issued for a request authenticated
+        with payload.
+
+        A request authenticated with a cookie that is still far from its
+        expiration time reuses it, to avoid signing a new token and
+        rewriting the cookie on every request.
+        """
+        threshold = self._get_snapshot().cookie_renew_threshold
+        if not from_cookie or threshold <= 0:
+            return True
+        return payload["exp"] - time.time() < threshold
+
+    @api.model
+    def _get_database_secret(self):
+        return self.env["ir.config_parameter"].sudo().get_param("database.secret")
 
     def _get_jwt_cookie_secret(self):
-        secret = self.env["ir.config_parameter"].sudo().get_param("database.secret")
+        secret = self._get_snapshot().cookie_secret
         if not secret:
             _logger.error("database.secret system parameter is not set.")
             raise ConfigurationError()
@@ -2,10 +2,13 @@
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
 
 import logging
+import time
+from functools import lru_cache
 
 from odoo import SUPERUSER_ID, api, models
 from odoo.http import request
 
+from .. import metrics
 from ..exceptions import (
     ConfigurationError,
     Unauthorized,
@@ -17,6 +20,24 @@ from ..exceptions import (
 
 _logger = logging.getLogger(__name__)
 
+JWT_AUTH_METHODS = ("public_or_jwt", "jwt")
+
+
+@lru_cache(maxsize=1024)
+def parse_jwt_auth(auth):
+    """Parse the auth parameter of a route.
+
+    Return an (auth method, validator name) tuple for ``jwt``,
+    ``public_or_jwt``, ``jwt_<validator name>`` and
+    ``public_or_jwt_<validator name>``, None for other auth parameters.
+    """
+    for method in JWT_AUTH_METHODS:
+        if auth == method:
+            return method, None
+        if auth.startswith(method + "_"):
+            return method, auth[len(method) + 1 :]
+    return None
+
 
 class IrHttpJwt(models.AbstractModel):
 
@@ -31,12 +52,7 @@ class IrHttpJwt(models.AbstractModel):
         When migrating, review this method carefully by reading the original
         _authenticate method and make sure the conditions have not changed.
         """
-        auth_method = endpoint.routing["auth"]
-        if (
-            auth_method in ("jwt", "public_or_jwt")
-            or auth_method.startswith("jwt_")
-            or auth_method.startswith("public_or_jwt_")
-        ):
+        if parse_jwt_auth(endpoint.routing["auth"]):
             if request.session.uid:
                 _logger.warning(
                     'A route with auth="jwt" must not be used within a user session.'
@@ -53,19 +69,93 @@ class IrHttpJwt(models.AbstractModel):
         return super()._authenticate(endpoint)
 
     @classmethod
-    def _get_jwt_payload(cls, validator):
-        """Obtain and validate the JWT payload from the request authorization header or
-        cookie."""
+    def _authenticate_explicit(cls, auth):
+        """Dispatch the jwt auth methods to _auth_method_jwt and
+        _auth_method_public_or_jwt, with the validator name of the route."""
+        jwt_auth = parse_jwt_auth(auth)
+        if jwt_auth is None:
+            return super()._authenticate_explicit(auth)
+        auth_method, validator_name = jwt_auth
+        return getattr(cls, f"_auth_method_{auth_method}")(
+            validator_name=validator_name
+        )
+
+    @classmethod
+    def routing_map(cls, key=None):
+        """Parse the auth parameter of the routes when building the routing
+        map, so that requests never parse it."""
+        routing_map = super().routing_map(key=key)
+        for rule in routing_map.iter_rules():
+            parse_jwt_auth(rule.endpoint.routing["auth"])
+        return routing_map
+
+    @classmethod
+    def _get_jwt_validator(cls, env, validator_name):
+        """Return the validator for validator_name, without database access
+        once its snapshot is cached in the worker."""
+        Validator = env["auth.jwt.validator"]
+        return Validator.browse(Validator._get_validator_id_by_name(validator_name))
+
+    @classmethod
+    def _get_jwt_token(cls, validator):
+        """Obtain the JWT token from the request authorization header or cookie.
+
+        Return a (token, secret) tuple where secret is the secret to decode
+        the token with when it comes from the cookie, None otherwise.
+        """
         try:
             token = cls._get_bearer_token()
             assert token
-            return validator._decode(token)
+            return token, None
         except UnauthorizedMissingAuthorizationHeader:
-            if not validator.cookie_enabled:
+            snapshot = validator._get_snapshot()
+            if not snapshot.cookie_enabled:
                 raise
-            token = cls._get_cookie_token(validator.cookie_name)
+            token = cls._get_cookie_token(snapshot.cookie_name)
             assert token
-            return validator._decode(token, secret=validator._get_jwt_cookie_secret())
+            return token, validator._get_jwt_cookie_secret()
+
+    @classmethod
+    def _get_jwt_payload(cls, validator):
+        """Obtain and validate the JWT payload from the request authorization header or
+        cookie."""
+        token, secret = cls._get_jwt_token(validator)
+        return validator._decode(token, secret=secret)
+
+    @classmethod
+    def _evaluate_jwt_chain(cls, validator):
+        """Find the first validator of the chain accepting the request token.
+
+        Return a (validator, token, secret, payload, cached) tuple, where
+        cached is the cached verification result of the token, if any.
+        The chain is resolved in the validator snapshot, so walking it does
+        not need any database access.
+        """
+        validator.env["auth.jwt.revoked.token"]._get_revocation_list()
+        chain = validator.browse(validator._get_snapshot().chain_ids)
+        errors = {}
+        candidates = []
+        for link in chain:
+            try:
+                token, secret = cls._get_jwt_token(link)
+            except Unauthorized as e:
+                errors[link] = e
+                continue
+            cached = link._get_cached_token(token, secret=secret)
+            if cached:
+                return link, token, secret, cached[0], cached
+            candidates.append((link, token, secret))
+
+        candidates = validator._route_candidates(candidates, errors)
+        for link, token, secret, result in validator._decode_candidates(candidates):
+            if not isinstance(result, Unauthorized):
+                return link, token, secret, result, None
+            errors[link] = result
+
+        exceptions = {link._get_snapshot().name: errors[link] for link in chain}
+        if len(exceptions) == 1:
+            raise list(exceptions.values())[0]
+        raise UnauthorizedCompositeJwtError(exceptions)
 
     @classmethod
     def _auth_method_jwt(cls, validator_name=None):
@@ -73,56 +163,82 @@ class IrHttpJwt(models.AbstractModel):
         assert not request.session.uid
         # # Use request cursor to allow partner creation strategy in validator
         env = api.Environment(request.cr, SUPERUSER_ID, {})
-        validator = env["auth.jwt.validator"]._get_validator_by_name(validator_name)
-        assert len(validator) == 1
+        route_validator = cls._get_jwt_validator(env, validator_name)
 
-        payload = None
-        exceptions = {}
-        while validator:
-            try:
-                payload = cls._get_jwt_payload(validator)
-                break
-            except Unauthorized as e:
-                exceptions[validator.name] = e
-                validator = validator.next_validator_id
-
-        if not payload:
-            if len(exceptions) == 1:
-                raise list(exceptions.values())[0]
-            raise UnauthorizedCompositeJwtError(exceptions)
+        start = time.perf_counter() if metrics.enabled else None
+        try:
+            validator, token, secret, payload, cached = cls._evaluate_jwt_chain(
+                route_validator
+            )
+        except Unauthorized:
+            if start is not None:
+                metrics.increment(
+                    "auth_jwt_requests_total",
+                    route_validator._get_metrics_labels(outcome="rejected"),
+                )
+            raise
 
-        if validator.cookie_enabled:
-            if not validator.cookie_name:
-                _logger.info("Cookie name not set for validator %s", validator.name)
+        snapshot = validator._get_snapshot()
+        if snapshot.cookie_enabled:
+            if not snapshot.cookie_name:
+                _logger.info("Cookie name not set for validator %s", snapshot.name)
                 raise ConfigurationError()
+        if snapshot.cookie_enabled and validator._must_renew_cookie(
+            payload, from_cookie=bool(secret)
+        ):
             request.future_response.set_cookie(
-                key=validator.cookie_name,
+                key=snapshot.cookie_name,
                 value=validator._encode(
                     payload,
                     secret=validator._get_jwt_cookie_secret(),
-                    expire=validator.cookie_max_age,
+                    expire=snapshot.cookie_max_age,
                 ),
-                max_age=validator.cookie_max_age,
-                path=validator.cookie_path or "/",
-                secure=validator.cookie_secure,
+                max_age=snapshot.cookie_max_age,
+                path=snapshot.cookie_path or "/",
+                secure=snapshot.cookie_secure,
                 httponly=True,
             )
 
-        uid = validator._get_and_check_uid(payload)
-        assert uid
-        partner_id = validator._get_and_check_partner_id(payload)
+        if cached:
+            _payload, uid, partner_id = cached
+        else:
+            resolve_start = time.perf_counter() if start is not None else None
+            uid = validator._get_and_check_uid(payload)
+            assert uid
+            partner_id = validator._get_and_check_partner_id(payload)
+            validator._cache_token(token, secret, payload, uid, partner_id)
+            if resolve_start is not None:
+                metrics.observe(
+                    "auth_jwt_resolve_seconds",
+                    validator._get_metrics_labels(),
+                    time.perf_counter() - resolve_start,
+                )
         request.update_env(user=uid)
         request.jwt_payload = payload
         request.jwt_partner_id = partner_id
 
+        if start is not None:
+            labels = route_validator._get_metrics_labels()
+            metrics.observe(
+                "auth_jwt_authenticate_seconds", labels, time.perf_counter() - start
+            )
+            metrics.increment(
+                "auth_jwt_requests_total", dict(labels, outcome="authenticated")
+            )
+            # position of the accepting validator in the chain, 0 being the
+            # validator of the route
+            depth = route_validator._get_snapshot().chain_ids.index(validator.id)
+            metrics.increment(
+                "auth_jwt_fallback_depth_total", dict(labels, depth=depth)
+            )
+
     @classmethod
     def _auth_method_public_or_jwt(cls, validator_name=None):
         if "HTTP_AUTHORIZATION" not in request.httprequest.environ:
             env = api.Environment(request.cr, SUPERUSER_ID, {})
-            validator = env["auth.jwt.validator"]._get_validator_by_name(validator_name)
-            assert len(validator) == 1
-            if not validator.cookie_enabled or not request.httprequest.cookies.get(
-                validator.cookie_name
+            snapshot = cls._get_jwt_validator(env, validator_name)._get_snapshot()
+            if not snapshot.cookie_enabled or not request.httprequest.cookies.get(
+                snapshot.cookie_name
             ):
                 return cls._auth_method_public()
         return cls._auth_method_jwt(validator_name)
@@ -0,0 +1,100 @@
+# Copyright 2021 ACSONE SA/NV
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import time
+
+from odoo import api, models, tools
+
+from ..cache import get_cache
+
+# Partners matching an email are cached per worker. Changes made by other
+# workers are only seen when the entries expire.
+EMAIL_CACHE_SIZE = 10000
+EMAIL_CACHE_TTL = 60
+
+
+def normalize_email(email):
+    return email.strip().lower()
+
+
+class ResPartner(models.Model):
+    _inherit = "res.partner"
+
+    def init(self):
+        res = super().init()
+        tools.create_index(
+            self._cr, "res_partner_auth_jwt_email_index", self._table, ["lower(email)"]
+        )
+        return res
+
+    @api.model
+    def _auth_jwt_get_email_cache(self):
+        return get_cache(
+            ("auth_jwt.partner_email", self.env.cr.dbname),
+            version=None,
+            maxsize=EMAIL_CACHE_SIZE,
+        )
+
+    @api.model
+    def _auth_jwt_get_partner_ids_by_email(self, emails):
+        """Return a dict mapping each normalized email to the ids of the active
+        partners having this email, case insensitively.
+
+        The emails that are not in the worker cache are resolved with a single
+        query, using the lower(email) index.
+        """
+        cache = self._auth_jwt_get_email_cache()
+        result = {}
+        missing = set()
+        for email in map(normalize_email, emails):
+            partner_ids = cache.get(email)
+            if partner_ids is None:
+                missing.add(email)
+            else:
+                result[email] = partner_ids
+        if not missing:
+            return result
+        self.flush_model(["email", "active"])
+        self.env.cr.execute(
+            """
+            SELECT lower(email), array_agg(id ORDER BY id)
+            FROM res_partner
+            WHERE lower(email) IN %s AND active
+            GROUP BY lower(email)
+            """,
+            (tuple(missing),),
+        )
+        found = dict(self.env.cr.fetchall())
+        expires_at = time.time() + EMAIL_CACHE_TTL
+        for email in missing:
+            partner_ids = tuple(found.get(email, ()))
+            cache.set(email, partner_ids, expires_at)
+            result[email] = partner_ids
+        return result
+
+    @api.model
+    def _auth_jwt_invalidate_email_cache(self, emails):
+        cache = self._auth_jwt_get_email_cache()
+        for email in emails:
+            if email:
+                cache.pop(normalize_email(email))
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        partners = super().create(vals_list)
+        self._auth_jwt_invalidate_email_cache(partners.mapped("email"))
+        return partners
+
+    def write(self, vals):
+        if "email" not in vals and "active" not in vals:
+            return super().write(vals)
+        emails = self.mapped("email")
+        res = super().write(vals)
+        self._auth_jwt_invalidate_email_cache(emails + [vals.get("email")])
+        return res
+
+    def unlink(self):
+        emails = self.mapped("email")
+        res = super().unlink()
+        self._auth_jwt_invalidate_email_cache(emails)
+        return res
@@ -0,0 +1,14 @@
+# Copyright 2021 ACSONE SA/NV
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+from odoo import models
+
+
+class ResUsers(models.Model):
+    _inherit = "res.users"
+
+    def write(self, vals):
+        res = super().write(vals)
+        if "active" in vals:
+            self.env["auth.jwt.user.mapping"]._invalidate_user_cache()
+        return res
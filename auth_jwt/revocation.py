@@ -0,0 +1,57 @@
+# Copyright 2021 ACSONE SA/NV
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import threading
+
+_lists = {}
+_lists_lock = threading.Lock()
+
+
+class RevocationList:
+    """In memory copy of the revoked token ids of a database.
+
+    Probing a token is a single lookup in an immutable set, which is
+    replaced as a whole when new revocations are loaded, so that it can be
+    read without lock from any thread. ``scanned_at`` is the time of the
+    last refresh, so that the list can be refreshed incrementally.
+    """
+
+    def __init__(self):
+        self._revoked = frozenset()
+        self._lock = threading.Lock()
+        self.scanned_at = 0
+        # timestamps of the next incremental refresh and full reload
+        self.refresh_at = 0
+        self.reload_at = 0
+
+    def __len__(self):
+        return len(self._revoked)
+
+    def is_revoked(self, validator_id, jti):
+        return (validator_id, jti) in self._revoked
+
+    def add(self, entries):
+        """Add (validator_id, jti) entries."""
+        with self._lock:
+            # incremental refreshes mostly load entries that are already known
+            new_entries = set(entries) - self._revoked
+            if new_entries:
+                self._revoked = self._revoked.union(new_entries)
+
+    def replace(self, entries):
+        """Replace all the entries, dropping the purged ones."""
+        with self._lock:
+            self._revoked = frozenset(entries)
+
+    def reset(self):
+        """Force a full reload on the next refresh."""
+        self.refresh_at = self.reload_at = 0
+
+
+def get_revocation_list(dbname):
+    """Return the worker wide revocation list of database dbname."""
+    with _lists_lock:
+        revocation_list = _lists.get(dbname)
+        if revocation_list is None:
+            revocation_list = _lists[dbname] = RevocationList()
+        return revocation_list
@@ -1 +1,2 @@
 from . import test_auth_jwt
+from . import test_jwks
@@ -0,0 +1,70 @@
+# Copyright 2021 ACSONE SA/NV
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from jwt.algorithms import ECAlgorithm, RSAAlgorithm
+
+
+class _JwksRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        jwks_server = self.server.jwks_server
+        jwks_server.request_count += 1
+        body = json.dumps({"keys": list(jwks_server.keys.values())}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if jwks_server.cache_control:
+            self.send_header("Cache-Control", jwks_server.cache_control)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+class JwksServer:
+    """Local stand-in for the JWKS endpoint of an identity provider."""
+
+    def __init__(self):
+        self.keys = {}
+        self.cache_control = None
+        self.request_count = 0
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), _JwksRequestHandler)
+        self._httpd.jwks_server = self
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def uri(self):
+        host, port = self._httpd.server_address
+        return f"http://{host}:{port}/certs"
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _publish(self, kid, algorithm, jwk):
+        jwk = json.loads(jwk)
+        jwk.update(kid=kid, alg=algorithm, use="sig")
+        self.keys[kid] = jwk
+
+    def add_rsa_key(self, kid, algorithm="RS256"):
+        """Generate and publish a RSA key, return the private key."""
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self._publish(kid, algorithm, RSAAlgorithm.to_jwk(private_key.public_key()))
+        return private_key
+
+    def add_ec_key(self, kid, algorithm="ES256"):
+        """Generate and publish a P-256 EC key, return the private key."""
+        private_key = ec.generate_private_key(ec.SECP256R1())
+        self._publish(kid, algorithm, ECAlgorithm.to_jwk(private_key.public_key()))
+        return private_key
+
+    def remove_key(self, kid):
+        del self.keys[kid]
@@ -1,18 +1,25 @@
 # Copyright 2021 ACSONE SA/NV
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
 
+import asyncio
 import contextlib
+import threading
 import time
+from unittest import mock
 from unittest.mock import Mock
 
 import jwt
+from werkzeug.exceptions import NotFound, Unauthorized
 
 import odoo.http
+from odoo import fields
 from odoo.exceptions import ValidationError
 from odoo.tests.common import TransactionCase
-from odoo.tools import mute_logger
+from odoo.tools import config, mute_logger
 from odoo.tools.misc import DotDict
 
+from .. import metrics
+from ..controllers.main import AuthJwtMetricsController
 from ..exceptions import (
     AmbiguousJwtValidator,
     JwtValidatorNotFound,
@@ -21,12 +28,16 @@ from ..exceptions import (
     UnauthorizedMalformedAuthorizationHeader,
     UnauthorizedMissingAuthorizationHeader,
     UnauthorizedPartnerNotFound,
+    UnauthorizedRevokedToken,
+    UnauthorizedUnknownKid,
+    UnauthorizedUserNotFound,
 )
+from ..models.ir_http import parse_jwt_auth
 
 
 class TestAuthMethod(TransactionCase):
     @contextlib.contextmanager
-    def _mock_request(self, authorization):
+    def _mock_request(self, authorization, cookies=None):
         environ = {}
         if authorization:
             environ["HTTP_AUTHORIZATION"] = authorization
@@ -34,7 +45,7 @@ class TestAuthMethod(TransactionCase):
             context={},
             db=self.env.cr.dbname,
             uid=None,
-            httprequest=Mock(environ=environ),
+            httprequest=Mock(environ=environ, cookies=cookies or {}),
             session=DotDict(),
             env=self.env,
             cr=self.env.cr,
@@ -57,10 +68,16 @@ class TestAuthMethod(TransactionCase):
         exp_delta=100,
         nbf=None,
         email=None,
+        jti=None,
+        sub=None,
     ):
         payload = dict(aud=audience, iss=issuer, exp=time.time() + exp_delta)
         if email:
             payload["email"] = email
+        if sub:
+            payload["sub"] = sub
+        if jti:
+            payload["jti"] = jti
         if nbf:
             payload["nbf"] = nbf
         return jwt.encode(payload, key=key, algorithm="HS256")
@@ -113,7 +130,7 @@ class TestAuthMethod(TransactionCase):
         self._create_validator("validator")
         authorization = "Bearer " + self._create_token()
         with self._mock_request(authorization=authorization):
-            self.env["ir.http"]._auth_method_jwt_validator()
+            self.env["ir.http"]._auth_method_jwt(validator_name="validator")
 
     def test_auth_method_valid_token_two_validators_one_bad_issuer(self):
         self._create_validator("validator2", issuer="http://other.issuer")
@@ -123,9 +140,9 @@ class TestAuthMethod(TransactionCase):
         with self._mock_request(authorization=authorization):
             # first validator rejects the token because of invalid audience
             with self.assertRaises(UnauthorizedInvalidToken):
-                self.env["ir.http"]._auth_method_jwt_validator2()
+                self.env["ir.http"]._auth_method_jwt(validator_name="validator2")
             # second validator accepts the token
-            self.env["ir.http"]._auth_method_jwt_validator3()
+            self.env["ir.http"]._auth_method_jwt(validator_name="validator3")
 
     def test_auth_method_valid_token_two_validators_one_bad_issuer_chained(self):
         validator2 = self._create_validator("validator2", issuer="http://other.issuer")
@@ -136,7 +153,7 @@ class TestAuthMethod(TransactionCase):
         with self._mock_request(authorization=authorization):
             # Validator2 rejects the token because of invalid issuer but chain
             # on validator3 which accepts it
-            self.env["ir.http"]._auth_method_jwt_validator2()
+            self.env["ir.http"]._auth_method_jwt(validator_name="validator2")
 
     def test_auth_method_valid_token_two_validators_one_bad_audience(self):
         self._create_validator("validator2", audience="bad")
@@ -146,9 +163,9 @@ class TestAuthMethod(TransactionCase):
         with self._mock_request(authorization=authorization):
             # first validator rejects the token because of invalid audience
             with self.assertRaises(UnauthorizedInvalidToken):
-                self.env["ir.http"]._auth_method_jwt_validator2()
+                self.env["ir.http"]._auth_method_jwt(validator_name="validator2")
             # second validator accepts the token
-            self.env["ir.http"]._auth_method_jwt_validator3()
+            self.env["ir.http"]._auth_method_jwt(validator_name="validator3")
 
     def test_auth_method_valid_token_two_validators_one_bad_audience_chained(self):
         validator2 = self._create_validator("validator2", audience="bad")
@@ -157,7 +174,15 @@ class TestAuthMethod(TransactionCase):
         validator2.next_validator_id = validator3
         authorization = "Bearer " + self._create_token()
         with self._mock_request(authorization=authorization):
-            self.env["ir.http"]._auth_method_jwt_validator2()
+            self.env["ir.http"]._auth_method_jwt(validator_name="validator2")
+
+    def test_auth_method_invalid_issuer_type(self):
+        self._create_validator("validator")
+        for issuer in (["http://the.issuer"], {"iss": "http://the.issuer"}):
+            authorization = "Bearer " + self._create_token(issuer=issuer)
+            with self._mock_request(authorization=authorization):
+                with self.assertRaises(UnauthorizedInvalidToken):
+                    self.env["ir.http"]._auth_method_jwt(validator_name="validator")
 
     def test_auth_method_invalid_token(self):
         # Test invalid token via _auth_method_jwt
@@ -166,7 +191,7 @@ class TestAuthMethod(TransactionCase):
         authorization = "Bearer " + self._create_token(audience="bad")
         with self._mock_request(authorization=authorization):
             with self.assertRaises(UnauthorizedInvalidToken):
-                self.env["ir.http"]._auth_method_jwt_validator4()
+                self.env["ir.http"]._auth_method_jwt(validator_name="validator4")
 
     def test_auth_method_invalid_token_on_chain(self):
         validator1 = self._create_validator("validator", issuer="http://other.issuer")
@@ -197,7 +222,7 @@ class TestAuthMethod(TransactionCase):
         authorization = "Bearer " + self._create_token()
         with self._mock_request(authorization=authorization):
             with self.assertRaises(UnauthorizedCompositeJwtError) as composite_error:
-                self.env["ir.http"]._auth_method_jwt_validator()
+                self.env["ir.http"]._auth_method_jwt(validator_name="validator")
             self.assertEqual(
                 str(composite_error.exception),
                 "401 Unauthorized: Multiple errors occurred during JWT chain validation:\n"
@@ -267,14 +292,14 @@ class TestAuthMethod(TransactionCase):
         self._create_validator("validator6")
         authorization = "Bearer " + self._create_token(email=partner.email)
         with self._mock_request(authorization=authorization) as request:
-            self.env["ir.http"]._auth_method_jwt_validator6()
+            self.env["ir.http"]._auth_method_jwt(validator_name="validator6")
             self.assertEqual(request.jwt_partner_id, partner.id)
 
     def test_partner_id_strategy_email_not_found(self):
         self._create_validator("validator6")
         authorization = "Bearer " + self._create_token(email="notanemail@example.com")
         with self._mock_request(authorization=authorization) as request:
-            self.env["ir.http"]._auth_method_jwt_validator6()
+            self.env["ir.http"]._auth_method_jwt(validator_name="validator6")
             self.assertFalse(request.jwt_partner_id)
 
     def test_partner_id_strategy_email_not_found_partner_required(self):
@@ -282,7 +307,7 @@ class TestAuthMethod(TransactionCase):
         authorization = "Bearer " + self._create_token(email="notanemail@example.com")
         with self._mock_request(authorization=authorization):
             with self.assertRaises(UnauthorizedPartnerNotFound):
-                self.env["ir.http"]._auth_method_jwt_validator6()
+                self.env["ir.http"]._auth_method_jwt(validator_name="validator6")
 
     def test_get_validator(self):
         AuthJwtValidator = self.env["auth.jwt.validator"]
@@ -347,47 +372,46 @@ class TestAuthMethod(TransactionCase):
         with self.assertRaises(UnauthorizedInvalidToken):
             validator._decode(token)
 
-    def test_auth_method_registration_on_create(self):
-        IrHttp = self.env["ir.http"]
-        self.assertFalse(hasattr(IrHttp.__class__, "_auth_method_jwt_validator1"))
-        self.assertFalse(
-            hasattr(IrHttp.__class__, "_auth_method_public_or_jwt_validator1")
-        )
-        self._create_validator("validator1")
-        self.assertTrue(hasattr(IrHttp.__class__, "_auth_method_jwt_validator1"))
-        self.assertTrue(
-            hasattr(IrHttp.__class__, "_auth_method_public_or_jwt_validator1")
+    def test_parse_jwt_auth(self):
+        self.assertEqual(parse_jwt_auth("jwt"), ("jwt", None))
+        self.assertEqual(parse_jwt_auth("jwt_v1"), ("jwt", "v1"))
+        self.assertEqual(parse_jwt_auth("public_or_jwt"), ("public_or_jwt", None))
+        self.assertEqual(
+            parse_jwt_auth("public_or_jwt_jwt_v1"), ("public_or_jwt", "jwt_v1")
         )
+        self.assertIsNone(parse_jwt_auth("public"))
+        self.assertIsNone(parse_jwt_auth("jwtv1"))
 
-    def test_auth_method_unregistration_on_unlink(self):
+    def test_auth_method_dispatch(self):
         IrHttp = self.env["ir.http"]
-        validator = self._create_validator("validator1")
-        self.assertTrue(hasattr(IrHttp.__class__, "_auth_method_jwt_validator1"))
-        self.assertTrue(
-            hasattr(IrHttp.__class__, "_auth_method_public_or_jwt_validator1")
-        )
-        validator.unlink()
+        self._create_validator("validator1")
+        authorization = "Bearer " + self._create_token()
+        with self._mock_request(authorization=authorization) as request:
+            IrHttp._authenticate_explicit("jwt_validator1")
+            self.assertEqual(request.jwt_payload["aud"], "me")
+        with self._mock_request(authorization=authorization) as request:
+            IrHttp._authenticate_explicit("public_or_jwt_validator1")
+            self.assertEqual(request.jwt_payload["aud"], "me")
+        # no auth method is added to ir.http for validators
         self.assertFalse(hasattr(IrHttp.__class__, "_auth_method_jwt_validator1"))
-        self.assertFalse(
-            hasattr(IrHttp.__class__, "_auth_method_public_or_jwt_validator1")
-        )
 
-    def test_auth_method_registration_on_rename(self):
+    def test_auth_method_dispatch_on_rename(self):
         IrHttp = self.env["ir.http"]
         validator = self._create_validator("validator1")
-        self.assertTrue(hasattr(IrHttp.__class__, "_auth_method_jwt_validator1"))
-        self.assertTrue(
-            hasattr(IrHttp.__class__, "_auth_method_public_or_jwt_validator1")
-        )
+        authorization = "Bearer " + self._create_token()
+        with self._mock_request(authorization=authorization):
+            IrHttp._authenticate_explicit("jwt_validator1")
         validator.name = "validator2"
-        self.assertFalse(hasattr(IrHttp.__class__, "_auth_method_jwt_validator1"))
-        self.assertFalse(
-            hasattr(IrHttp.__class__, "_auth_method_public_or_jwt_validator1")
-        )
-        self.assertTrue(hasattr(IrHttp.__class__, "_auth_method_jwt_validator2"))
-        self.assertTrue(
-            hasattr(IrHttp.__class__, "_auth_method_public_or_jwt_validator2")
-        )
+        with self._mock_request(authorization=authorization):
+            with self.assertRaises(JwtValidatorNotFound):
+                IrHttp._authenticate_explicit("jwt_validator1")
+        with self._mock_request(authorization=authorization) as request:
+            IrHttp._authenticate_explicit("jwt_validator2")
+            self.assertEqual(request.jwt_payload["aud"], "me")
+        validator.unlink()
+        with self._mock_request(authorization=authorization):
+            with self.assertRaises(JwtValidatorNotFound):
+                IrHttp._authenticate_explicit("jwt_validator2")
 
     def test_name_check(self):
         with self.assertRaises(ValidationError):
@@ -397,5 +421,680 @@ class TestAuthMethod(TransactionCase):
         self._create_validator("validator")
         authorization = "Bearer " + self._create_token()
         with self._mock_request(authorization=authorization) as request:
-            self.env["ir.http"]._auth_method_public_or_jwt_validator()
+            self.env["ir.http"]._auth_method_public_or_jwt(validator_name="validator")
             assert request.jwt_payload["aud"] == "me"
+
+    def test_validator_snapshot(self):
+        validator = self._create_validator("validator", audience="a1,a2")
+        snapshot = validator._get_snapshot()
+        self.assertEqual(snapshot.name, "validator")
+        self.assertEqual(snapshot.audiences, ("a1", "a2"))
+        self.assertEqual(snapshot.chain_ids, (validator.id,))
+        self.assertIs(validator._get_snapshot(), snapshot)
+        with self.assertRaises(AttributeError):
+            snapshot.issuer = "http://other.issuer"
+
+    def test_validator_snapshot_invalidation(self):
+        validator = self._create_validator("validator")
+        validator2 = self._create_validator("validator2")
+        token = self._create_token()
+        validator._decode(token)
+        validator.issuer = "http://other.issuer"
+        with self.assertRaises(UnauthorizedInvalidToken):
+            validator._decode(token)
+        validator.next_validator_id = validator2
+        self.assertEqual(
+            validator._get_snapshot().chain_ids, (validator.id, validator2.id)
+        )
+
+    def test_auth_method_cached_validator_no_query(self):
+        self._create_validator("validator")
+        authorization = "Bearer " + self._create_token()
+        with self._mock_request(authorization=authorization):
+            self.env["ir.http"]._auth_method_jwt(validator_name="validator")
+        with self._mock_request(authorization=authorization):
+            with self.assertQueryCount(0):
+                self.env["ir.http"]._auth_method_jwt(validator_name="validator")
+
+    def test_token_cache(self):
+        validator = self._create_validator("validator")
+        validator.token_cache_size = 10
+        partner = self.env["res.partner"].search([("email", "!=", False)])[0]
+        authorization = "Bearer " + self._create_token(email=partner.email)
+        with self._mock_request(authorization=authorization) as request:
+            self.env["ir.http"]._auth_method_jwt(validator_name="validator")
+            self.assertEqual(request.jwt_partner_id, partner.id)
+        with mock.patch.object(
+            type(validator), "_decode", side_effect=AssertionError
+        ), mock.patch.object(
+            type(validator), "_get_partner_id", side_effect=AssertionError
+        ):
+            with self._mock_request(authorization=authorization) as request:
+                self.env["ir.http"]._auth_method_jwt(validator_name="validator")
+                self.assertEqual(request.jwt_partner_id, partner.id)
+                self.assertEqual(request.jwt_payload["email"], partner.email)
+
+    def test_token_cache_disabled(self):
+        validator = self._create_validator("validator")
+        self.assertIsNone(validator._get_snapshot().token_cache)
+        authorization = "Bearer " + self._create_token()
+        with self._mock_request(authorization=authorization):
+            self.env["ir.http"]._auth_method_jwt(validator_name="validator")
+        with mock.patch.object(
+            type(validator), "_decode", side_effect=UnauthorizedInvalidToken
+        ):
+            with self._mock_request(authorization=authorization):
+                with self.assertRaises(UnauthorizedInvalidToken):
+                    self.env["ir.http"]._auth_method_jwt(validator_name="validator")
+
+    def test_token_cache_invalidation(self):
+        validator = self._create_validator("validator")
+        validator.token_cache_size = 10
+        authorization = "Bearer " + self._create_token()
+        with self._mock_request(authorization=authorization):
+            self.env["ir.http"]._auth_method_jwt(validator_name="validator")
+        # the cached token must not be accepted with a new configuration
+        validator.audience = "other"
+        with self._mock_request(authorization=authorization):
+            with self.assertRaises(UnauthorizedInvalidToken):
+                self.env["ir.http"]._auth_method_jwt(validator_name="validator")
+
+    def test_token_cache_user_deactivated(self):
+        validator = self._create_validator("validator")
+        validator.write(dict(token_cache_size=10, user_id_strategy="sub"))
+        user = self._create_user("jwt_cached_user")
+        self.env["auth.jwt.user.mapping"].create(
+            dict(validator_id=validator.id, claim_value="s1", user_id=user.id)
+        )
+        authorization = "Bearer " + self._create_token(sub="s1")
+        with self._mock_request(authorization=authorization) as request:
+            self.env["ir.http"]._auth_method_jwt(validator_name="validator")
+            request.update_env.assert_called_once_with(user=user.id)
+        # the cached token must not authenticate a deactivated user
+        user.active = False
+        with self._mock_request(authorization=authorization):
+            with self.assertRaises(UnauthorizedUserNotFound):
+                self.env["ir.http"]._auth_method_jwt(validator_name="validator")
+
+    def test_token_cache_expiration(self):
+        validator = self._create_validator("validator")
+        validator.write(dict(token_cache_size=10, token_cache_ttl=1000))
+        token = self._create_token(exp_delta=100)
+        payload = validator._decode(token)
+        validator._cache_token(token, None, payload, 1, None)
+        self.assertTrue(validator._get_cached_token(token))
+        self.assertFalse(validator._get_cached_token(token, secret="cookie"))
+        with mock.patch("time.time", return_value=time.time() + 101):
+            self.assertIsNone(validator._get_cached_token(token))
+
+    def test_partner_id_strategy_email_case_insensitive(self):
+        partner = self.env["res.partner"].create(
+            {"name": "Jwt Partner", "email": "Jwt.Partner@Example.com"}
+        )
+        self._create_validator("validator6")
+        authorization = "Bearer " + self._create_token(email="jwt.partner@example.COM")
+        with self._mock_request(authorization=authorization) as request:
+            self.env["ir.http"]._auth_method_jwt(validator_name="validator6")
+            self.assertEqual(request.jwt_partner_id, partner.id)
+
+    def test_partner_id_strategy_email_ambiguous(self):
+        self.env["res.partner"].create(
+            [
+                {"name": "Jwt Partner 1", "email": "jwt.partner@example.com"},
+                {"name": "Jwt Partner 2", "email": "JWT.partner@example.com"},
+            ]
+        )
+        validator = self._create_validator("validator6")
+        self.assertFalse(
+            validator._get_partner_id({"email": "jwt.partner@example.com"})
+        )
+
+    def test_partner_ids_by_email_batch(self):
+        partner1, partner2 = self.env["res.partner"].create(
+            [
+                {"name": "Jwt Partner 1", "email": "jwt.partner1@example.com"},
+                {"name": "Jwt Partner 2", "email": "jwt.partner2@example.com"},
+            ]
+        )
+        emails = [
+            "jwt.partner1@example.com",
+            "JWT.Partner2@example.com",
+            "not-a-partner@example.com",
+        ]
+        AuthJwtValidator = self.env["auth.jwt.validator"]
+        with self.assertQueryCount(1):
+            result = AuthJwtValidator._get_partner_ids_by_email(emails)
+        self.assertEqual(
+            result,
+            {
+                "jwt.partner1@example.com": partner1.id,
+                "jwt.partner2@example.com": partner2.id,
+                "not-a-partner@example.com": None,
+            },
+        )
+        # resolved from the worker cache
+        with self.assertQueryCount(0):
+            AuthJwtValidator._get_partner_ids_by_email(emails)
+
+    def test_partner_email_cache_invalidation(self):
+        partner = self.env["res.partner"].create(
+            {"name": "Jwt Partner", "email": "jwt.partner@example.com"}
+        )
+        validator = self._create_validator("validator6")
+        self.assertEqual(
+            validator._get_partner_id({"email": "jwt.partner@example.com"}),
+            partner.id,
+        )
+        partner.email = "jwt.other@example.com"
+        self.assertFalse(
+            validator._get_partner_id({"email": "jwt.partner@example.com"})
+        )
+        self.assertEqual(
+            validator._get_partner_id({"email": "jwt.other@example.com"}), partner.id
+        )
+        partner.active = False
+        self.assertFalse(validator._get_partner_id({"email": "jwt.other@example.com"}))
+
+    def test_chain_routed_by_issuer(self):
+        validator1 = self._create_validator("validator1", issuer="http://other.issuer")
+        validator2 = self._create_validator("validator2", audience="bad")
+        validator3 = self._create_validator("validator3")
+        validator1.next_validator_id = validator2
+        validator2.next_validator_id = validator3
+        self.assertEqual(
+            dict(validator1._get_snapshot().issuer_index),
+            {
+                "http://other.issuer": (validator1.id,),
+                "http://the.issuer": (validator2.id, validator3.id),
+            },
+        )
+        decoded = []
+        decode = type(validator1)._decode
+
+        def _decode(validator, token, secret=None):
+            decoded.append(validator.name)
+            return decode(validator, token, secret=secret)
+
+        authorization = "Bearer " + self._create_token()
+        with mock.patch.object(type(validator1), "_decode", _decode):
+            with self._mock_request(authorization=authorization) as request:
+                self.env["ir.http"]._auth_method_jwt(validator_name="validator1")
+                self.assertEqual(request.jwt_payload["iss"], "http://the.issuer")
+        # validator1 rejected the token without verifying it
+        self.assertEqual(decoded, ["validator2", "validator3"])
+
+    def test_cookie_sliding_renewal(self):
+        validator = self._create_validator("validator")
+        validator.write(
+            dict(
+                cookie_enabled=True,
+                cookie_name="jwt_cookie",
+                cookie_max_age=1000,
+                cookie_renew_threshold=100,
+            )
+        )
+        authorization = "Bearer " + self._create_token()
+        # a cookie is issued for requests authenticated by the header
+        with self._mock_request(authorization=authorization) as request:
+            self.env["ir.http"]._auth_method_jwt(validator_name="validator")
+            set_cookie = request.future_response.set_cookie
+            set_cookie.assert_called_once()
+            cookie = set_cookie.call_args.kwargs["value"]
+        # a fresh cookie is reused as is
+        with self._mock_request(None, cookies={"jwt_cookie": cookie}) as request:
+            self.env["ir.http"]._auth_method_jwt(validator_name="validator")
+            self.assertEqual(request.jwt_payload["iss"], "http://the.issuer")
+            request.future_response.set_cookie.assert_not_called()
+        # a cookie close to its expiration is renewed
+        with mock.patch("time.time", return_value=time.time() + 950):
+            with self._mock_request(None, cookies={"jwt_cookie": cookie}) as request:
+                self.env["ir.http"]._auth_method_jwt(validator_name="validator")
+                request.future_response.set_cookie.assert_called_once()
+        # without threshold, the cookie is renewed on every request
+        validator.cookie_renew_threshold = 0
+        with self._mock_request(None, cookies={"jwt_cookie": cookie}) as request:
+            self.env["ir.http"]._auth_method_jwt(validator_name="validator")
+            request.future_response.set_cookie.assert_called_once()
+
+    def _add_metrics_sink(self, sink):
+        metrics.add_sink(sink)
+        self.addCleanup(metrics.remove_sink, sink)
+        return sink
+
+    def test_metrics(self):
+        sink = self._add_metrics_sink(Mock(spec=metrics.MetricsSink))
+        validator = self._create_validator("validator")
+        validator2 = self._create_validator("validator2", audience="bad")
+        validator2.next_validator_id = validator
+        db = self.env.cr.dbname
+        with self._mock_request(authorization="Bearer " + self._create_token()):
+            self.env["ir.http"]._auth_method_jwt(validator_name="validator2")
+        sink.increment.assert_any_call(
+            "auth_jwt_decode_total",
+            dict(db=db, validator="validator2", outcome="invalid"),
+        )
+        sink.increment.assert_any_call(
+            "auth_jwt_decode_total",
+            dict(db=db, validator="validator", outcome="verified"),
+        )
+        sink.increment.assert_any_call(
+            "auth_jwt_requests_total",
+            dict(db=db, validator="validator2", outcome="authenticated"),
+        )
+        sink.increment.assert_any_call(
+            "auth_jwt_fallback_depth_total",
+            dict(db=db, validator="validator2", depth=1),
+        )
+        observed = {call.args[0] for call in sink.observe.call_args_list}
+        self.assertEqual(
+            observed,
+            {
+                "auth_jwt_decode_seconds",
+                "auth_jwt_resolve_seconds",
+                "auth_jwt_authenticate_seconds",
+            },
+        )
+
+    def test_metrics_rejection_outcomes(self):
+        sink = self._add_metrics_sink(Mock(spec=metrics.MetricsSink))
+        self._create_validator("validator")
+        for token, outcome in (
+            (self._create_token(exp_delta=-100), "expired"),
+            (self._create_token(key="badsecret"), "bad_signature"),
+        ):
+            sink.reset_mock()
+            with self._mock_request(authorization="Bearer " + token):
+                with self.assertRaises(UnauthorizedInvalidToken):
+                    self.env["ir.http"]._auth_method_jwt(validator_name="validator")
+            labels = dict(db=self.env.cr.dbname, validator="validator")
+            sink.increment.assert_any_call(
+                "auth_jwt_decode_total", dict(labels, outcome=outcome)
+            )
+            sink.increment.assert_any_call(
+                "auth_jwt_requests_total", dict(labels, outcome="rejected")
+            )
+
+    def test_metrics_token_cache(self):
+        sink = self._add_metrics_sink(Mock(spec=metrics.MetricsSink))
+        validator = self._create_validator("validator")
+        validator.token_cache_size = 10
+        authorization = "Bearer " + self._create_token()
+        for _i in range(2):
+            with self._mock_request(authorization=authorization):
+                self.env["ir.http"]._auth_method_jwt(validator_name="validator")
+        labels = dict(db=self.env.cr.dbname, validator="validator")
+        sink.increment.assert_any_call(
+            "auth_jwt_token_cache_total", dict(labels, result="miss")
+        )
+        sink.increment.assert_any_call(
+            "auth_jwt_token_cache_total", dict(labels, result="hit")
+        )
+
+    def test_metrics_disabled(self):
+        validator = self._create_validator("validator")
+        self.assertFalse(metrics.enabled)
+        with mock.patch.object(type(validator), "_get_metrics_labels") as labels:
+            with self._mock_request(authorization="Bearer " + self._create_token()):
+                self.env["ir.http"]._auth_method_jwt(validator_name="validator")
+            labels.assert_not_called()
+
+    def test_metrics_prometheus(self):
+        sink = metrics.PrometheusSink()
+        sink.increment("auth_jwt_decode_total", dict(validator="v", outcome="expired"))
+        sink.increment("auth_jwt_decode_total", dict(validator="v", outcome="expired"))
+        sink.observe("auth_jwt_decode_seconds", dict(validator='a"b'), 0.002)
+        lines = sink.render().splitlines()
+        self.assertIn("# TYPE auth_jwt_decode_total counter", lines)
+        self.assertIn('auth_jwt_decode_total{outcome="expired",validator="v"} 2', lines)
+        self.assertIn("# TYPE auth_jwt_decode_seconds histogram", lines)
+        self.assertIn(
+            'auth_jwt_decode_seconds_bucket{validator="a\\"b",le="0.001"} 0', lines
+        )
+        self.assertIn(
+            'auth_jwt_decode_seconds_bucket{validator="a\\"b",le="0.0025"} 1', lines
+        )
+        self.assertIn(
+            'auth_jwt_decode_seconds_bucket{validator="a\\"b",le="+Inf"} 1', lines
+        )
+        self.assertIn('auth_jwt_decode_seconds_count{validator="a\\"b"} 1', lines)
+
+    def test_metrics_route(self):
+        controller = AuthJwtMetricsController()
+        with self._mock_request(authorization="Bearer s3cret"):
+            # disabled without a prometheus sink or a scraping token
+            with self.assertRaises(NotFound):
+                controller.metrics()
+            self._add_metrics_sink(metrics.PrometheusSink())
+            with self.assertRaises(NotFound):
+                controller.metrics()
+            with mock.patch.dict(config.options, auth_jwt_metrics_token="s3cret"):
+                self.assertEqual(controller.metrics().status_code, 200)
+            with mock.patch.dict(config.options, auth_jwt_metrics_token="other"):
+                with self.assertRaises(Unauthorized):
+                    controller.metrics()
+
+    def test_decode_many(self):
+        validator = self._create_validator("validator")
+        validator2 = self._create_validator("validator2", audience="other")
+        validator.next_validator_id = validator2
+        self._create_validator("validator3", issuer="http://other.issuer")
+        token = self._create_token(email="a@example.com")
+        tokens = [
+            token,
+            self._create_token(exp_delta=-100),
+            self._create_token(key="badsecret"),
+            self._create_token(audience="other"),
+            self._create_token(issuer="http://other.issuer"),
+            "garbage",
+            token,
+        ]
+        results = validator._decode_many(tokens)
+        self.assertEqual(len(results), len(tokens))
+        self.assertEqual(results[0]["validator"], "validator")
+        self.assertEqual(results[0]["payload"]["email"], "a@example.com")
+        self.assertEqual(results[1], {"error": "expired"})
+        self.assertEqual(results[2], {"error": "bad_signature"})
+        # rejected by validator, accepted by its fallback validator2
+        self.assertEqual(results[3]["validator"], "validator2")
+        # validator3 is not in the chain
+        self.assertEqual(results[4], {"error": "invalid"})
+        self.assertEqual(results[5], {"error": "invalid"})
+        self.assertEqual(results[6], results[0])
+
+    def test_decode_many_key_lookup(self):
+        validator = self._create_validator("validator")
+        tokens = [self._create_token(email=f"{i}@example.com") for i in range(10)]
+        _get_decode_key = type(validator)._get_decode_key
+        with mock.patch.object(
+            type(validator),
+            "_get_decode_key",
+            autospec=True,
+            side_effect=_get_decode_key,
+        ) as get_decode_key:
+            results = validator._decode_many(tokens)
+        get_decode_key.assert_called_once()
+        self.assertEqual(
+            [result["payload"]["email"] for result in results],
+            [f"{i}@example.com" for i in range(10)],
+        )
+
+    def test_revoked_token(self):
+        validator = self._create_validator("validator")
+        validator2 = self._create_validator("validator2")
+        token = self._create_token(jti="1")
+        payload = validator._decode(token)
+        self.env["auth.jwt.revoked.token"]._revoke(validator, payload)
+        self.env.cr.postcommit.run()
+        with self.assertRaises(UnauthorizedRevokedToken):
+            validator._decode(token)
+        # other tokens and validators are not affected
+        validator._decode(self._create_token(jti="2"))
+        validator._decode(self._create_token())
+        validator2._decode(token)
+        self.assertEqual(validator._decode_many([token]), [{"error": "revoked"}])
+        with self.assertRaises(ValueError):
+            self.env["auth.jwt.revoked.token"]._revoke(
+                validator, validator._decode(self._create_token())
+            )
+
+    def test_revoked_token_cached(self):
+        validator = self._create_validator("validator")
+        validator.token_cache_size = 10
+        authorization = "Bearer " + self._create_token(jti="1")
+        with self._mock_request(authorization=authorization) as request:
+            self.env["ir.http"]._auth_method_jwt(validator_name="validator")
+        self.env["auth.jwt.revoked.token"]._revoke(validator, request.jwt_payload)
+        self.env.cr.postcommit.run()
+        with self._mock_request(authorization=authorization):
+            with self.assertRaises(UnauthorizedRevokedToken):
+                self.env["ir.http"]._auth_method_jwt(validator_name="validator")
+
+    def test_revocation_list_refresh(self):
+        RevokedToken = self.env["auth.jwt.revoked.token"]
+        validator = self._create_validator("validator")
+        token = self._create_token(jti="1")
+        revocation_list = RevokedToken._get_revocation_list()
+        insert_query = """
+            INSERT INTO auth_jwt_revoked_token
+                (validator_id, jti, expiration, create_date)
+            VALUES (%s, %s, %s, %s)
+        """
+        now = fields.Datetime.now()
+        expiration = fields.Datetime.add(now, hours=1)
+        # revoked by another worker
+        self.env.cr.execute(insert_query, (validator.id, "1", expiration, now))
+        with self.assertQueryCount(0):
+            RevokedToken._get_revocation_list()
+        validator._decode(token)
+        # incremental refresh
+        revocation_list.refresh_at = 0
+        RevokedToken._get_revocation_list()
+        with self.assertRaises(UnauthorizedRevokedToken):
+            validator._decode(token)
+        # revocations created before the last refresh but committed after it
+        # are found by the next incremental refresh
+        token2 = self._create_token(jti="2")
+        created = fields.Datetime.subtract(now, seconds=60)
+        self.env.cr.execute(insert_query, (validator.id, "2", expiration, created))
+        revocation_list.refresh_at = 0
+        RevokedToken._get_revocation_list()
+        with self.assertRaises(UnauthorizedRevokedToken):
+            validator._decode(token2)
+        # deleted revocations are dropped by the next full reload, once the
+        # deletion is committed
+        RevokedToken.search([]).unlink()
+        self.env.cr.postcommit.run()
+        RevokedToken._get_revocation_list()
+        validator._decode(token)
+
+    def test_revoked_token_rollback(self):
+        RevokedToken = self.env["auth.jwt.revoked.token"]
+        validator = self._create_validator("validator")
+        token = self._create_token(jti="1")
+        revocation_list = RevokedToken._get_revocation_list()
+        RevokedToken._revoke(validator, validator._decode(token))
+        # not effective before the commit, so that a rollback does not leave
+        # the token revoked on this worker
+        self.assertFalse(revocation_list.is_revoked(validator.id, "1"))
+        self.env.cr.postcommit.run()
+        self.assertTrue(revocation_list.is_revoked(validator.id, "1"))
+
+    def test_revoked_token_purge(self):
+        RevokedToken = self.env["auth.jwt.revoked.token"]
+        validator = self._create_validator("validator")
+        expired = RevokedToken._revoke(
+            validator, {"jti": "1", "exp": time.time() - 100}
+        )
+        valid = RevokedToken._revoke(validator, {"jti": "2", "exp": time.time() + 100})
+        RevokedToken._cron_purge()
+        self.assertFalse(expired.exists())
+        self.assertTrue(valid.exists())
+
+    def _create_user(self, login, **values):
+        return (
+            self.env["res.users"]
+            .with_context(no_reset_password=True)
+            .create(dict(name=login, login=login, **values))
+        )
+
+    def test_user_id_strategy_sub(self):
+        validator = self._create_validator("validator")
+        validator.user_id_strategy = "sub"
+        user = self._create_user("jwt_sub_user")
+        self.env["auth.jwt.user.mapping"].create(
+            dict(validator_id=validator.id, claim_value="s1", user_id=user.id)
+        )
+        self.assertEqual(validator._get_uid({"sub": "s1"}), user.id)
+        # known subjects are resolved from the worker cache
+        with self.assertQueryCount(0):
+            self.assertEqual(validator._get_uid({"sub": "s1"}), user.id)
+        with self.assertRaises(UnauthorizedUserNotFound):
+            validator._get_and_check_uid({"sub": "s2"})
+        with self.assertRaises(UnauthorizedUserNotFound):
+            validator._get_and_check_uid({})
+        # users deactivated by another worker are not resolved anymore once
+        # the registry caches are invalidated
+        self.env.cr.execute(
+            "UPDATE res_users SET active = false WHERE id = %s", (user.id,)
+        )
+        self.assertEqual(validator._get_uid({"sub": "s1"}), user.id)
+        self.env.registry.clear_caches()
+        with self.assertRaises(UnauthorizedUserNotFound):
+            validator._get_and_check_uid({"sub": "s1"})
+        # and by this worker right away
+        user2 = self._create_user("jwt_sub_user2")
+        self.env["auth.jwt.user.mapping"].create(
+            dict(validator_id=validator.id, claim_value="s2", user_id=user2.id)
+        )
+        self.assertEqual(validator._get_uid({"sub": "s2"}), user2.id)
+        user2.active = False
+        with self.assertRaises(UnauthorizedUserNotFound):
+            validator._get_and_check_uid({"sub": "s2"})
+
+    def test_user_id_strategy_custom_claim(self):
+        validator = self._create_validator("validator")
+        with self.assertRaises(ValidationError):
+            validator.user_id_strategy = "claim"
+        validator.write(dict(user_id_strategy="claim", user_id_claim="oid"))
+        user = self._create_user("jwt_oid_user")
+        self.env["auth.jwt.user.mapping"].create(
+            dict(validator_id=validator.id, claim_value="42", user_id=user.id)
+        )
+        self.assertEqual(validator._get_uid({"oid": 42, "sub": "s1"}), user.id)
+        self.assertFalse(validator._get_uid({"sub": "42"}))
+
+    def test_user_id_strategy_email(self):
+        validator = self._create_validator("validator")
+        validator.user_id_strategy = "email"
+        user = self._create_user("jwt_user@example.com")
+        authorization = "Bearer " + self._create_token(email="JWT_User@example.com")
+        # existing users are only matched by email when enabled
+        with self._mock_request(authorization=authorization):
+            with self.assertRaises(UnauthorizedUserNotFound):
+                self.env["ir.http"]._auth_method_jwt(validator_name="validator")
+        self.assertFalse(
+            self.env["auth.jwt.user.mapping"].search(
+                [("validator_id", "=", validator.id)]
+            )
+        )
+        validator.user_email_matching = True
+        with self._mock_request(authorization=authorization) as request:
+            self.env["ir.http"]._auth_method_jwt(validator_name="validator")
+            request.update_env.assert_called_once_with(user=user.id)
+        mapping = self.env["auth.jwt.user.mapping"].search(
+            [("validator_id", "=", validator.id)]
+        )
+        self.assertEqual(mapping.claim_value, "jwt_user@example.com")
+        self.assertEqual(mapping.user_id, user)
+        with self.assertRaises(UnauthorizedUserNotFound):
+            validator._get_and_check_uid({"email": "nobody@example.com"})
+
+    def test_user_provisioning(self):
+        template = self._create_user("jwt_template", active=False)
+        validator = self._create_validator("validator")
+        validator.user_id_strategy = "sub"
+        with self.assertRaises(ValidationError):
+            validator.user_provisioning = True
+        validator.write(dict(user_provisioning=True, user_template_id=template.id))
+        payload = {"sub": "s1", "email": "new@example.com", "name": "New User"}
+        uid = validator._get_and_check_uid(payload)
+        user = self.env["res.users"].browse(uid)
+        self.assertTrue(user.active)
+        self.assertEqual(user.login, "new@example.com")
+        self.assertEqual(user.name, "New User")
+        self.assertEqual(validator._get_and_check_uid(payload), uid)
+        self.assertEqual(
+            self.env["auth.jwt.user.mapping"].search_count(
+                [("validator_id", "=", validator.id)]
+            ),
+            1,
+        )
+        # the login is already used by another user
+        with mute_logger(
+            "odoo.sql_db", "odoo.addons.auth_jwt.models.auth_jwt_validator"
+        ):
+            with self.assertRaises(UnauthorizedUserNotFound):
+                validator._get_and_check_uid(dict(payload, sub="s2"))
+
+    def _create_token_with_kid(self, key, kid):
+        payload = dict(aud="me", iss="http://the.issuer", exp=time.time() + 100)
+        return jwt.encode(payload, key=key, algorithm="HS256", headers={"kid": kid})
+
+    def test_secret_key_ring(self):
+        validator = self._create_validator("validator")
+        validator.secret_key_ring = "k2=secret2\n# comment\n\nk1 = secret1\n"
+        self.assertEqual(validator._get_active_secret_key(), ("k2", "secret2"))
+        validator._decode(self._create_token_with_kid("secret2", "k2"))
+        validator._decode(self._create_token_with_kid("secret1", "k1"))
+        # tokens without kid are verified with the key
+        validator._decode(self._create_token())
+        with self.assertRaises(UnauthorizedUnknownKid):
+            validator._decode(self._create_token_with_kid("secret1", "k3"))
+        with self.assertRaises(UnauthorizedInvalidToken):
+            validator._decode(self._create_token_with_kid("secret1", "k2"))
+        # rotation: k1 is dropped, k3 becomes active
+        validator.secret_key_ring = "k3=secret3\nk2=secret2"
+        with self.assertRaises(UnauthorizedUnknownKid):
+            validator._decode(self._create_token_with_kid("secret1", "k1"))
+        validator._decode(self._create_token_with_kid("secret2", "k2"))
+        validator._decode(self._create_token_with_kid("secret3", "k3"))
+        self.assertEqual(
+            validator._decode_many([self._create_token_with_kid("secret3", "k3")])[0][
+                "validator"
+            ],
+            "validator",
+        )
+
+    def test_secret_key_ring_without_key(self):
+        validator = self._create_validator("validator")
+        validator.write(dict(secret_key=False, secret_key_ring="k1=secret1"))
+        validator._decode(self._create_token(key="secret1"))
+        with self.assertRaises(ValidationError):
+            validator.secret_key_ring = False
+
+    def test_secret_key_ring_check(self):
+        validator = self._create_validator("validator")
+        for key_ring in ("k1", "k1=", "=secret", "k1=s1\nk1=s2"):
+            with self.assertRaises(ValidationError):
+                validator.secret_key_ring = key_ring
+
+    def test_cookie_secret_cached(self):
+        validator = self._create_validator("validator")
+        validator._get_jwt_cookie_secret()
+        with self.assertQueryCount(0):
+            secret = validator._get_jwt_cookie_secret()
+        self.assertEqual(
+            secret, self.env["ir.config_parameter"].get_param("database.secret")
+        )
+        self.env["ir.config_parameter"].set_param("database.secret", "new secret")
+        self.assertEqual(validator._get_jwt_cookie_secret(), "new secret")
+
+    def test_verifier(self):
+        validator = self._create_validator("validator")
+        verifier = self.env["auth.jwt.validator"]._get_verifier("validator")
+        self.assertIs(verifier, validator._get_snapshot().verifier)
+        token = self._create_token(email="a@example.com")
+        self.assertEqual(verifier.verify(token)["email"], "a@example.com")
+        with self.assertRaises(UnauthorizedInvalidToken):
+            verifier.verify(self._create_token(key="badsecret"))
+        # asyncio entry point
+        payload = asyncio.run(verifier.verify_async(token))
+        self.assertEqual(payload["email"], "a@example.com")
+        with self.assertRaises(UnauthorizedInvalidToken):
+            asyncio.run(verifier.verify_async(self._create_token(exp_delta=-100)))
+        # configuration changes give a new verifier
+        validator.audience = "other"
+        self.assertIsNot(
+            self.env["auth.jwt.validator"]._get_verifier("validator"), verifier
+        )
+
+    def test_verifier_without_cursor(self):
+        self._create_validator("validator")
+        verifier = self.env["auth.jwt.validator"]._get_verifier("validator")
+        token = self._create_token(jti="1")
+        results = []
+        thread = threading.Thread(target=lambda: results.append(verifier.verify(token)))
+        with self.assertQueryCount(0):
+            thread.start()
+            thread.join()
+        self.assertEqual(results[0]["jti"], "1")
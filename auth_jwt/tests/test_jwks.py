@@ -0,0 +1,187 @@
+# Copyright 2021 ACSONE SA/NV
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import threading
+import time
+from unittest import mock
+
+import jwt
+import requests
+
+from odoo.tests.common import TransactionCase
+
+from ..exceptions import UnauthorizedInvalidToken, UnauthorizedUnknownKid
+from ..jwks import JwksCache
+from .jwks_server import JwksServer
+
+
+class TestJwks(TransactionCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.jwks_server = JwksServer()
+        cls.jwks_server.start()
+        cls.addClassCleanup(cls.jwks_server.stop)
+        cls.key1 = cls.jwks_server.add_rsa_key("key1")
+
+    def setUp(self):
+        super().setUp()
+        self.jwks_server.request_count = 0
+        self.jwks_server.cache_control = None
+
+    def _create_validator(
+        self, name="validator", min_refresh_interval=60, audience="me"
+    ):
+        validator = self.env["auth.jwt.validator"].create(
+            dict(
+                name=name,
+                signature_type="public_key",
+                public_key_algorithm="RS256",
+                public_key_jwk_uri=self.jwks_server.uri,
+                public_key_jwk_min_refresh_interval=min_refresh_interval,
+                audience=audience,
+                issuer="http://the.issuer",
+                user_id_strategy="static",
+                static_user_id=1,
+            )
+        )
+        # the key set is fetched in the background on creation
+        validator._get_snapshot().jwks_cache.join(10)
+        return validator
+
+    def _create_token(self, private_key, kid, audience="me"):
+        payload = dict(aud=audience, iss="http://the.issuer", exp=time.time() + 100)
+        return jwt.encode(
+            payload, key=private_key, algorithm="RS256", headers={"kid": kid}
+        )
+
+    def test_decode(self):
+        validator = self._create_validator()
+        self.assertEqual(self.jwks_server.request_count, 1)
+        payload = validator._decode(self._create_token(self.key1, "key1"))
+        self.assertEqual(payload["aud"], "me")
+        validator._decode(self._create_token(self.key1, "key1"))
+        self.assertEqual(self.jwks_server.request_count, 1)
+
+    def test_unknown_kid_rate_limited(self):
+        validator = self._create_validator()
+        cache = validator._get_snapshot().jwks_cache
+        for i in range(10):
+            with self.assertRaises(UnauthorizedUnknownKid):
+                validator._decode(self._create_token(self.key1, f"random{i}"))
+            cache.join(10)
+        self.assertEqual(self.jwks_server.request_count, 1)
+
+    def test_unknown_kid_refreshed_in_background(self):
+        validator = self._create_validator(min_refresh_interval=0)
+        cache = validator._get_snapshot().jwks_cache
+        key2 = self.jwks_server.add_rsa_key("key2")
+        self.addCleanup(self.jwks_server.remove_key, "key2")
+        token = self._create_token(key2, "key2")
+        # the request does not wait for the JWKS URI
+        with self.assertRaises(UnauthorizedUnknownKid):
+            validator._decode(token)
+        cache.join(10)
+        self.assertEqual(self.jwks_server.request_count, 2)
+        validator._decode(token)
+
+    def test_rotated_key_dropped(self):
+        validator = self._create_validator(min_refresh_interval=0)
+        cache = validator._get_snapshot().jwks_cache
+        keys = dict(self.jwks_server.keys)
+        self.addCleanup(setattr, self.jwks_server, "keys", keys)
+        key2 = self.jwks_server.add_rsa_key("key2")
+        self.jwks_server.remove_key("key1")
+        self.assertTrue(cache.refresh())
+        with self.assertRaises(UnauthorizedUnknownKid):
+            validator._decode(self._create_token(self.key1, "key1"))
+        validator._decode(self._create_token(key2, "key2"))
+
+    def test_cache_control_max_age(self):
+        self.jwks_server.cache_control = "public, max-age=120"
+        validator = self._create_validator(min_refresh_interval=0)
+        cache = validator._get_snapshot().jwks_cache
+        self.assertAlmostEqual(cache._refresh_at - cache._fetched_at, 96, delta=1)
+        self.jwks_server.cache_control = "no-store"
+        cache.min_refresh_interval = 10
+        self.assertTrue(cache.refresh())
+        self.assertAlmostEqual(cache._refresh_at - cache._fetched_at, 8, delta=1)
+
+    def test_no_network_io_in_request_thread(self):
+        validator = self._create_validator(min_refresh_interval=0)
+        cache = validator._get_snapshot().jwks_cache
+        threads = []
+        real_get = requests.get
+
+        def get(*args, **kwargs):
+            threads.append(threading.current_thread())
+            return real_get(*args, **kwargs)
+
+        with mock.patch("odoo.addons.auth_jwt.jwks.requests.get", side_effect=get):
+            with self.assertRaises(UnauthorizedUnknownKid):
+                validator._decode(self._create_token(self.key1, "unknown"))
+            cache.join(10)
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.current_thread())
+
+    def test_cold_start(self):
+        cache = JwksCache(self.jwks_server.uri)
+        # the first lookup waits for the first fetch instead of rejecting
+        self.assertTrue(cache.get_signing_key("key1"))
+        self.assertEqual(self.jwks_server.request_count, 1)
+        # once loaded, unknown kids are rejected without waiting
+        with self.assertRaises(UnauthorizedUnknownKid):
+            cache.get_signing_key("unknown")
+        self.assertEqual(self.jwks_server.request_count, 1)
+
+    def test_cold_start_failed(self):
+        cache = JwksCache(self.jwks_server.uri)
+        with mock.patch(
+            "odoo.addons.auth_jwt.jwks.requests.get",
+            side_effect=requests.ConnectionError,
+        ) as get:
+            with self.assertRaises(UnauthorizedUnknownKid):
+                cache.get_signing_key("key1")
+            # after a failed fetch, lookups neither wait nor fetch again
+            # before min_refresh_interval
+            with mock.patch.object(cache, "join") as join:
+                with self.assertRaises(UnauthorizedUnknownKid):
+                    cache.get_signing_key("key1")
+                join.assert_not_called()
+            get.assert_called_once()
+
+    def test_chain_concurrent_first_success(self):
+        validator1 = self._create_validator("validator1", audience="a1")
+        validator2 = self._create_validator("validator2", audience="a2")
+        validator3 = self._create_validator("validator3", audience="a2,a3")
+        validator1.next_validator_id = validator2
+        validator2.next_validator_id = validator3
+        Validator = self.env["auth.jwt.validator"]
+        candidates = [
+            (validator, self._create_token(self.key1, "key1", audience="a2"), None)
+            for validator in validator1 + validator2 + validator3
+        ]
+        errors = {}
+        candidates = validator1._route_candidates(candidates, errors)
+        self.assertFalse(errors)
+        results = list(Validator._decode_candidates(candidates))
+        self.assertIsInstance(results[0][3], UnauthorizedInvalidToken)
+        self.assertEqual(results[1][3]["aud"], "a2")
+        self.assertEqual(results[2][3]["aud"], "a2")
+
+    def test_chain_routed_by_kid(self):
+        validator1 = self._create_validator("validator1")
+        validator2 = self._create_validator("validator2")
+        validator1.next_validator_id = validator2
+        # validator2 knows a key that validator1 does not know yet
+        key2 = self.jwks_server.add_rsa_key("key2")
+        self.addCleanup(self.jwks_server.remove_key, "key2")
+        validator2.public_key_jwk_uri = self.jwks_server.uri + "?v2"
+        validator2._get_snapshot().jwks_cache.join(10)
+        token = self._create_token(key2, "key2")
+        errors = {}
+        candidates = validator1._route_candidates(
+            [(validator1, token, None), (validator2, token, None)], errors
+        )
+        self.assertEqual(candidates, [(validator2, token, None)])
+        self.assertIsInstance(errors[validator1], UnauthorizedUnknownKid)
@@ -0,0 +1,153 @@
+# Copyright 2021 ACSONE SA/NV
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import asyncio
+import logging
+
+import jwt  # pylint: disable=missing-manifest-dependency
+
+from .exceptions import (
+    UnauthorizedInvalidToken,
+    UnauthorizedRevokedToken,
+    UnauthorizedUnknownKid,
+)
+from .revocation import get_revocation_list
+
+_logger = logging.getLogger(__name__)
+
+
+class JwtVerifier:
+    """Verification of the tokens of a JWT validator.
+
+    A verifier is built from a validator snapshot and does not need the ORM
+    nor a database cursor, so it can be shared by threads and used outside
+    of the request cycle (bus and longpolling workers, queue jobs...).
+    Public keys are looked up in the JWKS cache of the validator, which
+    never performs network I/O when verifying a token, and revocations in
+    the revocation list of the worker for the database.
+
+    Verifiers are immutable: obtain a new one from
+    ``auth.jwt.validator._get_verifier()`` to take configuration changes
+    into account.
+    """
+
+    __slots__ = (
+        "validator_id",
+        "name",
+        "dbname",
+        "signature_type",
+        "secret_key",
+        "secret_algorithm",
+        "secret_key_ring",
+        "public_key_algorithm",
+        "audiences",
+        "issuer",
+        "jwks_cache",
+    )
+
+    def __init__(self, snapshot, dbname):
+        self.validator_id = snapshot.id
+        self.name = snapshot.name
+        self.dbname = dbname
+        self.signature_type = snapshot.signature_type
+        self.secret_key = snapshot.secret_key
+        self.secret_algorithm = snapshot.secret_algorithm
+        self.secret_key_ring = snapshot.secret_key_ring
+        self.public_key_algorithm = snapshot.public_key_algorithm
+        self.audiences = snapshot.audiences
+        self.issuer = snapshot.issuer
+        self.jwks_cache = snapshot.jwks_cache
+
+    def __repr__(self):
+        return "<JwtVerifier {!r}>".format(self.name)
+
+    def verify(self, token, secret=None):
+        """Validate and decode a token, return the payload.
+
+        secret is the secret to verify the token with when it comes from a
+        cookie. Raise UnauthorizedInvalidToken or one of its subclasses when
+        the token is not valid.
+        """
+        kid = None
+        if not secret and (self.signature_type == "public_key" or self.secret_key_ring):
+            try:
+                kid = jwt.get_unverified_header(token).get("kid")
+            except Exception as e:
+                _logger.info("Invalid token: %s", e)
+                raise UnauthorizedInvalidToken() from e
+        key, algorithm = self.get_key(kid, secret=secret)
+        return self.verify_with_key(token, key, algorithm)
+
+    async def verify_async(self, token, secret=None, executor=None):
+        """Asynchronous version of verify().
+
+        The signature is verified in executor (the default executor of the
+        event loop if None), so that public key verifications do not block
+        the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, self.verify, token, secret)
+
+    def get_key(self, kid, secret=None):
+        """Return the (key, algorithm) to verify tokens signed with kid, or
+        with secret when it is set (cookies)."""
+        if secret:
+            return secret, "HS256"
+        if self.signature_type == "secret":
+            return self.get_secret_key(kid), self.secret_algorithm
+        return self.jwks_cache.get_signing_key(kid), self.public_key_algorithm
+
+    def get_secret_key(self, kid):
+        """Return the secret to verify tokens signed with kid, in constant
+        time, without trying the secrets of the key ring in turn.
+
+        Raise UnauthorizedUnknownKid if kid is not in the key ring.
+        """
+        if kid is None:
+            return self.secret_key or self.get_active_secret_key()[1]
+        secret = self.secret_key_ring.get(kid)
+        if secret is None:
+            if not self.secret_key_ring:
+                # kid headers are ignored without key ring
+                return self.secret_key
+            _logger.info("Unknown key id %r for validator %s", kid, self.name)
+            raise UnauthorizedUnknownKid()
+        return secret
+
+    def get_active_secret_key(self):
+        """Return the (kid, secret) to sign tokens with: the first secret of
+        the key ring, or (None, key) without key ring."""
+        for kid, secret in self.secret_key_ring.items():
+            return kid, secret
+        return None, self.secret_key
+
+    def verify_with_key(self, token, key, algorithm):
+        try:
+            payload = jwt.decode(
+                token,
+                key=key,
+                algorithms=[algorithm],
+                options=dict(
+                    require=["exp", "aud", "iss"],
+                    verify_exp=True,
+                    verify_aud=True,
+                    verify_iss=True,
+                ),
+                audience=self.audiences,
+                issuer=self.issuer,
+            )
+        except Exception as e:
+            _logger.info("Invalid token: %s", e)
+            raise UnauthorizedInvalidToken() from e
+        if self.is_revoked(payload):
+            _logger.info("Revoked token: jti %r", payload["jti"])
+            raise UnauthorizedRevokedToken()
+        return payload
+
+    def is_revoked(self, payload):
+        """Return whether the token of payload was revoked, according to the
+        revocation list of the worker."""
+        jti = payload.get("jti")
+        return bool(jti) and get_revocation_list(self.dbname).is_revoked(
+            self.validator_id, jti
+        )
@@ -1,28 +1,39 @@
 # Copyright 2021 ACSONE SA/NV
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
 
+import json
 import time
 
 import jwt
 
 from odoo import tests
 
+from odoo.addons.auth_jwt.models.ir_http import parse_jwt_auth
+
 
 @tests.tagged("post_install", "-at_install")
 class TestRegisterHook(tests.HttpCase):
     def test_auth_method_exists(self):
         validator = self.env["auth.jwt.validator"].search([("name", "=", "demo")])
         self.assertEqual(len(validator), 1)
-        self.assertTrue(hasattr(self.env["ir.http"].__class__, "_auth_method_jwt_demo"))
+        endpoints = [
+            rule.endpoint
+            for rule in self.env["ir.http"].routing_map().iter_rules()
+            if rule.rule == "/auth_jwt_demo/whoami"
+        ]
+        self.assertEqual(len(endpoints), 1)
+        self.assertEqual(
+            parse_jwt_auth(endpoints[0].routing["auth"]), ("jwt", validator.name)
+        )
 
 
 @tests.tagged("post_install", "-at_install")
 class TestEndToEnd(tests.HttpCase):
-    def _get_token(self, aud=None, email=None):
+    def _get_token(self, aud=None, email=None, iss=None):
         validator = self.env["auth.jwt.validator"].search([("name", "=", "demo")])
         payload = {
             "aud": aud or validator.audience,
-            "iss": validator.issuer,
+            "iss": iss or validator.issuer,
             "exp": time.time() + 60,
         }
         if email:
@@ -74,6 +85,32 @@ class TestEndToEnd(tests.HttpCase):
         cookie = resp.cookies.get("demo_auth")
         self.assertTrue(cookie)
 
+    def _decode_many(self, tokens):
+        resp = self.url_open(
+            "/auth_jwt/decode_many",
+            data=json.dumps({"params": {"validator": "demo", "tokens": tokens}}),
+            headers={"Content-Type": "application/json"},
+        )
+        resp.raise_for_status()
+        return resp.json()
+
+    def test_decode_many(self):
+        """Decode a batch of tokens with the JSON route."""
+        token = self._get_token(email="someone@example.com")[len("Bearer ") :]
+        bad_token = self._get_token(aud="invalid")[len("Bearer ") :]
+        bad_iss_token = self._get_token(iss=["demo"])[len("Bearer ") :]
+        # only the users allowed to read validators can decode tokens
+        self.authenticate("demo", "demo")
+        self.assertIn("error", self._decode_many([token]))
+        self.authenticate("admin", "admin")
+        tokens = [token, bad_token, "garbage", bad_iss_token]
+        results = self._decode_many(tokens)["result"]
+        self.assertEqual(results[0]["validator"], "demo")
+        self.assertEqual(results[0]["payload"]["email"], "someone@example.com")
+        self.assertEqual(results[1], {"error": "invalid"})
+        self.assertEqual(results[2], {"error": "invalid"})
+        self.assertEqual(results[3], {"error": "invalid"})
+
     def test_forbidden(self):
         """A end-to-end test with negative authentication."""
         token = self._get_token(aud="invalid")
@@ -0,0 +1,241 @@
+# Copyright 2021 ACSONE SA/NV
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+"""Benchmark of the auth_jwt request authentication path.
+
+These tests are not run by default. Run them with
+``--test-tags auth_jwt_benchmark``. The number of requests per scenario can be
+set with the ``AUTH_JWT_BENCHMARK_REQUESTS`` environment variable, and the
+results are written as JSON to the file named by the
+``AUTH_JWT_BENCHMARK_OUTPUT`` environment variable, so that they can be
+compared between releases.
+"""
+
+import json
+import logging
+import os
+import platform
+import statistics
+import time
+
+import jwt
+
+from odoo import release, tests
+
+from odoo.addons.auth_jwt.tests.jwks_server import JwksServer
+
+_logger = logging.getLogger(__name__)
+
+BENCHMARK_REQUESTS = int(os.environ.get("AUTH_JWT_BENCHMARK_REQUESTS", 200))
+BENCHMARK_OUTPUT = os.environ.get("AUTH_JWT_BENCHMARK_OUTPUT")
+# Number of calls to measure each stage of the authentication in process.
+STAGE_ITERATIONS = 1000
+
+
+def _summarize(samples):
+    """Return latency percentiles of samples (seconds) in milliseconds."""
+    samples = sorted(samples)
+
+    def percentile(p):
+        return samples[round(p / 100 * (len(samples) - 1))] * 1000
+
+    return {
+        "p50": percentile(50),
+        "p90": percentile(90),
+        "p99": percentile(99),
+        "mean": statistics.fmean(samples) * 1000,
+        "max": samples[-1] * 1000,
+    }
+
+
+@tests.tagged("post_install", "-at_install", "-standard", "auth_jwt_benchmark")
+class TestBenchmark(tests.HttpCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.results = {}
+        cls.jwks_server = JwksServer()
+        cls.jwks_server.start()
+        cls.addClassCleanup(cls.jwks_server.stop)
+        cls.rsa_key = cls.jwks_server.add_rsa_key("rs256", algorithm="RS256")
+        cls.ec_key = cls.jwks_server.add_ec_key("es256", algorithm="ES256")
+        cls.partner = (
+            cls.env["res.users"].search([("email", "!=", False)], limit=1).partner_id
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._write_results()
+        super().tearDownClass()
+
+    @classmethod
+    def _write_results(cls):
+        results = {
+            "auth_jwt_version": cls.env.ref("base.module_auth_jwt").latest_version,
+            "odoo_version": release.version,
+            "python_version": platform.python_version(),
+            "timestamp": time.time(),
+            "requests_per_scenario": BENCHMARK_REQUESTS,
+            "scenarios": cls.results,
+        }
+        if BENCHMARK_OUTPUT:
+            with open(BENCHMARK_OUTPUT, "w") as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+        else:
+            _logger.info("auth_jwt benchmark results: %s", json.dumps(results))
+
+    def _get_validator(self, name):
+        return self.env["auth.jwt.validator"].search([("name", "=", name)])
+
+    def _use_public_key(self, validator, algorithm):
+        validator.write(
+            {
+                "public_key_algorithm": algorithm,
+                "public_key_jwk_uri": f"{self.jwks_server.uri}?{algorithm}",
+            }
+        )
+        validator._get_snapshot().jwks_cache.join(10)
+
+    def _get_token(self, validator, key=None, algorithm=None, kid=None):
+        payload = {
+            "aud": validator.audience,
+            "iss": validator.issuer,
+            "exp": time.time() + 3600,
+            "email": self.partner.email,
+        }
+        return jwt.encode(
+            payload,
+            key=key or validator.secret_key,
+            algorithm=algorithm or validator.secret_algorithm,
+            headers={"kid": kid} if kid else None,
+        )
+
+    def _measure(self, func):
+        samples = []
+        for _i in range(STAGE_ITERATIONS):
+            start = time.perf_counter()
+            func()
+            samples.append(time.perf_counter() - start)
+        return _summarize(samples)
+
+    def _measure_stages(self, validator, token, authorization=None, secret=None):
+        """Measure each stage of the authentication of token, in process."""
+        Validator = self.env["auth.jwt.validator"]
+        snapshot = validator._get_snapshot()
+        payload = validator._decode(token, secret=secret)
+        stages = {}
+        if authorization:
+            stages["header_parse"] = self._measure(
+                lambda: Validator._parse_bearer_authorization(authorization)
+            )
+        stages["validator_lookup"] = self._measure(
+            lambda: Validator.browse(
+                Validator._get_validator_id_by_name(snapshot.name)
+            )._get_snapshot()
+        )
+        if snapshot.jwks_cache is not None:
+            kid = jwt.get_unverified_header(token).get("kid")
+            stages["key_fetch"] = self._measure(lambda: validator._get_key(kid))
+        # includes the key fetch, if any
+        stages["signature_verify"] = self._measure(
+            lambda: validator._decode(token, secret=secret)
+        )
+        stages["partner_resolution"] = self._measure(
+            lambda: validator._get_partner_id(payload)
+        )
+        if snapshot.cookie_enabled:
+            cookie_secret = validator._get_jwt_cookie_secret()
+            stages["cookie_encode"] = self._measure(
+                lambda: validator._encode(
+                    payload, secret=cookie_secret, expire=snapshot.cookie_max_age
+                )
+            )
+        return stages
+
+    def _run_scenario(self, name, path, headers=None, stages=None):
+        """Measure the end-to-end latency and throughput of requests to path."""
+        for _i in range(max(1, BENCHMARK_REQUESTS // 10)):
+            self.url_open(path, headers=headers).raise_for_status()
+        samples = []
+        started = time.perf_counter()
+        for _i in range(BENCHMARK_REQUESTS):
+            start = time.perf_counter()
+            response = self.url_open(path, headers=headers)
+            samples.append(time.perf_counter() - start)
+            response.raise_for_status()
+        elapsed = time.perf_counter() - started
+        self.results[name] = {
+            "path": path,
+            "throughput_rps": BENCHMARK_REQUESTS / elapsed,
+            "latency_ms": _summarize(samples),
+            "stages_ms": stages or {},
+        }
+
+    def test_jwt_hs256(self):
+        validator = self._get_validator("demo")
+        token = self._get_token(validator)
+        authorization = "Bearer " + token
+        self._run_scenario(
+            "jwt_hs256",
+            "/auth_jwt_demo/whoami",
+            headers={"Authorization": authorization},
+            stages=self._measure_stages(validator, token, authorization),
+        )
+
+    def test_jwt_rs256(self):
+        validator = self._get_validator("demo_keycloak")
+        self._use_public_key(validator, "RS256")
+        token = self._get_token(validator, self.rsa_key, "RS256", "rs256")
+        authorization = "Bearer " + token
+        self._run_scenario(
+            "jwt_rs256",
+            "/auth_jwt_demo/keycloak/whoami",
+            headers={"Authorization": authorization},
+            stages=self._measure_stages(validator, token, authorization),
+        )
+
+    def test_jwt_es256(self):
+        validator = self._get_validator("demo_keycloak")
+        self._use_public_key(validator, "ES256")
+        token = self._get_token(validator, self.ec_key, "ES256", "es256")
+        authorization = "Bearer " + token
+        self._run_scenario(
+            "jwt_es256",
+            "/auth_jwt_demo/keycloak/whoami",
+            headers={"Authorization": authorization},
+            stages=self._measure_stages(validator, token, authorization),
+        )
+
+    def test_public_or_jwt_anonymous(self):
+        self._run_scenario(
+            "public_or_jwt_anonymous", "/auth_jwt_demo/whoami-public-or-jwt"
+        )
+
+    def test_public_or_jwt_hs256(self):
+        validator = self._get_validator("demo")
+        token = self._get_token(validator)
+        authorization = "Bearer " + token
+        self._run_scenario(
+            "public_or_jwt_hs256",
+            "/auth_jwt_demo/whoami-public-or-jwt",
+            headers={"Authorization": authorization},
+            stages=self._measure_stages(validator, token, authorization),
+        )
+
+    def test_cookie_hs256(self):
+        validator = self._get_validator("demo_cookie")
+        token = self._get_token(validator)
+        response = self.url_open(
+            "/auth_jwt_demo_cookie/whoami", headers={"Authorization": "Bearer " + token}
+        )
+        response.raise_for_status()
+        cookie = response.cookies.get("demo_auth")
+        self.assertTrue(cookie)
+        self._run_scenario(
+            "cookie_hs256",
+            "/auth_jwt_demo_cookie/whoami",
+            headers={"Cookie": f"demo_auth={cookie}"},
+            stages=self._measure_stages(
+                validator, cookie, secret=validator._get_jwt_cookie_secret()
+            ),
+        )
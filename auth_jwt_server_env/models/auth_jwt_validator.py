@@ -13,6 +13,12 @@ class AuthJwtValidator(models.Model):
     def _server_env_fields(self):
         env_fields = super()._server_env_fields
         env_fields.update(
-            {"secret_key": {}, "audience": {}, "issuer": {}, "public_key_jwk_uri": {}}
+            {
+                "secret_key": {},
+                "secret_key_ring": {},
+                "audience": {},
+                "issuer": {},
+                "public_key_jwk_uri": {},
+            }
         )
         return env_fields
@@ -21,6 +21,7 @@
     "website": "https://github.com/OCA/server-auth",
     "license": "LGPL-3",
     "data": [
+        "data/ir_cron.xml",
         "views/res_config_settings_views.xml",
         "security/ir.model.access.csv",
         "security/res_users_pass_history.xml",
@@ -2,7 +2,16 @@
 # Copyright 2017 Kaushal Prajapati <kbprajapati@live.com>.
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl.html).
 
-from odoo import fields, models
+from odoo import fields, models, tools
+
+from ..policy import PasswordPolicy
+
+POLICY_FIELDS = {
+    "password_lower",
+    "password_upper",
+    "password_numeric",
+    "password_special",
+}
 
 
 class ResCompany(models.Model):
@@ -44,3 +53,23 @@ class ResCompany(models.Model):
         default=24,
         help="Amount of hours until a user may change password again",
     )
+
+    @tools.ormcache("self.id")
+    def _get_password_policy(self):
+        """Return the PasswordPolicy of the company, compiled once."""
+        self.ensure_one()
+        params = self.env["ir.config_parameter"].sudo()
+        minlength = params.get_param("auth_password_policy.minlength", default=0)
+        return PasswordPolicy(
+            minlength=int(minlength),
+            lower=self.password_lower,
+            upper=self.password_upper,
+            numeric=self.password_numeric,
+            special=self.password_special,
+        )
+
+    def write(self, vals):
+        res = super().write(vals)
+        if POLICY_FIELDS.intersection(vals):
+            self._get_password_policy.clear_cache(self)
+        return res
@@ -3,23 +3,135 @@
 # Copyright 2018 Modoolar <info@modoolar.com>.
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl.html).
 
-import re
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime, timedelta
 
+from psycopg2.extras import execute_values
+
 from odoo import _, api, fields, models
-from odoo.exceptions import UserError, ValidationError
+from odoo.exceptions import UserError
+
+from odoo.addons.auth_signup.models.res_partner import random_token
+
+from ..policy import PasswordPolicyError
+
+_logger = logging.getLogger(__name__)
+
+EXECUTOR_MAX_WORKERS = 4
+# Number of users whose password is expired at once by _expire_passwords()
+EXPIRY_BATCH_SIZE = 500
+DEFAULT_EXPIRY_WARNING_DAYS = 7
+# Expiry date of the passwords without write date
+EXPIRED_DATE = datetime(1970, 1, 1)
+
+_executor = None
+_executor_lock = threading.Lock()
 
 
 def delta_now(**kwargs):
     return datetime.now() + timedelta(**kwargs)
 
 
+def _get_executor():
+    """Return the worker wide thread pool used to verify password hashes
+    concurrently."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=EXECUTOR_MAX_WORKERS,
+                thread_name_prefix="password_security",
+            )
+        return _executor
+
+
+def _verify_any(crypt, password, password_crypts):
+    """Return whether password matches one of password_crypts.
+
+    The hashes are verified concurrently, as the key derivation functions
+    release the GIL, and the verifications not started yet are cancelled
+    at the first match.
+    """
+    if len(password_crypts) <= 1:
+        return any(crypt.verify(password, h) for h in password_crypts)
+    futures = {
+        _get_executor().submit(crypt.verify, password, password_crypt)
+        for password_crypt in password_crypts
+    }
+    try:
+        while futures:
+            done, futures = wait(futures, return_when=FIRST_COMPLETED)
+            if any(future.result() for future in done):
+                return True
+        return False
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def _write_reset_tokens(partners, expiration):
+    """Prepare password reset tokens for partners, like signup_prepare()
+    does, with a single query.
+
+    The access rights and rules of the partners are checked first, as the
+    signup fields are written without the ORM.
+    """
+    if not partners:
+        return
+    partners.check_access_rights("write")
+    partners.check_access_rule("write")
+    tokens = {}
+    while len(tokens) < len(partners):
+        missing = partners.filtered(lambda partner: partner.id not in tokens)
+        new_tokens = {partner.id: random_token() for partner in missing}
+        # tokens must be unique, collisions are unlikely but checked
+        partners.env.cr.execute(
+            "SELECT signup_token FROM res_partner WHERE signup_token IN %s",
+            (tuple(new_tokens.values()),),
+        )
+        used_tokens = {row[0] for row in partners.env.cr.fetchall()}
+        used_tokens.update(tokens.values())
+        for partner_id, token in new_tokens.items():
+            if token not in used_tokens:
+                tokens[partner_id] = token
+                used_tokens.add(token)
+    partners.flush_recordset(["signup_token", "signup_type", "signup_expiration"])
+    execute_values(
+        partners.env.cr._obj,
+        """
+        UPDATE res_partner AS partner
+        SET signup_token = token.token,
+            signup_type = 'reset',
+            signup_expiration = token.expiration
+        FROM (VALUES %s) AS token(id, token, expiration)
+        WHERE partner.id = token.id
+        """,
+        [(partner_id, token, expiration) for partner_id, token in tokens.items()],
+        template="(%s, %s, %s::timestamp)",
+    )
+    partners.invalidate_recordset(["signup_token", "signup_type", "signup_expiration"])
+
+
 class ResUsers(models.Model):
     _inherit = "res.users"
 
     password_write_date = fields.Datetime(
         "Last password update", default=fields.Datetime.now, readonly=True
     )
+    password_expiry_date = fields.Datetime(
+        compute="_compute_password_expiry_date",
+        store=True,
+        index=True,
+        help="The password expires at this date, never if empty.",
+    )
+    password_expiring_soon = fields.Boolean(
+        readonly=True,
+        help="The password expires soon, or has expired. This flag is updated "
+        "daily by a scheduled action.",
+    )
     password_history_ids = fields.One2many(
         string="Password History",
         comodel_name="res.users.pass.history",
@@ -30,6 +142,7 @@ class ResUsers(models.Model):
     def write(self, vals):
         if vals.get("password"):
             vals["password_write_date"] = fields.Datetime.now()
+            vals["password_expiring_soon"] = False
         return super(ResUsers, self).write(vals)
 
     @api.model
@@ -58,36 +171,31 @@ class ResUsers(models.Model):
 
     def password_match_message(self):
         self.ensure_one()
-        company_id = self.company_id
+        policy = self.company_id._get_password_policy()
         message = []
-        if company_id.password_lower:
+        if policy.lower:
             message.append(
-                _("\n* Lowercase letter (at least %s characters)")
-                % str(company_id.password_lower)
+                _("\n* Lowercase letter (at least %s characters)") % str(policy.lower)
             )
-        if company_id.password_upper:
+        if policy.upper:
             message.append(
-                _("\n* Uppercase letter (at least %s characters)")
-                % str(company_id.password_upper)
+                _("\n* Uppercase letter (at least %s characters)") % str(policy.upper)
             )
-        if company_id.password_numeric:
+        if policy.numeric:
             message.append(
-                _("\n* Numeric digit (at least %s characters)")
-                % str(company_id.password_numeric)
+                _("\n* Numeric digit (at least %s characters)") % str(policy.numeric)
             )
-        if company_id.password_special:
+        if policy.special:
             message.append(
                 _("\n* Special character (at least %s characters)")
-                % str(company_id.password_special)
+                % str(policy.special)
             )
         if message:
             message = [_("Must contain the following:")] + message
 
-        params = self.env["ir.config_parameter"].sudo()
-        minlength = params.get_param("auth_password_policy.minlength", default=0)
-        if minlength:
+        if policy.minlength:
             message = [
-                _("Password must be %d characters or more.") % int(minlength)
+                _("Password must be %d characters or more.") % policy.minlength
             ] + message
         return "\r".join(message)
 
@@ -97,35 +205,67 @@ class ResUsers(models.Model):
         return True
 
     def _check_password_rules(self, password):
+        """Check password against the password policy of the company of the
+        user.
+
+        :raises: PasswordPolicyError, with the failed rules
+        """
         self.ensure_one()
         if not password:
             return True
-        company_id = self.company_id
-        params = self.env["ir.config_parameter"].sudo()
-        minlength = params.get_param("auth_password_policy.minlength", default=0)
-        password_regex = [
-            "^",
-            "(?=.*?[a-z]){" + str(company_id.password_lower) + ",}",
-            "(?=.*?[A-Z]){" + str(company_id.password_upper) + ",}",
-            "(?=.*?\\d){" + str(company_id.password_numeric) + ",}",
-            r"(?=.*?[\W_]){" + str(company_id.password_special) + ",}",
-            ".{%d,}$" % int(minlength),
-        ]
-        if not re.search("".join(password_regex), password):
-            raise ValidationError(self.password_match_message())
-
+        failures = self._get_password_rule_failures(password)
+        if failures:
+            raise PasswordPolicyError(self.password_match_message(), failures)
         return True
 
-    def _password_has_expired(self):
+    def _get_password_rule_failures(self, password):
+        """Return the list of the PasswordRuleFailure of password for the
+        password policy of the company of the user."""
         self.ensure_one()
-        if not self.password_write_date:
-            return True
+        return self.company_id._get_password_policy().check(password)
 
-        if not self.company_id.password_expiration:
-            return False
+    @api.depends("password_write_date", "company_id.password_expiration")
+    def _compute_password_expiry_date(self):
+        for user in self:
+            expiration = user.company_id.password_expiration
+            if not user.password_write_date:
+                user.password_expiry_date = EXPIRED_DATE
+            elif not expiration:
+                user.password_expiry_date = False
+            else:
+                user.password_expiry_date = user.password_write_date + timedelta(
+                    days=expiration + 1
+                )
 
-        days = (fields.Datetime.now() - self.password_write_date).days
-        return days > self.company_id.password_expiration
+    def _password_has_expired(self):
+        self.ensure_one()
+        expiry_date = self.password_expiry_date
+        return bool(expiry_date) and expiry_date <= fields.Datetime.now()
+
+    @api.model
+    def _cron_flag_expiring_passwords(self):
+        """Flag the users whose password expires within the number of days
+        of the password_security.expiry_warning_days system parameter, with a
+        single query updating only the users whose flag changes."""
+        params = self.env["ir.config_parameter"].sudo()
+        days = int(
+            params.get_param(
+                "password_security.expiry_warning_days", DEFAULT_EXPIRY_WARNING_DAYS
+            )
+        )
+        self.flush_model(["password_expiry_date", "password_expiring_soon"])
+        self.env.cr.execute(
+            """
+            UPDATE res_users
+            SET password_expiring_soon =
+                COALESCE(password_expiry_date <= %(date)s, FALSE)
+            WHERE COALESCE(password_expiring_soon, FALSE)
+                != COALESCE(password_expiry_date <= %(date)s, FALSE)
+            """,
+            {"date": fields.Datetime.now() + timedelta(days=days)},
+        )
+        _logger.info("Password expiry flag changed for %d users", self.env.cr.rowcount)
+        self.invalidate_model(["password_expiring_soon"])
 
     def action_expire_password(self):
         expiration = delta_now(days=+1)
@@ -134,6 +274,89 @@ class ResUsers(models.Model):
                 signup_type="reset", expiration=expiration
             )
 
+    @api.model
+    def _get_expired_user_ids(self, limit=None, after_id=0):
+        """Return the ids of the active users whose password has expired and
+        who have no pending password reset, in ascending order, with a single
+        query on the index of the expiry dates."""
+        self.flush_model(["active", "partner_id", "password_expiry_date"])
+        self.env["res.partner"].flush_model(
+            ["signup_token", "signup_type", "signup_expiration"]
+        )
+        now = fields.Datetime.now()
+        self.env.cr.execute(
+            """
+            SELECT users.id
+            FROM res_users AS users
+            JOIN res_partner AS partner ON partner.id = users.partner_id
+            WHERE users.active
+            AND users.id > %(after_id)s
+            AND users.password_expiry_date <= %(now)s
+            AND NOT (
+                partner.signup_token IS NOT NULL
+                AND partner.signup_type = 'reset'
+                AND partner.signup_expiration > %(now)s
+            )
+            ORDER BY users.id
+            LIMIT %(limit)s
+            """,
+            {"after_id": after_id, "now": now, "limit": limit},
+        )
+        return [row[0] for row in self.env.cr.fetchall()]
+
+    @api.model
+    def _expire_passwords(self, batch_size=EXPIRY_BATCH_SIZE, auto_commit=False):
+        """Expire the passwords of all the users whose password has expired:
+        prepare their reset tokens and queue their reset emails, by batches
+        of batch_size users.
+
+        With auto_commit, each batch is committed, so that the operation can
+        be interrupted and resumed: users with a pending reset are skipped.
+        Return the number of users whose password was expired.
+        """
+        expiration = delta_now(days=+1)
+        total = 0
+        last_id = 0
+        while True:
+            user_ids = self._get_expired_user_ids(limit=batch_size, after_id=last_id)
+            if not user_ids:
+                break
+            users = self.browse(user_ids)
+            _write_reset_tokens(users.mapped("partner_id"), expiration)
+            users._queue_reset_password_mails()
+            total += len(users)
+            last_id = user_ids[-1]
+            _logger.info("Passwords of %d users expired", total)
+            if auto_commit:
+                self.env.cr.commit()  # pylint: disable=invalid-commit
+        return total
+
+    @api.model
+    def _cron_expire_passwords(self):
+        testing = getattr(threading.current_thread(), "testing", False)
+        return self._expire_passwords(auto_commit=not testing)
+
+    def _queue_reset_password_mails(self):
+        """Queue the password reset emails of the users in the mail queue,
+        instead of sending them immediately like action_reset_password()."""
+        template = self.env.ref(
+            "auth_signup.reset_password_email", raise_if_not_found=False
+        )
+        if not template:
+            return
+        email_values = {
+            "email_cc": False,
+            "auto_delete": True,
+            "message_type": "user_notification",
+            "recipient_ids": [],
+            "partner_ids": [],
+            "scheduled_date": False,
+        }
+        for user in self.filtered("email"):
+            template.with_context(lang=user.lang).send_mail(
+                user.id, force_send=False, email_values=email_values
+            )
+
     def _validate_pass_reset(self):
         """It provides validations before initiating a pass reset email
         :raises: UserError on invalidated pass reset attempt
@@ -161,21 +384,37 @@ class ResUsers(models.Model):
         """
         crypt = self._crypt_context()
         for user in self:
-            password_history = user.company_id.password_history
-            if not password_history:  # disabled
-                recent_passes = self.env["res.users.pass.history"]
-            elif password_history < 0:  # unlimited
-                recent_passes = user.password_history_ids
-            else:
-                recent_passes = user.password_history_ids[:password_history]
-            if recent_passes.filtered(
-                lambda r: crypt.verify(password, r.password_crypt)
-            ):
+            password_crypts = user._get_password_history_crypts()
+            start = time.perf_counter()
+            reused = _verify_any(crypt, password, password_crypts)
+            _logger.info(
+                "Password history of user %s checked against %d passwords in %.3fs",
+                user.id,
+                len(password_crypts),
+                time.perf_counter() - start,
+            )
+            if reused:
                 raise UserError(
                     _("Cannot use the most recent %d passwords")
                     % user.company_id.password_history
                 )
 
+    def _get_password_history_crypts(self):
+        """Return the hashes of the passwords of the history of the user to
+        check new passwords against, most recent first."""
+        self.ensure_one()
+        password_history = self.company_id.password_history
+        if not password_history:  # disabled
+            return []
+        History = self.env["res.users.pass.history"]
+        if password_history > 0:
+            limit = password_history
+        else:  # infinite
+            limit = History._get_history_limit()
+        return History.search([("user_id", "=", self.id)], limit=limit).mapped(
+            "password_crypt"
+        )
+
     def _set_encrypted_password(self, uid, pw):
         """It saves password crypt history for history rules"""
         res = super(ResUsers, self)._set_encrypted_password(uid, pw)
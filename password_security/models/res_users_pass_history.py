@@ -1,7 +1,14 @@
 # Copyright 2016 LasLabs Inc.
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl.html).
 
-from odoo import fields, models
+import logging
+
+from odoo import api, fields, models
+
+_logger = logging.getLogger(__name__)
+
+# Number of passwords retained per user when the history is unlimited
+DEFAULT_HISTORY_LIMIT = 100
 
 
 class ResUsersPassHistory(models.Model):
@@ -23,3 +30,41 @@ class ResUsersPassHistory(models.Model):
         default=lambda s: fields.Datetime.now(),
         index=True,
     )
+
+    @api.model
+    def _get_history_limit(self):
+        """Return the maximum number of passwords retained per user, set by
+        the password_security.history_limit system parameter."""
+        params = self.env["ir.config_parameter"].sudo()
+        return int(
+            params.get_param("password_security.history_limit", DEFAULT_HISTORY_LIMIT)
+        )
+
+    @api.model
+    def _cron_prune(self):
+        """Delete the passwords beyond the history of the company of their
+        user, or beyond the history limit when the history is infinite."""
+        self.flush_model()
+        self.env.cr.execute(
+            """
+            DELETE FROM res_users_pass_history
+            WHERE id IN (
+                SELECT id FROM (
+                    SELECT history.id, company.password_history,
+                        row_number() OVER (
+                            PARTITION BY history.user_id
+                            ORDER BY history.date DESC, history.id DESC
+                        ) AS rank
+                    FROM res_users_pass_history AS history
+                    JOIN res_users AS users ON users.id = history.user_id
+                    JOIN res_company AS company ON company.id = users.company_id
+                ) AS ranked
+                WHERE rank > CASE
+                    WHEN password_history > 0 THEN password_history
+                    ELSE %(limit)s END
+            )
+            """,
+            {"limit": self._get_history_limit()},
+        )
+        _logger.info("%s passwords pruned from the history", self.env.cr.rowcount)
+        self.invalidate_model()
@@ -0,0 +1,81 @@
+# Copyright 2015 LasLabs Inc.
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl.html).
+
+import string
+from collections import namedtuple
+
+from odoo.exceptions import ValidationError
+
+PasswordRuleFailure = namedtuple("PasswordRuleFailure", "rule required actual")
+
+_LOWER = frozenset(string.ascii_lowercase)
+_UPPER = frozenset(string.ascii_uppercase)
+
+
+class PasswordPolicyError(ValidationError):
+    """A password does not comply with the password policy.
+
+    failures is the list of the PasswordRuleFailure of the password.
+    """
+
+    def __init__(self, message, failures):
+        super().__init__(message)
+        self.failures = failures
+
+
+class PasswordPolicy:
+    """Password rules of a company, checked in a single pass over the
+    password.
+
+    Rules are minimum counts: ``minlength`` characters, ``lower`` ASCII
+    lowercase letters, ``upper`` ASCII uppercase letters, ``numeric`` digits
+    and ``special`` special characters (neither letters nor digits, or
+    underscore).
+    """
+
+    __slots__ = ("minlength", "lower", "upper", "numeric", "special")
+
+    RULES = ("minlength", "lower", "upper", "numeric", "special")
+
+    def __init__(self, minlength=0, lower=0, upper=0, numeric=0, special=0):
+        self.minlength = minlength
+        self.lower = lower
+        self.upper = upper
+        self.numeric = numeric
+        self.special = special
+
+    def __repr__(self):
+        return "PasswordPolicy({})".format(
+            ", ".join(f"{rule}={getattr(self, rule)}" for rule in self.RULES)
+        )
+
+    def count(self, password):
+        """Return the counts of password for each rule, as a dict."""
+        lower = upper = numeric = special = 0
+        for char in password:
+            if char in _LOWER:
+                lower += 1
+            elif char in _UPPER:
+                upper += 1
+            elif char.isdecimal():
+                numeric += 1
+            elif char == "_" or not char.isalnum():
+                special += 1
+        return {
+            "minlength": len(password),
+            "lower": lower,
+            "upper": upper,
+            "numeric": numeric,
+            "special": special,
+        }
+
+    def check(self, password):
+        """Return the list of the PasswordRuleFailure of password, empty when
+        password complies with the policy."""
+        counts = self.count(password)
+        failures = []
+        for rule in self.RULES:
+            required = getattr(self, rule)
+            if counts[rule] < required:
+                failures.append(PasswordRuleFailure(rule, required, counts[rule]))
+        return failures
@@ -5,3 +5,4 @@ from . import test_password_history
 from . import test_reset_password
 from . import test_signup
 from . import test_migration
+from . import test_password_policy
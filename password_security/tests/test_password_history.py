@@ -45,3 +45,59 @@ class TestPasswordHistory(TransactionCase):
         user.company_id.password_history = -1
         with self.assertRaises(UserError):
             user.write({"password": "admin"})
+
+    def _set_history_policy(self, user, password_history):
+        self.env["ir.config_parameter"].sudo().set_param(
+            "auth_password_policy.minlength", 0
+        )
+        user.company_id.update(
+            {
+                "password_lower": 0,
+                "password_history": password_history,
+                "password_numeric": 0,
+                "password_special": 0,
+                "password_upper": 0,
+            }
+        )
+
+    def test_history_limit(self):
+        user = self.env.ref("base.user_admin")
+        self._set_history_policy(user, -1)
+        self.env["ir.config_parameter"].sudo().set_param(
+            "password_security.history_limit", 2
+        )
+        for password in ("first", "second", "third"):
+            user.write({"password": password})
+        self.assertEqual(len(user._get_password_history_crypts()), 2)
+        # the first password is beyond the limit
+        user.write({"password": "first"})
+        for password in ("first", "third"):
+            with self.assertRaises(UserError):
+                user.write({"password": password})
+
+    def test_history_limit_finite(self):
+        user = self.env.ref("base.user_admin")
+        # the limit only applies to infinite histories
+        self._set_history_policy(user, 3)
+        self.env["ir.config_parameter"].sudo().set_param(
+            "password_security.history_limit", 2
+        )
+        for password in ("first", "second", "third"):
+            user.write({"password": password})
+        self.assertEqual(len(user._get_password_history_crypts()), 3)
+        with self.assertRaises(UserError):
+            user.write({"password": "first"})
+        self.env["res.users.pass.history"]._cron_prune()
+        self.assertEqual(len(user.password_history_ids), 3)
+
+    def test_cron_prune(self):
+        user = self.env.ref("base.user_admin")
+        self._set_history_policy(user, 2)
+        for password in ("first", "second", "third", "fourth"):
+            user.write({"password": password})
+        self.assertEqual(len(user.password_history_ids), 4)
+        self.env["res.users.pass.history"]._cron_prune()
+        self.assertEqual(len(user.password_history_ids), 2)
+        self.assertEqual(
+            user.password_history_ids, user.password_history_ids.sorted("id")[-2:]
+        )
@@ -0,0 +1,112 @@
+# Copyright 2015 LasLabs Inc.
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl.html).
+
+import logging
+import re
+import time
+
+from odoo.tests.common import TransactionCase, tagged
+
+from ..policy import PasswordPolicy, PasswordPolicyError, PasswordRuleFailure
+
+_logger = logging.getLogger(__name__)
+
+
+class TestPasswordPolicy(TransactionCase):
+    def setUp(self):
+        super().setUp()
+        self.main_comp = self.env.ref("base.main_company")
+        self.main_comp.write(
+            {
+                "password_lower": 2,
+                "password_upper": 2,
+                "password_numeric": 2,
+                "password_special": 2,
+            }
+        )
+        self.env["ir.config_parameter"].set_param("auth_password_policy.minlength", 10)
+        self.user = self.env.ref("base.user_demo")
+        self.user.company_id = self.main_comp
+
+    def test_counts(self):
+        policy = PasswordPolicy(minlength=4, lower=1, upper=1, numeric=1, special=2)
+        self.assertEqual(
+            policy.count("aB3__é!!"),
+            {"minlength": 8, "lower": 1, "upper": 1, "numeric": 1, "special": 4},
+        )
+        self.assertEqual(policy.check("aB3_!"), [])
+        # special characters are counted like the other classes
+        self.assertEqual(policy.check("aB3!!"), [])
+        self.assertEqual(
+            policy.check("ab"),
+            [
+                PasswordRuleFailure("minlength", 4, 2),
+                PasswordRuleFailure("upper", 1, 0),
+                PasswordRuleFailure("numeric", 1, 0),
+                PasswordRuleFailure("special", 2, 0),
+            ],
+        )
+
+    def test_counts_above_one(self):
+        self.assertTrue(self.user._check_password_rules("abCD12$%xyz"))
+        failures = self.user._get_password_rule_failures("abCd12$%xyz")
+        self.assertEqual(failures, [PasswordRuleFailure("upper", 2, 1)])
+        with self.assertRaises(PasswordPolicyError) as error:
+            self.user._check_password_rules("abCd12$%xyz")
+        self.assertEqual(error.exception.failures, failures)
+
+    def test_policy_cache(self):
+        policy = self.main_comp._get_password_policy()
+        self.assertIs(self.main_comp._get_password_policy(), policy)
+        self.assertEqual(policy.minlength, 10)
+        self.main_comp.password_upper = 1
+        self.assertEqual(self.main_comp._get_password_policy().upper, 1)
+        self.env["ir.config_parameter"].set_param("auth_password_policy.minlength", 4)
+        self.assertEqual(self.main_comp._get_password_policy().minlength, 4)
+
+
+@tagged("-standard", "password_security_benchmark")
+class TestPasswordPolicyBenchmark(TransactionCase):
+    """Compare the compiled policy with the lookahead regular expression it
+    replaces, on long adversarial passwords.
+
+    Run with ``--test-tags password_security_benchmark``.
+    """
+
+    def _legacy_regex(self, policy):
+        return "".join(
+            [
+                "^",
+                "(?=.*?[a-z]){" + str(policy.lower) + ",}",
+                "(?=.*?[A-Z]){" + str(policy.upper) + ",}",
+                "(?=.*?\\d){" + str(policy.numeric) + ",}",
+                r"(?=.*?[\W_]){" + str(policy.special) + ",}",
+                ".{%d,}$" % policy.minlength,
+            ]
+        )
+
+    def test_benchmark(self):
+        policy = PasswordPolicy(minlength=12, lower=1, upper=1, numeric=1, special=1)
+        regex = self._legacy_regex(policy)
+        passwords = {
+            "no special": "aA1" * 30000,
+            "special last": "aA1" * 30000 + "$",
+            "newline": "aA1$" * 30000 + "\n" + "x",
+            "lowercase": "a" * 100000,
+        }
+        for name, password in passwords.items():
+            start = time.perf_counter()
+            re.search(regex, password)
+            legacy = time.perf_counter() - start
+            start = time.perf_counter()
+            policy.check(password)
+            compiled = time.perf_counter() - start
+            _logger.info(
+                "%s (%d chars): regex %.2fms, compiled policy %.2fms",
+                name,
+                len(password),
+                legacy * 1e3,
+                compiled * 1e3,
+            )
+            # a single pass, whatever the password
+            self.assertLess(compiled, 1)
@@ -2,10 +2,14 @@
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl.html).
 
 import time
+from datetime import timedelta
 
-from odoo.exceptions import UserError
+from odoo import fields
+from odoo.exceptions import AccessError, UserError
 from odoo.tests.common import TransactionCase
 
+from ..models.res_users import _write_reset_tokens, delta_now
+
 
 class TestResUsers(TransactionCase):
     def setUp(self):
@@ -164,3 +168,64 @@ class TestResUsers(TransactionCase):
             }
         )
         test1.unlink()
+
+    def test_expire_passwords(self):
+        rec_id = self._new_record()
+        rec_id.write({"password_write_date": "1970-01-01 00:00:00"})
+        self.assertIn(rec_id.id, self.model_obj._get_expired_user_ids())
+        mails = self.env["mail.mail"].search([])
+        self.assertGreaterEqual(self.model_obj._expire_passwords(batch_size=1), 1)
+        self.assertTrue(rec_id.partner_id.signup_token)
+        self.assertEqual(rec_id.partner_id.signup_type, "reset")
+        new_mails = self.env["mail.mail"].search([]) - mails
+        self.assertTrue(new_mails)
+        self.assertEqual(set(new_mails.mapped("state")), {"outgoing"})
+        # users with a pending reset are skipped
+        self.assertNotIn(rec_id.id, self.model_obj._get_expired_user_ids())
+
+    def test_expire_password_unique_tokens(self):
+        rec_id = self._new_record()
+        users = rec_id + self.env.ref("base.user_demo")
+        users.action_expire_password()
+        tokens = users.mapped("partner_id.signup_token")
+        self.assertEqual(len(set(tokens)), 2)
+
+    def test_write_reset_tokens(self):
+        rec_id = self._new_record()
+        partners = (rec_id + self.env.ref("base.user_demo")).mapped("partner_id")
+        _write_reset_tokens(partners, delta_now(days=+1))
+        self.assertEqual(set(partners.mapped("signup_type")), {"reset"})
+        self.assertEqual(len(set(partners.mapped("signup_token"))), 2)
+        # the signup fields are written without the ORM, but not without
+        # the access rights of the partners
+        public_user = self.env.ref("base.public_user")
+        with self.assertRaises(AccessError):
+            _write_reset_tokens(partners.with_user(public_user), delta_now(days=+1))
+
+    def test_password_expiry_date(self):
+        rec_id = self._new_record()
+        rec_id.write({"password_write_date": "2020-01-01 00:00:00"})
+        self.main_comp.password_expiration = 10
+        self.assertEqual(
+            fields.Datetime.to_string(rec_id.password_expiry_date),
+            "2020-01-12 00:00:00",
+        )
+        self.main_comp.password_expiration = 0
+        self.assertFalse(rec_id.password_expiry_date)
+        self.assertFalse(rec_id._password_has_expired())
+
+    def test_flag_expiring_passwords(self):
+        rec_id = self._new_record()
+        self.main_comp.password_expiration = 10
+        self.env["ir.config_parameter"].set_param(
+            "password_security.expiry_warning_days", 3
+        )
+        self.model_obj._cron_flag_expiring_passwords()
+        self.assertFalse(rec_id.password_expiring_soon)
+        rec_id.write({"password_write_date": fields.Datetime.now() - timedelta(days=9)})
+        self.model_obj._cron_flag_expiring_passwords()
+        self.assertTrue(rec_id.password_expiring_soon)
+        self.assertFalse(rec_id._password_has_expired())
+        # changing the password resets the flag
+        rec_id.write({"password": "asdQWE123$%^4"})
+        self.assertFalse(rec_id.password_expiring_soon)